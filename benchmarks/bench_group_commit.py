@@ -0,0 +1,99 @@
+"""Throughput of concurrent rejection appends with and without group commit.
+
+Run from the repository root:
+
+    python benchmarks/bench_group_commit.py --writers 50 --records 40
+
+Each writer appends single records the way the Data Entry page does. The
+"per-call" mode takes the lock, writes and fsyncs once per record; the
+"group" mode goes through DataManager.add_rejection, which coalesces
+concurrent calls. The benchmark runs in a temporary data directory.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.data_manager import DataManager  # noqa: E402
+
+
+def make_record(writer_id, i):
+    return {
+        'module': f"M{writer_id % 5}",
+        'rejection_type': 'Surface Defect',
+        'quantity': 1 + i % 7,
+        'reason': f"burr near weld, writer {writer_id}",
+        'operator': f"op{writer_id}",
+        'shift': 'Day'
+    }
+
+
+def write_per_call(storage, writer_id, records, barrier):
+    data_manager = DataManager(storage=storage)
+    now = time.strftime('%Y-%m-%d %H:%M:%S')
+    barrier.wait()
+    for i in range(records):
+        record = data_manager._normalize_rejection(make_record(writer_id, i), now)
+        data_manager._commit_batches([([record], [None])])
+
+
+def write_grouped(storage, writer_id, records, barrier):
+    data_manager = DataManager(storage=storage)
+    barrier.wait()
+    for i in range(records):
+        success, message = data_manager.add_rejection(**make_record(writer_id, i))
+        if not success:
+            raise RuntimeError(message)
+
+
+def run(mode, storage, writers, records, use_processes):
+    target = write_per_call if mode == "per-call" else write_grouped
+    if use_processes:
+        barrier = multiprocessing.Barrier(writers + 1)
+        workers = [multiprocessing.Process(target=target, args=(storage, w, records, barrier)) for w in range(writers)]
+    else:
+        barrier = threading.Barrier(writers + 1)
+        workers = [threading.Thread(target=target, args=(storage, w, records, barrier)) for w in range(writers)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    total = len(DataManager(storage=storage).load_rejections())
+    return elapsed, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=50)
+    parser.add_argument("--records", type=int, default=40, help="Records per writer")
+    parser.add_argument("--storage", default="csv", choices=["csv", "parquet", "sqlite"])
+    parser.add_argument("--processes", action="store_true", help="Use processes instead of threads")
+    args = parser.parse_args()
+
+    expected = args.writers * args.records
+    for mode in ("per-call", "group"):
+        workdir = tempfile.mkdtemp(prefix="qrms-bench-")
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            elapsed, total = run(mode, args.storage, args.writers, args.records, args.processes)
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(workdir, ignore_errors=True)
+        status = "ok" if total == expected else f"MISMATCH ({total} rows)"
+        print(f"{mode:>8}: {expected} records from {args.writers} writers in {elapsed:.3f}s "
+              f"= {expected / elapsed:,.0f} records/s [{status}]")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import streamlit as st
 from utils.auth import get_auth_manager
+from utils.warmup import start_warmup
 
 def main():
     st.set_page_config(
@@ -10,6 +11,9 @@ def main():
     
     auth_manager = get_auth_manager()
     
+    # Preload data on a background thread while the user logs in
+    start_warmup()
+    
     # Check if already authenticated
     if auth_manager.is_authenticated():
         st.success("✅ You are already logged in!")
@@ -2,9 +2,12 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from datetime import datetime, timedelta
 from utils.data_manager import DataManager
+from utils.shards import ShardSet, PLANT_COLUMNS
+from utils.rejection_csv import REJECTION_COLUMNS
+from utils.export import spool_export, available_formats, EXPORT_FORMATS
 from utils.scheduler import start_scheduler
+from utils.warmup import start_warmup, wait_for_warmup, default_dashboard_range, dashboard_filters, dashboard_aggregations
 from utils.auth import get_auth_manager
 
 # Page configuration
@@ -138,6 +141,10 @@ if not auth_manager.is_authenticated():
 # Start scheduler for automated reports
 start_scheduler()
 
+# Normally already started by the login page; finishing it beats repeating its work
+start_warmup()
+wait_for_warmup(timeout=60)
+
 def init_data_manager():
     """Initialize data manager"""
     return DataManager()
@@ -145,6 +152,9 @@ def init_data_manager():
 # Initialize data manager
 data_manager = init_data_manager()
 
+# Plants configured with QRMS_SHARDS, each with its own data directory
+shard_set = ShardSet()
+
 # Show user info in sidebar
 auth_manager.show_user_info()
 
@@ -159,75 +169,88 @@ st.markdown("""
 # Sidebar filters
 st.sidebar.header("📊 Dashboard Filters")
 
+# Plant filter; a single plant is read directly, all plants through the consolidated view
+selected_plant = None
+if shard_set.names:
+    selected_plant = st.sidebar.selectbox("Select Plant", ['All Plants'] + shard_set.names)
+    if selected_plant != 'All Plants':
+        data_manager = shard_set.data_manager(selected_plant)
+corporate_view = selected_plant == 'All Plants'
+source = shard_set if corporate_view else data_manager
+
 # Date range filter
+default_start, default_end = default_dashboard_range()
 col1, col2 = st.sidebar.columns(2)
 with col1:
     start_date = st.date_input(
         "Start Date",
-        value=datetime.now() - timedelta(days=30),
+        value=default_start,
         key="start_date"
     )
 with col2:
     end_date = st.date_input(
         "End Date",
-        value=datetime.now(),
+        value=default_end,
         key="end_date"
     )
 
-# Load data
-rejections_df = data_manager.load_rejections()
-modules_df = data_manager.load_modules()
-types_df = data_manager.load_rejection_types()
-
-# Filter data by date range
-if not rejections_df.empty:
-    rejections_df['date'] = pd.to_datetime(rejections_df['date'])
-    filtered_df = rejections_df[
-        (rejections_df['date'] >= pd.to_datetime(start_date)) &
-        (rejections_df['date'] <= pd.to_datetime(end_date))
-    ]
+# Cached catalog snapshot; name lists are kept in catalog order
+if corporate_view:
+    module_names, type_names = shard_set.module_names(), shard_set.type_names()
 else:
-    filtered_df = rejections_df
+    catalog = data_manager.get_catalog()
+    module_names, type_names = catalog.module_names, catalog.type_names
 
 # Module filter
-if not modules_df.empty:
-    available_modules = ['All'] + modules_df['name'].tolist()
+selected_module = 'All'
+if module_names:
+    available_modules = ['All'] + module_names
     selected_module = st.sidebar.selectbox("Select Module", available_modules)
-    
-    if selected_module != 'All':
-        filtered_df = filtered_df[filtered_df['module'] == selected_module]
 
 # Rejection type filter
-if not types_df.empty:
-    available_types = ['All'] + types_df['name'].tolist()
+selected_type = 'All'
+if type_names:
+    available_types = ['All'] + type_names
     selected_type = st.sidebar.selectbox("Select Rejection Type", available_types)
-    
-    if selected_type != 'All':
-        filtered_df = filtered_df[filtered_df['rejection_type'] == selected_type]
+
+filter_module = None if selected_module == 'All' else selected_module
+filter_type = None if selected_type == 'All' else selected_type
+
+# Whole days from the start of the start date to the end of the end date
+filters = dashboard_filters(start_date, end_date, filter_module, filter_type)
+range_start, range_end = filters['start_date'], filters['end_date']
+
+# Every dashboard aggregate in one pass over the filtered data, memoized per data version
+results = source.query_many(filters, dashboard_aggregations(by_plant=corporate_view))
+totals = results['totals'].iloc[0]
 
 # Main dashboard content
-if filtered_df.empty:
+if totals['count'] == 0:
     st.warning("📋 No rejection data available for the selected filters.")
     st.info("💡 **Getting Started:**\n- Navigate to 'Data Entry' for single records or 'Batch Entry' for multiple records\n- Visit 'Manage Types' to set up modules and rejection types\n- Configure email settings for automated reports")
 else:
     # Key metrics
-    col1, col2, col3, col4 = st.columns(4)
+    col1, col2, col3, col4, col5 = st.columns(5)
     
     with col1:
-        total_rejections = len(filtered_df)
+        total_rejections = int(totals['count'])
         st.metric("Total Rejections", total_rejections)
     
     with col2:
-        total_quantity = filtered_df['quantity'].sum()
+        total_quantity = totals['quantity']
         st.metric("Total Quantity Rejected", f"{total_quantity:,}")
     
     with col3:
-        unique_modules = filtered_df['module'].nunique()
+        unique_modules = totals['unique:module']
         st.metric("Modules Affected", unique_modules)
     
     with col4:
-        unique_types = filtered_df['rejection_type'].nunique()
+        unique_types = totals['unique:rejection_type']
         st.metric("Rejection Types", unique_types)
+    
+    with col5:
+        unique_operators = totals['unique:operator']
+        st.metric("Operators Involved", unique_operators, help="Estimated for whole-plant views; may be off by about 2%")
 
     st.markdown("---")
 
@@ -236,8 +259,8 @@ else:
     
     with col1:
         st.subheader("📈 Daily Rejection Trend")
-        filtered_df['date_only'] = filtered_df['date'].dt.date
-        daily_rejections = filtered_df.groupby('date_only')['quantity'].sum().reset_index()
+        daily_rejections = results['daily']
+        daily_rejections['date_only'] = daily_rejections['day'].dt.date
         
         if len(daily_rejections) > 0:
             fig_timeline = px.line(
@@ -257,12 +280,12 @@ else:
     
     with col2:
         st.subheader("🥧 Rejections by Type")
-        rejection_counts = filtered_df.groupby('rejection_type')['quantity'].sum().sort_values(ascending=False)
+        rejection_counts = results['by_type']
         
         if len(rejection_counts) > 0:
             fig_pie = px.pie(
-                values=rejection_counts.values,
-                names=rejection_counts.index,
+                values=rejection_counts['quantity'],
+                names=rejection_counts['rejection_type'],
                 title="Rejection Distribution by Type"
             )
             fig_pie.update_traces(textposition='inside', textinfo='percent+label')
@@ -274,12 +297,12 @@ else:
     
     with col3:
         st.subheader("📊 Rejections by Module")
-        module_counts = filtered_df.groupby('module')['quantity'].sum().sort_values(ascending=False)
+        module_counts = results['by_module']
         
         if len(module_counts) > 0:
             fig_bar = px.bar(
-                x=module_counts.values,
-                y=module_counts.index,
+                x=module_counts['quantity'],
+                y=module_counts['module'],
                 orientation='h',
                 title="Rejection Quantity by Module",
                 labels={'x': 'Quantity Rejected', 'y': 'Module'}
@@ -292,12 +315,12 @@ else:
     
     with col4:
         st.subheader("🔧 Top Rejection Reasons")
-        reason_counts = filtered_df.groupby('reason')['quantity'].sum().sort_values(ascending=False).head(10)
+        reason_counts = results['top_reasons']
         
         if len(reason_counts) > 0:
             fig_reasons = px.bar(
-                x=reason_counts.index,
-                y=reason_counts.values,
+                x=reason_counts['reason'],
+                y=reason_counts['quantity'],
                 title="Top 10 Rejection Reasons",
                 labels={'x': 'Reason', 'y': 'Quantity'}
             )
@@ -307,11 +330,29 @@ else:
             )
             st.plotly_chart(fig_reasons, use_container_width=True)
 
+    # Plant comparison in the consolidated view
+    if corporate_view:
+        st.markdown("---")
+        st.subheader("🏭 Rejections by Plant")
+        plant_counts = results['by_plant']
+        
+        if len(plant_counts) > 0:
+            fig_plants = px.bar(
+                plant_counts,
+                x='plant',
+                y='quantity',
+                hover_data=['count'],
+                title="Rejection Quantity by Plant",
+                labels={'plant': 'Plant', 'quantity': 'Quantity Rejected', 'count': 'Entries'}
+            )
+            fig_plants.update_layout(height=400)
+            st.plotly_chart(fig_plants, use_container_width=True)
+
     # Pareto Analysis
     st.markdown("---")
     st.subheader("📈 Pareto Analysis - 80/20 Rule")
     
-    rejection_totals = filtered_df.groupby('rejection_type')['quantity'].sum().sort_values(ascending=False)
+    rejection_totals = results['by_type'].set_index('rejection_type')['quantity']
     cumulative_percentage = (rejection_totals.cumsum() / rejection_totals.sum() * 100)
     
     if len(rejection_totals) > 0:
@@ -359,11 +400,56 @@ else:
     # Recent rejections table
     st.markdown("---")
     st.subheader("🕒 Recent Rejections")
-    if not filtered_df.empty:
-        recent_rejections = filtered_df.nlargest(10, 'date')[['date', 'module', 'rejection_type', 'quantity', 'reason', 'operator']]
+    if not results['recent'].empty:
+        recent_columns = ['date', 'module', 'rejection_type', 'quantity', 'reason', 'operator']
+        if corporate_view:
+            recent_columns.insert(1, 'plant')
+        recent_rejections = results['recent'][recent_columns]
         recent_rejections['date'] = recent_rejections['date'].dt.strftime('%Y-%m-%d')
         st.dataframe(recent_rejections, use_container_width=True)
 
+    # Full-text search over reasons, within the sidebar filters
+    st.markdown("---")
+    st.subheader("🔎 Search Rejection Reasons")
+    reason_query = st.text_input(
+        "Search reasons",
+        placeholder="e.g. burr, crack near weld",
+        help="Finds reasons containing every word; words also match their beginnings, so 'crack' finds 'cracked'"
+    )
+    if reason_query.strip():
+        search = source.search_reasons(reason_query, filters)
+        if search['matches'] == 0:
+            st.info(f"No rejection reasons match '{reason_query}' for the selected filters.")
+        else:
+            col1, col2 = st.columns(2)
+            with col1:
+                st.metric("Matching Rejections", f"{search['matches']:,}")
+            with col2:
+                st.metric("Matching Quantity", f"{search['quantity']:,}")
+
+            col3, col4 = st.columns(2)
+            with col3:
+                matching_reasons = search['by_reason'].head(10)
+                fig_matches = px.bar(
+                    matching_reasons,
+                    x='count',
+                    y='reason',
+                    orientation='h',
+                    hover_data=['quantity'],
+                    title="Most Frequent Matching Reasons",
+                    labels={'count': 'Entries', 'reason': 'Reason', 'quantity': 'Quantity'}
+                )
+                fig_matches.update_layout(yaxis={'categoryorder': 'total ascending'}, height=400)
+                st.plotly_chart(fig_matches, use_container_width=True)
+            with col4:
+                match_columns = ['date', 'module', 'rejection_type', 'quantity', 'reason', 'operator']
+                if corporate_view:
+                    match_columns.insert(1, 'plant')
+                matching_records = search['records'][match_columns].copy()
+                matching_records['date'] = matching_records['date'].dt.strftime('%Y-%m-%d %H:%M')
+                st.caption(f"Newest {len(matching_records)} matching records")
+                st.dataframe(matching_records, use_container_width=True, height=400)
+
     # Export data functionality (only for admin and super admin)
     if auth_manager.has_permission(st.session_state.get("user_role"), "export_data"):
         st.markdown("---")
@@ -371,13 +457,22 @@ else:
         
         with col1:
             st.subheader("📥 Export Data")
+            export_format = st.selectbox(
+                "Export format",
+                available_formats(),
+                help="Parquet and Arrow keep column types and load much faster in BI tools; compressed CSV is smaller to download"
+            )
             
         with col2:
-            if st.button("📊 Download CSV"):
-                csv_data = filtered_df.to_csv(index=False)
+            if st.button("📊 Prepare Export"):
+                # Build the file from storage chunks; the download button still holds the finished file in memory
+                export_file = spool_export(source.iter_rejections(
+                    range_start, range_end, module=filter_module, rejection_type=filter_type
+                ), export_format, columns=PLANT_COLUMNS if corporate_view else REJECTION_COLUMNS)
+                extension, mime = EXPORT_FORMATS[export_format]
                 st.download_button(
                     label="💾 Download Filtered Data",
-                    data=csv_data,
-                    file_name=f"rejection_data_{start_date}_to_{end_date}.csv",
-                    mime="text/csv"
+                    data=export_file,
+                    file_name=f"rejection_data_{start_date}_to_{end_date}.{extension}",
+                    mime=mime
                 )
\ No newline at end of file
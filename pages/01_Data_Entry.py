@@ -94,15 +94,14 @@ with col2:
 st.markdown("---")
 
 # Load available modules and rejection types
-modules_df = data_manager.load_modules()
-types_df = data_manager.load_rejection_types()
+catalog = data_manager.get_catalog()
 
 # Check if modules and types are available
-if modules_df.empty:
+if not catalog.module_names:
     st.error("⚠️ No modules configured. Please go to 'Manage Types' page to add modules first.")
     st.stop()
 
-if types_df.empty:
+if not catalog.type_names:
     st.error("⚠️ No rejection types configured. Please go to 'Manage Types' page to add rejection types first.")
     st.stop()
 
@@ -116,7 +115,7 @@ with st.form("rejection_entry"):
         # Module selection
         selected_module = st.selectbox(
             "Select Module *",
-            options=modules_df['name'].tolist(),
+            options=catalog.module_names,
             help="Choose the manufacturing module where rejection occurred"
         )
         
@@ -225,12 +224,14 @@ st.markdown("---")
 # Recent entries section
 st.subheader("📋 Recent Rejection Entries")
 
-# Load recent rejections
-rejections_df = data_manager.load_rejections()
+# Last 10 entries and the most common type; only the newest days are read
+results = data_manager.query_many(aggregations={
+    'recent': {'latest': 10},
+    'top_type': {'group_by': 'rejection_type', 'metrics': ['count'], 'top_n': 1}
+})
+recent_df = results['recent']
 
-if not rejections_df.empty:
-    # Show last 10 entries
-    recent_df = rejections_df.nlargest(10, 'date').copy()
+if not recent_df.empty:
     recent_df['date'] = recent_df['date'].dt.strftime('%Y-%m-%d %H:%M')
     
     # Display in a nice format
@@ -241,19 +242,18 @@ if not rejections_df.empty:
     )
     
     # Summary stats
+    today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    today_totals = data_manager.query({'start_date': today_start}, metrics=['count', 'quantity']).iloc[0]
+    
     col1, col2, col3 = st.columns(3)
     with col1:
-        today_rejections = len(rejections_df[rejections_df['date'].dt.date == datetime.now().date()])
-        st.metric("Today's Rejections", today_rejections)
+        st.metric("Today's Rejections", int(today_totals['count']))
     
     with col2:
-        total_quantity_today = rejections_df[
-            rejections_df['date'].dt.date == datetime.now().date()
-        ]['quantity'].sum()
-        st.metric("Today's Rejected Quantity", total_quantity_today)
+        st.metric("Today's Rejected Quantity", today_totals['quantity'])
     
     with col3:
-        most_common_type = rejections_df['rejection_type'].mode()
+        most_common_type = results['top_type']['rejection_type']
         if not most_common_type.empty:
             st.metric("Most Common Type", most_common_type.iloc[0])
         else:
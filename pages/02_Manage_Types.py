@@ -164,15 +164,9 @@ with tab1:
         
         # Module statistics
         st.subheader("📊 Module Statistics")
-        rejections_df = data_manager.load_rejections()
+        module_stats = data_manager.query(group_by='module', metrics=['quantity', 'count'], order='group')
         
-        if not rejections_df.empty:
-            module_stats = rejections_df.groupby('module').agg({
-                'quantity': 'sum',
-                'date': 'count'
-            }).rename(columns={'date': 'total_entries'})
-            
-            module_stats = module_stats.reset_index()
+        if not module_stats.empty:
             module_stats.columns = ['Module', 'Total Quantity Rejected', 'Total Entries']
             st.dataframe(module_stats, use_container_width=True, hide_index=True)
         else:
@@ -275,17 +269,10 @@ with tab2:
         
         # Rejection type statistics
         st.subheader("📊 Rejection Type Statistics")
-        rejections_df = data_manager.load_rejections()
+        type_stats = data_manager.query(group_by='rejection_type', metrics=['quantity', 'count'])
         
-        if not rejections_df.empty:
-            type_stats = rejections_df.groupby('rejection_type').agg({
-                'quantity': 'sum',
-                'date': 'count'
-            }).rename(columns={'date': 'total_entries'})
-            
-            type_stats = type_stats.reset_index()
+        if not type_stats.empty:
             type_stats.columns = ['Rejection Type', 'Total Quantity Rejected', 'Total Entries']
-            type_stats = type_stats.sort_values('Total Quantity Rejected', ascending=False)
             st.dataframe(type_stats, use_container_width=True, hide_index=True)
         else:
             st.info("📋 No rejection data available for type statistics")
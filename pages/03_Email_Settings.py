@@ -232,15 +232,13 @@ with col3:
 st.subheader("👀 Email Preview")
 
 if st.button("📋 Preview Report Content"):
-    from utils.data_manager import DataManager
     from datetime import datetime, timedelta
     
-    data_manager = DataManager()
     yesterday = datetime.now() - timedelta(days=1)
     start_of_yesterday = yesterday.replace(hour=0, minute=0, second=0, microsecond=0)
     end_of_yesterday = yesterday.replace(hour=23, minute=59, second=59, microsecond=999999)
     
-    summary = data_manager.get_rejection_summary(start_of_yesterday, end_of_yesterday)
+    summary = email_sender.get_report_summary(start_of_yesterday, end_of_yesterday)
     html_content = email_sender.create_daily_report_html(summary)
     
     st.components.v1.html(html_content, height=600, scrolling=True)
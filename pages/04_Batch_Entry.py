@@ -1,7 +1,11 @@
+import os
+import uuid
 import streamlit as st
 import pandas as pd
 from datetime import datetime, time
 from utils.data_manager import DataManager
+from utils.validation import rejection_errors
+from utils.importer import HistoricalImporter, save_upload
 from utils.auth import get_auth_manager
 
 # Page configuration
@@ -80,26 +84,28 @@ st.markdown("Enter multiple rejection records efficiently using table format")
 st.markdown("---")
 
 # Load available modules and rejection types
-modules_df = data_manager.load_modules()
-types_df = data_manager.load_rejection_types()
+catalog = data_manager.get_catalog()
 
 # Check if modules and types are available
-if modules_df.empty:
+if not catalog.module_names:
     st.error("⚠️ No modules configured. Please go to 'Manage Types' page to add modules first.")
     st.stop()
 
-if types_df.empty:
+if not catalog.type_names:
     st.error("⚠️ No rejection types configured. Please go to 'Manage Types' page to add rejection types first.")
     st.stop()
 
 # Get lists for the table
-modules_list = modules_df['name'].tolist()
+modules_list = catalog.module_names
+
+# Module <-> rejection type mapping of this catalog version
+type_mapping = catalog.mapping
 
 # Create a function to get applicable types for a module
 def get_applicable_types_for_module(module_name):
     if not module_name:
         return []
-    return data_manager.get_rejection_types_for_module(module_name)
+    return type_mapping.types_for_module(module_name)
 
 # Display helpful mapping information
 st.info("""
@@ -110,14 +116,14 @@ st.info("""
 """)
 
 # Show module-rejection type mapping for reference
-if not modules_df.empty and not types_df.empty:
+if catalog.module_names and catalog.type_names:
     with st.expander("📋 View Module-Rejection Type Mappings", expanded=False):
-        for _, module in modules_df.iterrows():
-            applicable_types = get_applicable_types_for_module(module['name'])
+        for module_name in catalog.module_names:
+            applicable_types = get_applicable_types_for_module(module_name)
             if applicable_types:
-                st.write(f"**{module['name']}:** {', '.join(applicable_types)}")
+                st.write(f"**{module_name}:** {', '.join(applicable_types)}")
             else:
-                st.write(f"**{module['name']}:** No rejection types configured")
+                st.write(f"**{module_name}:** No rejection types configured")
         st.caption("Use this reference to ensure you select valid module-rejection type combinations")
 
 # Session state for table data
@@ -132,6 +138,10 @@ if 'batch_data' not in st.session_state:
         'Shift': ['Day'] * 5
     })
 
+# ID of the sheet being filled in; resubmitting the same sheet stores nothing twice
+if 'batch_id' not in st.session_state:
+    st.session_state.batch_id = uuid.uuid4().hex
+
 # Common fields section
 st.subheader("🔧 Common Entry Fields")
 col1, col2, col3 = st.columns(3)
@@ -161,7 +171,7 @@ edited_df = st.data_editor(
         "Rejection_Type": st.column_config.SelectboxColumn(
             "Rejection Type",
             help="Select rejection type (options available for all modules)",
-            options=types_df['name'].tolist() if not types_df.empty else [],
+            options=catalog.type_names,
             required=True
         ),
         "Quantity": st.column_config.NumberColumn(
@@ -233,65 +243,41 @@ with col3:
             'Operator': [''] * 5,
             'Shift': ['Day'] * 5
         })
+        st.session_state.batch_id = uuid.uuid4().hex
         st.rerun()
 
 with col4:
     if st.button("✅ Submit All Records", type="primary"):
-        # Validate and submit records
-        valid_records = []
-        errors = []
+        # Validate the whole sheet in one vectorized pass
+        batch = pd.DataFrame({
+            'module': edited_df['Module'],
+            'rejection_type': edited_df['Rejection_Type'],
+            'quantity': pd.to_numeric(edited_df['Quantity'], errors='coerce'),
+            'reason': edited_df['Reason'].fillna('').astype(str).str.strip(),
+            'operator': edited_df['Operator'].fillna('').astype(str).str.strip(),
+            'shift': edited_df['Shift']
+        })
+        batch['operator'] = batch['operator'].mask(batch['operator'] == '', common_operator)
         
-        for idx, row in edited_df.iterrows():
-            # Skip empty rows
-            if not row['Module'] or not row['Rejection_Type'] or row['Quantity'] <= 0:
-                continue
-            
-            # Validate rejection type is applicable to module
-            applicable_types = data_manager.get_rejection_types_for_module(row['Module'])
-            if row['Rejection_Type'] not in applicable_types:
-                if applicable_types:
-                    errors.append(f"Row {idx + 1}: '{row['Rejection_Type']}' is not valid for module '{row['Module']}'. Available types: {', '.join(applicable_types)}")
-                else:
-                    errors.append(f"Row {idx + 1}: No rejection types configured for module '{row['Module']}'")
-                continue
-            
-            # Validate required fields
-            if not row['Reason'].strip():
-                errors.append(f"Row {idx + 1}: Reason is required")
-                continue
-            
-            operator = row['Operator'].strip() if row['Operator'] else common_operator
-            if not operator:
-                errors.append(f"Row {idx + 1}: Operator is required")
-                continue
-            
-            valid_records.append({
-                'module': row['Module'],
-                'rejection_type': row['Rejection_Type'],
-                'quantity': int(row['Quantity']),
-                'reason': row['Reason'].strip(),
-                'operator': operator,
-                'shift': row['Shift']
-            })
+        # Skip empty rows
+        filled = (batch['module'].fillna('') != '') & (batch['rejection_type'].fillna('') != '') & (batch['quantity'] > 0)
+        batch = batch[filled]
+        
+        messages = rejection_errors(batch, type_mapping, required=('module', 'rejection_type', 'reason', 'operator', 'shift'))
+        errors = [f"Row {idx + 1}: {message}" for idx, message in messages.items() if message]
+        valid_batch = batch[messages == ''].astype({'quantity': int})
+        valid_records = valid_batch.to_dict('records')
         
         if errors:
             st.error("❌ Please fix the following errors:\n" + "\n".join(errors))
         elif not valid_records:
             st.warning("⚠️ No valid records to submit. Please fill in at least one complete row.")
         else:
-            # Submit all valid records
-            success_count = 0
-            failed_records = []
-            
-            for record in valid_records:
-                success, message = data_manager.add_rejection(**record)
-                if success:
-                    success_count += 1
-                else:
-                    failed_records.append(f"{record['module']} - {record['rejection_type']}: {message}")
+            # Submit all valid records in one all-or-nothing write
+            success, message = data_manager.add_rejections(valid_records, batch_id=st.session_state.batch_id)
             
-            if success_count > 0:
-                st.success(f"✅ Successfully submitted {success_count} rejection records!")
+            if success:
+                st.success(f"✅ {message}")
                 st.balloons()
                 
                 # Clear the table after successful submission
@@ -303,10 +289,10 @@ with col4:
                     'Operator': [''] * 5,
                     'Shift': ['Day'] * 5
                 })
+                st.session_state.batch_id = uuid.uuid4().hex
                 st.rerun()
-            
-            if failed_records:
-                st.error("❌ Failed to submit some records:\n" + "\n".join(failed_records))
+            else:
+                st.error(f"❌ No records were submitted: {message}")
 
 # Summary section
 st.markdown("---")
@@ -344,6 +330,40 @@ if not edited_df.empty:
     else:
         st.info("📋 No valid records in the table yet. Fill in the table above to see summary.")
 
+# Historical import
+st.markdown("---")
+st.subheader("📥 Import Historical Data")
+st.markdown("Upload a CSV or Excel sheet of past rejections. Each row needs a date, module, rejection type, quantity, operator and shift.")
+
+uploaded_file = st.file_uploader("Rejection history file", type=["csv", "xlsx"])
+dayfirst = st.checkbox("Dates are day-first (e.g. 31/01/2021)")
+
+if uploaded_file is not None and st.button("📥 Start Import"):
+    # Stored under its content hash, so uploading the same file again resumes an interrupted import
+    source_path = save_upload(uploaded_file, data_manager.data_dir)
+    importer = HistoricalImporter(data_manager, source_path, dayfirst=dayfirst)
+    checkpoint = importer.load_checkpoint()
+    if checkpoint['rows_done'] and not checkpoint['done']:
+        st.info(f"🔄 Resuming after row {checkpoint['rows_done']}")
+    
+    progress_bar = st.progress(0.0)
+    status = st.empty()
+    
+    def show_progress(fraction, checkpoint):
+        progress_bar.progress(fraction)
+        status.text(f"{checkpoint['rows_done']:,} rows read, {checkpoint['imported']:,} imported, {checkpoint['rejected']:,} rejected")
+    
+    success, message = importer.run(progress=show_progress)
+    if success:
+        progress_bar.progress(1.0)
+        st.success(f"✅ {message}")
+    else:
+        st.error(f"❌ {message}")
+    
+    if os.path.exists(importer.errors_file):
+        with open(importer.errors_file, 'rb') as f:
+            st.download_button("💾 Download Rejected Rows", f, file_name=f"rejected_{uploaded_file.name}.csv", mime="text/csv")
+
 # Quick actions
 st.markdown("---")
 st.subheader("⚡ Quick Actions")
@@ -0,0 +1,39 @@
+import pytest
+
+from utils.data_manager import DataManager
+
+
+@pytest.fixture(params=["csv", "parquet", "segments"])
+def data_manager(request, tmp_path):
+    data_manager = DataManager(storage=request.param, data_dir=str(tmp_path))
+    data_manager.add_module("M1", "Press line")
+    data_manager.add_rejection_type("Burr", "Edge burr", ["M1"])
+    return data_manager
+
+
+def _records(count):
+    return [{'module': "M1", 'rejection_type': "Burr", 'quantity': 1, 'reason': "burr",
+             'operator': "op1", 'shift': "Day", 'date': "2026-01-05 10:00:00"} for _ in range(count)]
+
+
+def test_derived_index_failure_does_not_fail_a_stored_write(data_manager, monkeypatch):
+    data_manager.add_rejections(_records(1))
+    data_manager.get_rollup()
+    assert data_manager.rollup.exists()
+
+    def broken(records):
+        raise ValueError("unexpected rollup row")
+
+    monkeypatch.setattr(data_manager.rollup, "record", broken)
+    monkeypatch.setattr(data_manager.sketches, "record", broken)
+    success, message = data_manager.add_rejections(_records(2), batch_id="batch-1")
+    assert success, message
+    # Dropped, to be rebuilt from the raw rows
+    assert not data_manager.rollup.exists()
+    monkeypatch.undo()
+
+    # The dedup keys were still recorded, so a retry stores nothing new
+    success, message = data_manager.add_rejections(_records(2), batch_id="batch-1")
+    assert success and message.startswith("Already submitted")
+    assert len(data_manager.load_rejections()) == 3
+    assert int(data_manager.get_rollup()['count'].sum()) == 3
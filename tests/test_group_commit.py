@@ -0,0 +1,52 @@
+import time
+import threading
+
+from utils.group_commit import GroupCommitter
+
+
+def test_leader_returns_after_its_own_round_under_sustained_load():
+    rounds = 0
+    followers = []
+
+    def write_batches(batches):
+        nonlocal rounds
+        rounds += 1
+        if rounds < 20:
+            # Another caller arrives during every write
+            follower = threading.Thread(target=committer.submit, args=([rounds],))
+            follower.start()
+            followers.append(follower)
+            while not committer._pending:
+                time.sleep(0.001)
+        return [len(records) for records in batches]
+
+    committer = GroupCommitter(write_batches, window=0)
+    started = time.perf_counter()
+    assert committer.submit([1, 2]) == 2
+    elapsed = time.perf_counter() - started
+    rounds_at_return = rounds
+
+    while followers:
+        followers.pop(0).join()
+    # The first caller does not keep writing for everyone who arrives after it
+    assert rounds_at_return <= 2
+    assert elapsed < 0.5
+    assert rounds == 20
+
+
+def test_errors_reach_every_caller_of_the_failed_round():
+    def write_batches(batches):
+        raise OSError("disk full")
+
+    committer = GroupCommitter(write_batches, window=0)
+    try:
+        committer.submit([1])
+    except OSError as e:
+        assert str(e) == "disk full"
+    else:
+        raise AssertionError("submit should raise")
+    # Leadership was released, so the next caller is not left waiting
+    try:
+        committer.submit([1])
+    except OSError:
+        pass
@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+from utils.data_manager import DataManager
+from utils.importer import HistoricalImporter
+
+
+@pytest.fixture(params=["csv", "parquet", "segments", "sqlite"])
+def data_manager(request, tmp_path):
+    data_manager = DataManager(storage=request.param, data_dir=str(tmp_path / "data"))
+    data_manager.add_module("M1", "Press line")
+    data_manager.add_rejection_type("Burr", "Edge burr", ["M1"])
+    return data_manager
+
+
+def _source(tmp_path, rows):
+    path = tmp_path / "history.csv"
+    lines = ["Date,Line,Defect Type,Qty,Remarks,Inspector,Shift"]
+    lines += [f"2025-03-{day % 28 + 1:02d} 08:00:00,M1,Burr,{day + 1},burr,op1,Day" for day in range(rows)]
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def test_chunk_replayed_after_a_crash_is_stored_once(data_manager, tmp_path, monkeypatch):
+    source = _source(tmp_path, 10)
+    importer = HistoricalImporter(data_manager, source, chunksize=4)
+    save_checkpoint = importer._save_checkpoint
+    saved = []
+
+    def crash_on_second_chunk(checkpoint):
+        if len(saved) == 1:
+            raise OSError("power lost")
+        saved.append(checkpoint['rows_done'])
+        save_checkpoint(checkpoint)
+
+    monkeypatch.setattr(importer, "_save_checkpoint", crash_on_second_chunk)
+    success, message = importer.run()
+    assert not success
+    # The second chunk was written, but its checkpoint was not
+    assert len(data_manager.load_rejections()) == 8
+    monkeypatch.undo()
+
+    # Resumed with another chunk size, the import keeps the boundaries the stored chunks were keyed by
+    success, message = HistoricalImporter(data_manager, source, chunksize=3).run()
+    assert success, message
+    assert len(data_manager.load_rejections()) == 10
+    assert int(data_manager.load_rejections()['quantity'].sum()) == sum(range(1, 11))
+    # One key per chunk rather than per row
+    assert os.path.getsize(os.path.join(data_manager.data_dir, "dedup.keys")) == 3 * 16
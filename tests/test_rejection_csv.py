@@ -0,0 +1,11 @@
+import pandas as pd
+
+from utils.rejection_csv import REJECTION_COLUMNS, parse_rejection_rows
+
+
+def test_hand_edited_dates_fall_back_to_pandas():
+    data = b"2026-01-05 10:00:00,M1,Burr,1,burr,op1,Day\n2026-01-06,M1,Burr,2,burr,op1,Day\n"
+    df = parse_rejection_rows(data, REJECTION_COLUMNS)
+    assert pd.api.types.is_datetime64_any_dtype(df['date'])
+    assert df['date'].tolist() == [pd.Timestamp("2026-01-05 10:00:00"), pd.Timestamp("2026-01-06")]
+    assert df['quantity'].tolist() == [1, 2]
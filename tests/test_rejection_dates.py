@@ -0,0 +1,33 @@
+import pandas as pd
+import pytest
+
+from utils.data_manager import DataManager
+
+
+@pytest.fixture(params=["csv", "parquet", "sqlite", "segments"])
+def data_manager(request, tmp_path):
+    data_manager = DataManager(storage=request.param, data_dir=str(tmp_path))
+    data_manager.add_module("M1", "Press line")
+    data_manager.add_rejection_type("Burr", "Edge burr", ["M1"])
+    return data_manager
+
+
+def _record(date):
+    return {'module': "M1", 'rejection_type': "Burr", 'quantity': 2, 'reason': "burr",
+            'operator': "op1", 'shift': "Day", 'date': date}
+
+
+def test_iso_dates_are_stored_in_the_store_format(data_manager):
+    success, message = data_manager.add_rejections([_record("2026-01-05T12:00:00"), _record("2026-01-06")])
+    assert success, message
+
+    df = data_manager.load_rejections()
+    assert pd.api.types.is_datetime64_any_dtype(df['date'])
+    assert sorted(df['date']) == [pd.Timestamp("2026-01-05 12:00:00"), pd.Timestamp("2026-01-06")]
+
+    ranged = data_manager.load_rejections(pd.Timestamp("2026-01-05"), pd.Timestamp("2026-01-06 23:59:59"))
+    assert len(ranged) == 2
+    totals = data_manager.query({'start_date': pd.Timestamp("2026-01-05"), 'end_date': pd.Timestamp("2026-01-06 23:59:59")},
+                                metrics=['count', 'quantity'])
+    assert totals['count'].iloc[0] == 2
+    assert totals['quantity'].iloc[0] == 4
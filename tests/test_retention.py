@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+
+from utils.data_manager import DataManager
+
+
+@pytest.fixture(params=["csv", "parquet", "sqlite", "segments"])
+def data_manager(request, tmp_path):
+    data_manager = DataManager(storage=request.param, retention_months=2, data_dir=str(tmp_path))
+    data_manager.add_module("M1", "Press line")
+    data_manager.add_rejection_type("Burr", "Edge burr", ["M1"])
+    return data_manager
+
+
+def test_lookups_still_find_archived_records(data_manager):
+    old = (pd.Timestamp.now() - pd.DateOffset(months=6)).strftime('%Y-%m-%d 10:00:00')
+    new = pd.Timestamp.now().strftime('%Y-%m-%d 00:00:00')
+    # The backdated record is stored last, so the newest ID is the one archived
+    records = [
+        {'module': "M1", 'rejection_type': "Burr", 'quantity': 2, 'reason': "Cracked weld seam",
+         'operator': "op1", 'shift': "Night", 'date': new},
+        {'module': "M1", 'rejection_type': "Burr", 'quantity': 1, 'reason': "Crack near weld",
+         'operator': "op1", 'shift': "Day", 'date': old},
+    ]
+    success, message = data_manager.add_rejections(records)
+    assert success, message
+    found = data_manager.find_records({'operator': "op1"})
+    ids = sorted(found['id'].tolist())
+    old_id = int(found.loc[found['reason'] == "Crack near weld", 'id'].iloc[0])
+
+    success, message = data_manager.apply_retention()
+    assert success and message.startswith("Archived 1 "), message
+
+    # Archived rows keep their IDs and stay reachable on every backend
+    assert sorted(data_manager.find_records({'operator': "op1"})['id'].tolist()) == ids
+    assert data_manager.get_record(old_id)['reason'] == "Crack near weld"
+    search = data_manager.search_reasons("crack weld")
+    assert search['matches'] == 2
+    assert search['quantity'] == 3
+
+    # New records never reuse an archived record's ID
+    data_manager.add_rejections(records[:1])
+    assert len(set(data_manager.find_records({'operator': "op1"})['id'])) == 3
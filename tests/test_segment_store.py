@@ -0,0 +1,56 @@
+import os
+
+import pandas as pd
+import pytest
+
+from utils.segment_store import SegmentedRejectionStore
+
+
+def _record(date):
+    return {'date': date, 'module': "M1", 'rejection_type': "Burr", 'quantity': 1,
+            'reason': "burr", 'operator': "op1", 'shift': "Day"}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SegmentedRejectionStore(str(tmp_path / "segments"), str(tmp_path / "rejections.lock"))
+
+
+def test_failed_append_leaves_no_rows_behind(store, monkeypatch):
+    store.append([_record("2026-01-05 10:00:00")])
+    files = sorted(os.listdir(store.root_dir))
+
+    def broken(manifest):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(store, "_write_manifest", broken)
+    with pytest.raises(OSError):
+        # Spans two days, so a new segment is started partway through
+        store.append([_record("2026-01-05 11:00:00"), _record("2026-01-06 09:00:00")])
+    monkeypatch.undo()
+
+    assert sorted(os.listdir(store.root_dir)) == files
+    assert len(store.load()) == 1
+    store.append([_record("2026-01-06 09:00:00")])
+    assert len(store.load()) == 2
+
+
+def test_archive_splits_segments_that_cross_the_cutoff(store):
+    days = pd.date_range("2026-01-28 10:00:00", "2026-02-03 10:00:00", freq="D")
+    for day in days:
+        store.append([_record(day.strftime('%Y-%m-%d %H:%M:%S')), _record(day.strftime('%Y-%m-%d 23:00:00'))])
+    # Newest rows, appended late, land in the active segment with an old date
+    store.append([_record("2026-01-15 08:00:00")])
+    assert store.compact() >= 4
+    assert any(entry['min_date'] < "2026-02-01" <= entry['max_date'] for entry in store._read_manifest()['sealed'])
+
+    archived = []
+    moved = store.archive_before(pd.Timestamp("2026-02-01"), archived.append)
+
+    expected = 2 * sum(day < pd.Timestamp("2026-02-01") for day in days) + 1
+    assert moved == expected
+    assert sum(len(df) for df in archived) == expected
+    hot = store.load()
+    assert len(hot) == 2 * len(days) + 1 - expected
+    assert (hot['date'] >= pd.Timestamp("2026-02-01")).all()
+    assert len(store.load("2026-02-02", "2026-02-02 23:59:59")) == 2
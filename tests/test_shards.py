@@ -0,0 +1,33 @@
+import io
+
+import pandas as pd
+import pytest
+
+from utils.data_manager import DataManager
+from utils.export import write_export
+from utils.shards import ShardSet, PLANT_COLUMNS
+
+
+@pytest.fixture
+def shard_set(tmp_path):
+    shards = {}
+    for name, quantity in (("Plant A", 1), ("Plant B", 2)):
+        data_dir = str(tmp_path / name)
+        data_manager = DataManager(storage="csv", data_dir=data_dir)
+        data_manager.add_module("M1", "Press line")
+        data_manager.add_rejection_type("Burr", "Edge burr", ["M1"])
+        data_manager.add_rejections([{'module': "M1", 'rejection_type': "Burr", 'quantity': quantity, 'reason': "burr",
+                                      'operator': "op1", 'shift': "Day", 'date': "2026-01-05 10:00:00"}])
+        shards[name] = data_dir
+    return ShardSet(shards, storage="csv")
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def test_consolidated_export_names_each_row_plant(shard_set, fmt):
+    f = io.BytesIO()
+    rows = write_export(shard_set.iter_rejections(), f, fmt, columns=PLANT_COLUMNS)
+    assert rows == 2
+    f.seek(0)
+    exported = pd.read_csv(f) if fmt == "csv" else pd.read_parquet(f)
+    assert list(exported.columns) == PLANT_COLUMNS
+    assert dict(zip(exported['plant'], exported['quantity'])) == {"Plant A": 1, "Plant B": 2}
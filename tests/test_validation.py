@@ -0,0 +1,23 @@
+import pandas as pd
+
+from utils.validation import canonical_dates, rejection_errors
+
+
+def _rows(dates):
+    return pd.DataFrame({
+        'module': "M1", 'rejection_type': "Burr", 'quantity': 1,
+        'operator': "op1", 'shift': "Day", 'date': dates
+    })
+
+
+def test_iso_dates_validate_and_canonicalize_to_the_store_format():
+    dates = ["2026-01-05T12:00:00", "2026-01-06", "2026-01-07 08:30:00", "05/01/2026"]
+    errors = rejection_errors(_rows(dates))
+    assert errors.tolist() == ['', '', '', 'date must be an ISO 8601 timestamp']
+    assert canonical_dates(pd.Series(dates)).tolist() == [
+        "2026-01-05 12:00:00", "2026-01-06 00:00:00", "2026-01-07 08:30:00", None
+    ]
+
+
+def test_missing_dates_are_allowed():
+    assert rejection_errors(_rows([None, ""])).tolist() == ['', '']
@@ -0,0 +1,124 @@
+import os
+import glob
+import gzip
+import threading
+
+import pandas as pd
+
+from utils.rejection_csv import REJECTION_COLUMNS, DATE_FORMAT, parse_rejection_rows, concat_rejections
+
+# Parsed archive months shared by every session: path -> ((mtime_ns, size), frame)
+_archive_cache = {}
+_archive_cache_lock = threading.Lock()
+
+
+class RejectionArchive:
+    """Cold tier of rejections: one gzip-compressed CSV per month, e.g. rejections-2024-01.csv.gz"""
+
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+
+    def _path(self, year, month):
+        return os.path.join(self.archive_dir, f"rejections-{year:04d}-{month:02d}.csv.gz")
+
+    def months(self):
+        """List (year, month, path) for every archived month, oldest first"""
+        months = []
+        for path in glob.glob(os.path.join(self.archive_dir, "rejections-*.csv.gz")):
+            try:
+                year, month = os.path.basename(path)[len("rejections-"):-len(".csv.gz")].split("-")
+                months.append((int(year), int(month), path))
+            except ValueError:
+                continue
+        return sorted(months)
+
+    def boundary(self):
+        """First instant after the newest archived month, or None when nothing is archived"""
+        months = self.months()
+        if not months:
+            return None
+        year, month, _ = months[-1]
+        return pd.Timestamp(year=year, month=month, day=1) + pd.DateOffset(months=1)
+
+    def reaches(self, start_date):
+        """Whether a range starting at start_date needs archived rows; an open start reaches back to the oldest"""
+        boundary = self.boundary()
+        return boundary is not None and (start_date is None or pd.Timestamp(start_date) < boundary)
+
+    def _overlapping(self, start_date=None, end_date=None):
+        start_key = (start_date.year, start_date.month) if start_date is not None else None
+        end_key = (end_date.year, end_date.month) if end_date is not None else None
+        for year, month, path in self.months():
+            if start_key and (year, month) < start_key:
+                continue
+            if end_key and (year, month) > end_key:
+                continue
+            yield path
+
+    def _read(self, path):
+        """Parse one archived month, reusing the cached frame while the file is unchanged"""
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with _archive_cache_lock:
+            cached = _archive_cache.get(path)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+        with gzip.open(path, 'rb') as f:
+            f.readline()
+            df = parse_rejection_rows(f.read(), REJECTION_COLUMNS)
+        with _archive_cache_lock:
+            _archive_cache[path] = (version, df)
+        return df
+
+    def _filter_dates(self, df, start_date=None, end_date=None):
+        if df.empty:
+            return df
+        if start_date is not None:
+            df = df[df['date'] >= start_date]
+        if end_date is not None:
+            df = df[df['date'] <= end_date]
+        return df
+
+    def load(self, start_date=None, end_date=None):
+        """Load archived rejections, opening only the months that overlap the range"""
+        start_date = pd.to_datetime(start_date) if start_date is not None else None
+        end_date = pd.to_datetime(end_date) if end_date is not None else None
+        df = concat_rejections([self._read(path) for path in self._overlapping(start_date, end_date)])
+        return self._filter_dates(df, start_date, end_date)
+
+    def iter_chunks(self, start_date=None, end_date=None, chunksize=50000):
+        """Yield archived rejections month by month, in chunks of at most chunksize rows"""
+        start_date = pd.to_datetime(start_date) if start_date is not None else None
+        end_date = pd.to_datetime(end_date) if end_date is not None else None
+        for path in self._overlapping(start_date, end_date):
+            df = self._filter_dates(self._read(path), start_date, end_date)
+            for start in range(0, len(df), chunksize):
+                yield df.iloc[start:start + chunksize]
+
+    def add(self, df):
+        """Merge rows into their monthly archives; each month is rewritten atomically"""
+        if df.empty:
+            return
+        os.makedirs(self.archive_dir, exist_ok=True)
+        df = df[REJECTION_COLUMNS].copy()
+        df['date'] = pd.to_datetime(df['date'])
+        for (year, month), group in df.groupby([df['date'].dt.year, df['date'].dt.month]):
+            path = self._path(int(year), int(month))
+            frames = [self._read(path)] if os.path.exists(path) else []
+            merged = concat_rejections(frames + [group]).sort_values('date', kind='stable')
+            tmp_path = path + ".tmp"
+            merged.to_csv(tmp_path, index=False, date_format=DATE_FORMAT, compression='gzip')
+            os.replace(tmp_path, path)
+
+
+if __name__ == "__main__":
+    import argparse
+    from utils.data_manager import DataManager
+
+    parser = argparse.ArgumentParser(description="Move old QRMS rejection records into monthly archives")
+    parser.add_argument("command", choices=["apply"])
+    parser.add_argument("--months", type=int, help="Months to keep hot, defaults to QRMS_RETENTION_MONTHS")
+    args = parser.parse_args()
+
+    success, message = DataManager(retention_months=args.months).apply_retention()
+    print(message)
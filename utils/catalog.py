@@ -0,0 +1,89 @@
+import pandas as pd
+
+# Joins a module and a rejection type into one lookup key; cannot appear in catalog names typed in the UI
+PAIR_SEPARATOR = "\x1f"
+
+
+def split_mapped_modules(value):
+    """Split a comma-separated mapped_modules cell into clean module names"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return []
+    return [m.strip() for m in str(value).split(',') if m.strip()]
+
+
+class ModuleTypeMapping:
+    """Normalized module <-> rejection type mapping built from the types catalog"""
+
+    def __init__(self, types_df):
+        self.types_by_module = {}
+        self.modules_by_type = {}
+        self.pairs = set()
+        self.pair_keys = frozenset()
+
+        if types_df.empty or 'mapped_modules' not in types_df.columns:
+            return
+
+        for name, mapped in zip(types_df['name'], types_df['mapped_modules']):
+            modules = split_mapped_modules(mapped)
+            self.modules_by_type[name] = frozenset(modules)
+            for module in modules:
+                # Lists keep the catalog order used by the selectboxes
+                types = self.types_by_module.setdefault(module, [])
+                if name not in types:
+                    types.append(name)
+                self.pairs.add((module, name))
+        self.pair_keys = frozenset(f"{module}{PAIR_SEPARATOR}{name}" for module, name in self.pairs)
+
+    def types_for_module(self, module):
+        """Rejection types mapped to a module, in catalog order"""
+        return list(self.types_by_module.get(module, []))
+
+    def modules_for_type(self, rejection_type):
+        """Modules a rejection type is mapped to"""
+        return self.modules_by_type.get(rejection_type, frozenset())
+
+    def is_valid(self, module, rejection_type):
+        """Whether a rejection type may be recorded against a module"""
+        return (module, rejection_type) in self.pairs
+
+    def valid_mask(self, modules, rejection_types):
+        """Vectorized is_valid over aligned Series of modules and rejection types"""
+        keys = modules.astype(str) + PAIR_SEPARATOR + rejection_types.astype(str)
+        return keys.isin(self.pair_keys)
+
+    def available_types(self, modules):
+        """Comma-separated rejection types mapped to each module of a Series; '' when none are"""
+        joined = {module: ', '.join(types) for module, types in self.types_by_module.items()}
+        return modules.map(joined).fillna('')
+
+
+def _names(df):
+    """Catalog names in file order"""
+    if df.empty or 'name' not in df.columns:
+        return []
+    return df['name'].tolist()
+
+
+class Catalog:
+    """Versioned snapshot of the module and rejection type catalog.
+
+    Snapshots are never modified; writes install a new snapshot with the
+    next version number.
+    """
+
+    def __init__(self, modules_df, types_df, version):
+        self.modules = modules_df
+        self.rejection_types = types_df
+        self.version = version
+        # Lists keep the catalog order used by the selectboxes; sets answer lookups
+        self.module_names = _names(modules_df)
+        self.type_names = _names(types_df)
+        self.module_name_set = frozenset(self.module_names)
+        self.type_name_set = frozenset(self.type_names)
+        self.mapping = ModuleTypeMapping(types_df)
+
+    def has_module(self, name):
+        return name in self.module_name_set
+
+    def has_rejection_type(self, name):
+        return name in self.type_name_set
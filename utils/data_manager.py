@@ -1,41 +1,180 @@
 import pandas as pd
+import io
 import os
+import threading
+from collections import OrderedDict
 from datetime import datetime
 import csv
+from utils.parquet_store import ParquetRejectionStore
+from utils.sqlite_store import SqliteStore
+from utils.segment_store import SegmentedRejectionStore, start_compactor
+from utils.day_index import DayOffsetIndex, read_until
+from utils.file_lock import locked
+from utils.rollup import DailyRollup, rollup_frame
+from utils.sketches import DailySketches
+from utils.catalog import Catalog
+from utils.group_commit import GroupCommitter
+from utils.dedup_index import DedupIndex, record_key
+from utils.record_index import RecordIndex
+from utils.archive import RejectionArchive
+from utils.validation import rejection_errors
+from utils.query import normalize_filters, normalize_spec, query_key, needs_rows, filter_mask, aggregate, uses_sketches, sketch_aggregate, SKETCH_METRICS
+from utils.rejection_csv import REJECTION_COLUMNS, DATE_FORMAT, parse_rejection_rows, concat_rejections, iter_rejection_rows
+
+# Process-wide cache of parsed rejection frames, shared by every session and
+# keyed by the absolute path of the rejections file
+_rejections_cache = {}
+_rejections_cache_lock = threading.Lock()
+
+# Generation counters bumped by in-process writes, keyed like the cache
+_rejections_generation = {}
+
+# Group committers per rejection store: (storage, data dir) -> GroupCommitter
+_committers = {}
+_committers_lock = threading.Lock()
+
+# Memoized query results shared by every session, least recently used first:
+# (store key, data version, query key) -> {name: frame}
+_query_cache = OrderedDict()
+_query_cache_lock = threading.Lock()
+QUERY_CACHE_SIZE = 256
+
+# Catalog snapshots per data store: key -> (file version, Catalog)
+_catalog_cache = {}
+_catalog_cache_lock = threading.Lock()
 
 class DataManager:
-    def __init__(self):
-        self.data_dir = "data"
+    def __init__(self, storage=None, retention_months=None, data_dir=None):
+        # Each plant or business unit may keep its own data directory (see utils.shards)
+        self.data_dir = data_dir or "data"
         self.rejections_file = os.path.join(self.data_dir, "rejections.csv")
+        self.rejections_dir = os.path.join(self.data_dir, "rejections")
+        self.segments_dir = os.path.join(self.data_dir, "segments")
         self.types_file = os.path.join(self.data_dir, "rejection_types.csv")
         self.modules_file = os.path.join(self.data_dir, "modules.csv")
+        self.db_file = os.path.join(self.data_dir, "qrms.db")
+        self.archive_dir = os.path.join(self.data_dir, "archive")
+        # Keys of records stored with a batch or dedup ID, so resubmissions are skipped
+        self.dedup_index = DedupIndex(os.path.join(self.data_dir, "dedup.keys"))
+        
+        # Held by every rejection write and by rebuilds of derived indexes
+        self.lock_file = os.path.join(self.data_dir, "rejections.lock")
+        # Held by every module and rejection type write
+        self.catalog_lock_file = os.path.join(self.data_dir, "catalog.lock")
+        self.day_index = DayOffsetIndex(self.rejections_file, self.lock_file)
+        
+        # Rejection storage backend: "csv" (default), "parquet", "sqlite" or "segments"
+        self.storage = storage or os.getenv("QRMS_STORAGE", "csv")
+        
+        # Rows older than this many whole months move to the cold archive; 0 keeps everything hot
+        if retention_months is None:
+            retention_months = int(os.getenv("QRMS_RETENTION_MONTHS", "0"))
+        self.retention_months = retention_months
+        self.archive = RejectionArchive(self.archive_dir)
         
         # Ensure data directory exists
         os.makedirs(self.data_dir, exist_ok=True)
         
         # Initialize files if they don't exist
         self._initialize_files()
+        
+        self.rejection_store = None
+        self.sqlite_store = None
+        if self.storage == "parquet":
+            self.rejection_store = ParquetRejectionStore(self.rejections_dir)
+        elif self.storage == "sqlite":
+            # SQLite also holds the module and rejection type catalog
+            self.sqlite_store = SqliteStore(self.db_file)
+            self.rejection_store = self.sqlite_store
+        elif self.storage == "segments":
+            self.rejection_store = SegmentedRejectionStore(self.segments_dir, self.lock_file)
+            start_compactor(self.rejection_store)
+        
+        # SQLite aggregates with indexed SQL; the file backends keep a daily rollup
+        self.rollup = None
+        if self.storage == "parquet":
+            self.rollup = DailyRollup(os.path.join(self.rejections_dir, "_rollup.csv"))
+        elif self.storage == "segments":
+            self.rollup = DailyRollup(os.path.join(self.segments_dir, "_rollup.csv"))
+        elif self.sqlite_store is None:
+            self.rollup = DailyRollup(os.path.join(self.data_dir, "rejections_rollup.csv"))
+        # Top reasons and distinct operators and reasons per day, beside the rollup
+        self.sketches = None
+        if self.rollup is not None:
+            self.sketches = DailySketches(os.path.splitext(self.rollup.path)[0] + "_sketches.jsonl")
+        
+        # SQLite rows carry their own IDs; the file backends number records in a sidecar index
+        self.record_index = None if self.sqlite_store is not None else RecordIndex(os.path.join(self.data_dir, "records"))
+    
+    def _catalog_version(self):
+        """Return a token that changes whenever the module/type catalog changes"""
+        if self.sqlite_store is not None:
+            # Rejection inserts change the database file too; only catalog writes bump this counter
+            return self.sqlite_store.catalog_version()
+        version = []
+        for path in [self.modules_file, self.types_file]:
+            try:
+                stat = os.stat(path)
+                version.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                version.append(None)
+        return tuple(version)
+    
+    def _catalog_key(self):
+        """Key identifying this catalog in the process-wide cache"""
+        return os.path.abspath(self.db_file if self.sqlite_store is not None else self.data_dir)
+    
+    def get_catalog(self):
+        """Get the cached catalog snapshot, rebuilding it when another process changed the files"""
+        key = self._catalog_key()
+        version = self._catalog_version()
+        with _catalog_cache_lock:
+            cached = _catalog_cache.get(key)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+        
+        return self._install_catalog(self._read_modules(), self._read_rejection_types(), version)
+    
+    def _install_catalog(self, modules_df, types_df, version=None):
+        """Publish a new catalog snapshot with the next version number"""
+        if version is None:
+            version = self._catalog_version()
+        key = self._catalog_key()
+        with _catalog_cache_lock:
+            cached = _catalog_cache.get(key)
+            number = cached[1].version + 1 if cached is not None else 1
+            catalog = Catalog(modules_df, types_df, number)
+            _catalog_cache[key] = (version, catalog)
+        return catalog
+    
+    def get_module_type_mapping(self):
+        """Get the cached module <-> rejection type mapping for the current catalog"""
+        return self.get_catalog().mapping
     
     def get_rejection_types_for_module(self, module_name):
         """Get rejection types that are mapped to a specific module"""
         try:
-            types_df = self.load_rejection_types()
-            if types_df.empty:
-                return []
-            
-            # Filter types that have this module in their mapped_modules
-            applicable_types = []
-            for _, row in types_df.iterrows():
-                mapped_modules = str(row.get('mapped_modules', '')).split(',')
-                mapped_modules = [m.strip() for m in mapped_modules if m.strip()]
-                if module_name in mapped_modules:
-                    applicable_types.append(row['name'])
-            
-            return applicable_types
+            return self.get_module_type_mapping().types_for_module(module_name)
         except Exception as e:
             print(f"Error getting rejection types for module: {str(e)}")
             return []
     
+    def get_modules_for_rejection_type(self, rejection_type):
+        """Get modules that a rejection type is mapped to"""
+        try:
+            return set(self.get_module_type_mapping().modules_for_type(rejection_type))
+        except Exception as e:
+            print(f"Error getting modules for rejection type: {str(e)}")
+            return set()
+    
+    def is_valid_module_type(self, module_name, rejection_type):
+        """Check whether a rejection type is mapped to a module"""
+        try:
+            return self.get_module_type_mapping().is_valid(module_name, rejection_type)
+        except Exception as e:
+            print(f"Error checking module/rejection type mapping: {str(e)}")
+            return False
+    
     def _initialize_files(self):
         """Initialize CSV files with headers if they don't exist"""
         
@@ -60,62 +199,493 @@ class DataManager:
                 writer = csv.writer(f)
                 writer.writerow(modules_headers)
     
-    def load_rejections(self):
-        """Load rejection data from CSV"""
-        try:
-            df = pd.read_csv(self.rejections_file)
+    def _rejections_key(self):
+        """Key identifying this rejections file in the process-wide cache"""
+        return os.path.abspath(self.rejections_file)
+    
+    def get_data_version(self):
+        """Return a token that changes whenever the rejections file changes"""
+        stat = os.stat(self.rejections_file)
+        generation = _rejections_generation.get(self._rejections_key(), 0)
+        return (stat.st_mtime_ns, stat.st_size, generation)
+    
+    def _bump_generation(self):
+        """Mark the cached rejections as stale after an in-process write"""
+        key = self._rejections_key()
+        with _rejections_cache_lock:
+            _rejections_generation[key] = _rejections_generation.get(key, 0) + 1
+    
+    def _read_rejections_file(self, cached=None):
+        """Parse rejection rows, only reading bytes appended since the cached parse"""
+        with open(self.rejections_file, 'rb') as f:
+            header = f.readline()
+            if not header.strip():
+                return {'df': pd.DataFrame(columns=REJECTION_COLUMNS), 'offset': 0, 'header': b'', 'mark': b''}
+            header_key = header.rstrip(b'\r\n')
+            size = os.fstat(f.fileno()).st_size
+            
+            # Append-only growth with the same header: parse just the tail.
+            # A shrunk file, a changed header or different bytes just before
+            # the old offset mean the file was rewritten.
+            incremental = (
+                cached is not None
+                and cached['header'] == header_key
+                and cached['offset'] <= size
+                and self._read_mark(f, cached['offset']) == cached['mark']
+            )
+            start = cached['offset'] if incremental else len(header)
+            f.seek(start)
+            data = f.read()
+            
+            # Leave a partially written last line for the next refresh
+            complete = data[:data.rfind(b'\n') + 1]
+            offset = start + len(complete)
+            mark = self._read_mark(f, offset)
+        
+        columns = next(csv.reader([header.decode('utf-8')]))
+        result = {'offset': offset, 'header': header_key, 'mark': mark}
+        
+        if incremental:
+            try:
+                new_rows = parse_rejection_rows(complete, columns)
+            except (ValueError, pd.errors.ParserError):
+                return self._read_rejections_file()
+            df = cached['df']
+            if not new_rows.empty:
+                df = concat_rejections([df, new_rows])
+            result['df'] = df
+            return result
+        
+        result['df'] = parse_rejection_rows(complete, columns)
+        return result
+    
+    def _read_mark(self, f, offset, length=64):
+        """Read the bytes just before an offset to detect in-place rewrites"""
+        start = max(0, offset - length)
+        f.seek(start)
+        return f.read(offset - start)
+    
+    def load_rejections(self, start_date=None, end_date=None, module=None, rejection_type=None, include_archive=None):
+        """Load rejection data, optionally limited to an inclusive date range, module and type.
+        
+        Archived rows are merged in when the range has no start or starts
+        inside the archive; include_archive=True always reads the archive
+        and False never does.
+        """
+        df = self._load_hot_rejections(start_date, end_date, module, rejection_type)
+        if self._reads_archive(start_date, include_archive):
+            cold = self._filter_rejections(self.archive.load(start_date, end_date), module, rejection_type)
+            df = concat_rejections([cold, df])
+        return df
+    
+    def _reads_archive(self, start_date, include_archive=None):
+        if include_archive is None:
+            return self.archive.reaches(start_date)
+        return include_archive
+    
+    def _filter_rejections(self, df, module=None, rejection_type=None):
+        if not df.empty and module is not None:
+            df = df[df['module'] == module]
+        if not df.empty and rejection_type is not None:
+            df = df[df['rejection_type'] == rejection_type]
+        return df
+    
+    def _load_hot_rejections(self, start_date=None, end_date=None, module=None, rejection_type=None):
+        """Load rejections from the configured storage backend"""
+        if self.sqlite_store is not None:
+            return self.sqlite_store.load(start_date, end_date, module, rejection_type)
+        
+        if self.rejection_store is not None:
+            df = self.rejection_store.load(start_date, end_date)
+        else:
+            df = self._load_csv_rejections(start_date, end_date)
+        return self._filter_rejections(df, module, rejection_type)
+    
+    def iter_rejections(self, start_date=None, end_date=None, module=None, rejection_type=None, chunksize=50000, include_archive=None):
+        """Yield rejection rows matching the filters in chunks, streaming from storage; archive as in load_rejections"""
+        if self._reads_archive(start_date, include_archive):
+            for df in self.archive.iter_chunks(start_date, end_date, chunksize):
+                df = self._filter_rejections(df, module, rejection_type)
+                if not df.empty:
+                    yield df
+        
+        if self.sqlite_store is not None:
+            yield from self.sqlite_store.iter_chunks(start_date, end_date, module, rejection_type, chunksize)
+            return
+        
+        if self.rejection_store is not None:
+            chunks = self.rejection_store.iter_chunks(start_date, end_date, chunksize)
+        else:
+            chunks = self._iter_csv_chunks(start_date, end_date, chunksize)
+        
+        for df in chunks:
+            df = self._filter_rejections(df, module, rejection_type)
             if not df.empty:
-                df['date'] = pd.to_datetime(df['date'])
-            return df
-        except (FileNotFoundError, pd.errors.EmptyDataError):
-            return pd.DataFrame(columns=['date', 'module', 'rejection_type', 'quantity', 'reason', 'operator', 'shift'])
+                yield df
+    
+    def _iter_csv_chunks(self, start_date=None, end_date=None, chunksize=50000):
+        """Stream CSV rejections in a date range without parsing the whole file at once"""
+        start_date = pd.to_datetime(start_date) if start_date is not None else None
+        end_date = pd.to_datetime(end_date) if end_date is not None else None
+        
+        # Rows already parsed in this process are sliced rather than read again
+        if self._rejections_key() in _rejections_cache:
+            df = self._load_csv_rejections(start_date, end_date)
+            for start in range(0, len(df), chunksize):
+                yield df.iloc[start:start + chunksize]
+            return
+        
+        byte_range = None
+        if start_date is not None or end_date is not None:
+            try:
+                byte_range = self.day_index.byte_range(start_date, end_date)
+            except (OSError, ValueError) as e:
+                print(f"Error reading rejections day index: {str(e)}")
+        
+        try:
+            f = open(self.rejections_file, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            columns = next(csv.reader([f.readline().decode('utf-8')]))
+            rows = f
+            if byte_range is not None:
+                if byte_range[0] == byte_range[1]:
+                    return
+                f.seek(byte_range[0])
+                # Nothing past the last run of the requested days can match
+                if byte_range[1] is not None:
+                    rows = read_until(f, byte_range[1])
+            for df in iter_rejection_rows(rows, columns, chunksize):
+                if start_date is not None:
+                    df = df[df['date'] >= start_date]
+                if end_date is not None:
+                    df = df[df['date'] <= end_date]
+                if not df.empty:
+                    yield df
+    
+    def _load_csv_rejections(self, start_date=None, end_date=None):
+        """Load CSV rejections in a date range from the shared cache or, when cold, by seeking"""
+        start_date = pd.to_datetime(start_date) if start_date is not None else None
+        end_date = pd.to_datetime(end_date) if end_date is not None else None
+        
+        # Without a parsed copy in this process, read just the requested days
+        df = None
+        if (start_date is not None or end_date is not None) and self._rejections_key() not in _rejections_cache:
+            df = self._load_rejection_range(start_date, end_date)
+        if df is None:
+            df = self._load_cached_rejections()
+        
+        if not df.empty and start_date is not None:
+            df = df[df['date'] >= start_date]
+        if not df.empty and end_date is not None:
+            df = df[df['date'] <= end_date]
+        return df
+    
+    def _load_rejection_range(self, start_date, end_date):
+        """Parse only the byte range of the requested days using the day index"""
+        try:
+            byte_range = self.day_index.byte_range(start_date, end_date)
+            if byte_range is None:
+                return None
+            start, end = byte_range
+            with open(self.rejections_file, 'rb') as f:
+                header = f.readline()
+                if start == end:
+                    data = b''
+                else:
+                    f.seek(start)
+                    data = f.read() if end is None else f.read(end - start)
+            data = data[:data.rfind(b'\n') + 1]
+            columns = next(csv.reader([header.decode('utf-8')]))
+            return parse_rejection_rows(data, columns)
+        except (OSError, ValueError, pd.errors.ParserError) as e:
+            print(f"Error reading rejections by day index: {str(e)}")
+            return None
+    
+    def _load_cached_rejections(self):
+        """Load all CSV rejections, reusing the shared parsed copy while the file is unchanged"""
+        try:
+            version = self.get_data_version()
+        except FileNotFoundError:
+            return pd.DataFrame(columns=REJECTION_COLUMNS)
+        
+        key = self._rejections_key()
+        with _rejections_cache_lock:
+            cached = _rejections_cache.get(key)
+            if cached is None or cached['version'] != version:
+                # The version is taken before parsing, so a write racing the
+                # parse only costs one extra reload and never serves stale rows
+                cached = self._read_rejections_file(cached)
+                cached['version'] = version
+                _rejections_cache[key] = cached
+        
+        # Shallow copy so callers adding columns never touch the shared frame
+        return cached['df'].copy(deep=False)
+    
+    def _ensure_trailing_newline(self, path):
+        """Terminate the last line of a CSV file so appended rows start on their own line"""
+        with open(path, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.write(b'\r\n')
     
     def load_rejection_types(self):
-        """Load rejection types from CSV"""
+        """Load rejection types from the cached catalog"""
+        return self.get_catalog().rejection_types.copy(deep=False)
+    
+    def load_modules(self):
+        """Load modules from the cached catalog"""
+        return self.get_catalog().modules.copy(deep=False)
+    
+    def _read_rejection_types(self):
+        """Read rejection types from storage"""
+        if self.sqlite_store is not None:
+            return self.sqlite_store.load_rejection_types()
         try:
             df = pd.read_csv(self.types_file)
             return df
         except (FileNotFoundError, pd.errors.EmptyDataError):
             return pd.DataFrame(columns=['name', 'description', 'created_date'])
     
-    def load_modules(self):
-        """Load modules from CSV"""
+    def _read_modules(self):
+        """Read modules from storage"""
+        if self.sqlite_store is not None:
+            return self.sqlite_store.load_modules()
         try:
             df = pd.read_csv(self.modules_file)
             return df
         except (FileNotFoundError, pd.errors.EmptyDataError):
             return pd.DataFrame(columns=['name', 'description', 'created_date'])
     
+    def _write_catalog_file(self, path, df):
+        """Replace a catalog CSV via temp-file-and-rename so readers never see a partial file"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+            df.to_csv(f, index=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    
     def add_rejection(self, module, rejection_type, quantity, reason, operator, shift):
         """Add a new rejection record"""
+        success, message = self.add_rejections([{
+            'module': module,
+            'rejection_type': rejection_type,
+            'quantity': quantity,
+            'reason': reason,
+            'operator': operator,
+            'shift': shift
+        }], validate_mapping=False)
+        if success:
+            return True, "Rejection record added successfully"
+        return False, message
+    
+    def _normalize_rejection(self, record, now):
+        """Build a storable rejection record, defaulting the date to now"""
+        date = record.get('date')
+        if date is None or (not isinstance(date, str) and pd.isna(date)) or date == '':
+            date = now
+        else:
+            # Any accepted ISO 8601 form is stored in the one format every backend reads back
+            date = pd.Timestamp(date).strftime(DATE_FORMAT)
+        return {
+            'date': date,
+            'module': record.get('module'),
+            'rejection_type': record.get('rejection_type'),
+            'quantity': record.get('quantity'),
+            'reason': record.get('reason'),
+            'operator': record.get('operator'),
+            'shift': record.get('shift')
+        }
+    
+    def validate_rejections(self, records, validate_mapping=True):
+        """Validate rejection records; returns a list of error messages"""
+        mapping = self.get_module_type_mapping() if validate_mapping else None
+        errors = rejection_errors(pd.DataFrame.from_records(list(records)), mapping)
+        return [f"Record {idx + 1}: {message}" for idx, message in enumerate(errors) if message]
+    
+    def add_rejections(self, records, validate_mapping=True, batch_id=None, batch_key=None):
+        """Add a batch of rejection records in one write; either all are stored or none.
+        
+        batch_id is a client-generated ID of this submission: sending the same
+        submission again, e.g. after a timeout or a double click, stores
+        nothing new. batch_key does the same with a single stored key for the
+        whole batch, for callers that name a batch by where it came from.
+        Otherwise records carrying their own 'dedup_id' are deduplicated one
+        by one; other records are always stored.
+        """
         try:
-            new_record = {
-                'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'module': module,
-                'rejection_type': rejection_type,
-                'quantity': quantity,
-                'reason': reason,
-                'operator': operator,
-                'shift': shift
-            }
+            records = list(records)
+            if not records:
+                return False, "No rejection records to add"
             
-            # Append to CSV
-            with open(self.rejections_file, 'a', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=new_record.keys())
-                writer.writerow(new_record)
+            errors = self.validate_rejections(records, validate_mapping=validate_mapping)
+            if errors:
+                return False, "Invalid rejection records: " + "; ".join(errors)
             
-            return True, "Rejection record added successfully"
+            # Keys describe the records as the client sent them, before dates are defaulted
+            if batch_key:
+                keys = batch_key
+            elif batch_id:
+                keys = [record_key(record, batch_id, idx) for idx, record in enumerate(records)]
+            else:
+                keys = [record_key(record, record['dedup_id']) if record.get('dedup_id') else None for record in records]
+            
+            now = datetime.now().strftime(DATE_FORMAT)
+            new_records = [self._normalize_rejection(record, now) for record in records]
+            for record in new_records:
+                record['quantity'] = int(float(record['quantity']))
+            
+            # Concurrent callers share one write and one fsync
+            written, skipped = self._get_committer().submit((new_records, keys))
+            if not skipped:
+                return True, f"{written} rejection records added successfully"
+            if not written:
+                return True, f"Already submitted: all {skipped} rejection records were stored earlier"
+            return True, f"{written} rejection records added successfully; {skipped} already submitted records skipped"
+        except Exception as e:
+            return False, f"Error adding rejections: {str(e)}"
+    
+    def _get_committer(self):
+        """Get the process-wide group committer for this rejection store"""
+        key = (self.storage, os.path.abspath(self.data_dir))
+        with _committers_lock:
+            if key not in _committers:
+                _committers[key] = GroupCommitter(self._commit_batches)
+            return _committers[key]
+    
+    def _commit_batches(self, batches):
+        """Durably write several callers' batches together under the inter-process lock.
+        
+        Each batch is (records, dedup keys); returns (written, skipped) per batch.
+        Keys are one per record, or a single key string covering the whole batch.
+        """
+        with locked(self.lock_file):
+            records, new_keys, results = self._drop_repeats(batches)
+            if records:
+                self._append_rejections(records)
+            # Keys follow the rows: a crash in between can store a repeat but never lose a record
+            try:
+                self.dedup_index.add(new_keys)
+            except Exception as e:
+                # The rows are stored; only a resubmission of them could now be stored twice
+                print(f"Error recording dedup keys: {str(e)}")
+        
+        if records and self.sqlite_store is None:
+            self._bump_generation()
+        return results
+    
+    def _drop_repeats(self, batches):
+        """Remove records whose key is already stored or repeats earlier in this commit"""
+        keyed = [key for _, keys in batches for key in ([keys] if isinstance(keys, str) else keys) if key is not None]
+        stored = iter(self.dedup_index.contains(keyed)) if keyed else iter(())
+        seen = set()
+        records, new_keys, results = [], [], []
+        for batch, keys in batches:
+            if isinstance(keys, str):
+                # One key for the whole batch: all of it is stored or none
+                if next(stored) or keys in seen:
+                    results.append((0, len(batch)))
+                    continue
+                seen.add(keys)
+                new_keys.append(keys)
+                records.extend(batch)
+                results.append((len(batch), 0))
+                continue
+            written = 0
+            for record, key in zip(batch, keys):
+                if key is not None:
+                    if next(stored) or key in seen:
+                        continue
+                    seen.add(key)
+                    new_keys.append(key)
+                records.append(record)
+                written += 1
+            results.append((written, len(batch) - written))
+        return records, new_keys, results
+    
+    def _append_rejections(self, records):
+        """Append rows to the configured backend; the caller holds the write lock"""
+        if self.sqlite_store is not None:
+            # One transaction
+            self.sqlite_store.append(records)
+            return
+        
+        if self.rejection_store is not None:
+            self.rejection_store.append(records)
+        else:
+            self._append_csv_rejections(records)
+        
+        # The rows are stored now; a derived index that misses them is dropped, never reported as a failed write
+        try:
+            self.rollup.record(records)
+        except Exception as e:
+            self._drop_stale_index("rollup", self.rollup.path, e)
+        
+        try:
+            self.sketches.record(records)
+        except Exception as e:
+            self._drop_stale_index("sketches", self.sketches.path, e)
+        
+        try:
+            self.record_index.record(records)
         except Exception as e:
-            return False, f"Error adding rejection: {str(e)}"
+            # Records are renumbered by the rebuild
+            self._drop_stale_index("record index", self.record_index.rows_path, e)
+    
+    def _drop_stale_index(self, name, path, error):
+        """Remove a derived index that missed an append, so it is rebuilt from the raw rows"""
+        print(f"Error updating {name}, scheduling rebuild: {str(error)}")
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            print(f"Error removing stale {name}: {str(e)}")
+    
+    def _append_csv_rejections(self, records):
+        """Append rows to the CSV with one buffered write and one fsync, rolling back on failure"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        chunks = []
+        day_starts = []
+        size = 0
+        for record in records:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow([record[column] for column in REJECTION_COLUMNS])
+            row = buffer.getvalue().encode('utf-8')
+            day = record['date'][:10]
+            if not day_starts or day_starts[-1][0] != day:
+                day_starts.append((day, size))
+            chunks.append(row)
+            size += len(row)
+        payload = b''.join(chunks)
+        
+        self._ensure_trailing_newline(self.rejections_file)
+        with open(self.rejections_file, 'ab') as f:
+            start = f.tell()
+            try:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            except OSError:
+                # Never leave half a batch behind
+                f.truncate(start)
+                raise
+        
+        try:
+            for day, offset in day_starts:
+                self.day_index.record(day, start + offset)
+        except Exception as e:
+            self._drop_stale_index("day index", self.day_index.index_path, e)
     
     def add_rejection_type(self, name, description, mapped_modules):
         """Add a new rejection type with mapped modules"""
         try:
-            # Check if type already exists
-            existing_types = self.load_rejection_types()
-            if not existing_types.empty and name in existing_types['name'].values:
-                return False, "Rejection type already exists"
-            
             # Convert modules list to comma-separated string
             modules_str = ",".join(mapped_modules) if isinstance(mapped_modules, list) else mapped_modules
             
@@ -126,10 +696,19 @@ class DataManager:
                 'created_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             }
             
-            # Append to CSV
-            with open(self.types_file, 'a', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=new_type.keys())
-                writer.writerow(new_type)
+            with locked(self.catalog_lock_file):
+                catalog = self.get_catalog()
+                if catalog.has_rejection_type(name):
+                    return False, "Rejection type already exists"
+                
+                if self.sqlite_store is not None:
+                    if not self.sqlite_store.add_rejection_type(new_type):
+                        return False, "Rejection type already exists"
+                    self._install_catalog(catalog.modules, self._read_rejection_types())
+                else:
+                    df = pd.concat([catalog.rejection_types, pd.DataFrame([new_type])], ignore_index=True)
+                    self._write_catalog_file(self.types_file, df)
+                    self._install_catalog(catalog.modules, df)
             
             return True, "Rejection type added successfully"
         except Exception as e:
@@ -138,21 +717,25 @@ class DataManager:
     def add_module(self, name, description):
         """Add a new module"""
         try:
-            # Check if module already exists
-            existing_modules = self.load_modules()
-            if not existing_modules.empty and name in existing_modules['name'].values:
-                return False, "Module already exists"
-            
             new_module = {
                 'name': name,
                 'description': description,
                 'created_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             }
             
-            # Append to CSV
-            with open(self.modules_file, 'a', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=new_module.keys())
-                writer.writerow(new_module)
+            with locked(self.catalog_lock_file):
+                catalog = self.get_catalog()
+                if catalog.has_module(name):
+                    return False, "Module already exists"
+                
+                if self.sqlite_store is not None:
+                    if not self.sqlite_store.add_module(new_module):
+                        return False, "Module already exists"
+                    self._install_catalog(self._read_modules(), catalog.rejection_types)
+                else:
+                    df = pd.concat([catalog.modules, pd.DataFrame([new_module])], ignore_index=True)
+                    self._write_catalog_file(self.modules_file, df)
+                    self._install_catalog(df, catalog.rejection_types)
             
             return True, "Module added successfully"
         except Exception as e:
@@ -161,13 +744,20 @@ class DataManager:
     def delete_rejection_type(self, name):
         """Delete a rejection type"""
         try:
-            df = self.load_rejection_types()
-            if df.empty or name not in df['name'].values:
-                return False, "Rejection type not found"
-            
-            # Remove the type and save
-            df = df[df['name'] != name]
-            df.to_csv(self.types_file, index=False)
+            with locked(self.catalog_lock_file):
+                catalog = self.get_catalog()
+                if not catalog.has_rejection_type(name):
+                    return False, "Rejection type not found"
+                
+                if self.sqlite_store is not None:
+                    if not self.sqlite_store.delete_rejection_type(name):
+                        return False, "Rejection type not found"
+                    self._install_catalog(catalog.modules, self._read_rejection_types())
+                else:
+                    # Remove the type and save
+                    df = catalog.rejection_types[catalog.rejection_types['name'] != name]
+                    self._write_catalog_file(self.types_file, df)
+                    self._install_catalog(catalog.modules, df)
             
             return True, "Rejection type deleted successfully"
         except Exception as e:
@@ -176,13 +766,20 @@ class DataManager:
     def delete_module(self, name):
         """Delete a module"""
         try:
-            df = self.load_modules()
-            if df.empty or name not in df['name'].values:
-                return False, "Module not found"
-            
-            # Remove the module and save
-            df = df[df['name'] != name]
-            df.to_csv(self.modules_file, index=False)
+            with locked(self.catalog_lock_file):
+                catalog = self.get_catalog()
+                if not catalog.has_module(name):
+                    return False, "Module not found"
+                
+                if self.sqlite_store is not None:
+                    if not self.sqlite_store.delete_module(name):
+                        return False, "Module not found"
+                    self._install_catalog(self._read_modules(), catalog.rejection_types)
+                else:
+                    # Remove the module and save
+                    df = catalog.modules[catalog.modules['name'] != name]
+                    self._write_catalog_file(self.modules_file, df)
+                    self._install_catalog(df, catalog.rejection_types)
             
             return True, "Module deleted successfully"
         except Exception as e:
@@ -191,26 +788,307 @@ class DataManager:
     def get_rejection_summary(self, start_date=None, end_date=None):
         """Get rejection summary for email reports"""
         try:
-            df = self.load_rejections()
-            if df.empty:
-                return None
+            if not (start_date and end_date):
+                start_date, end_date = None, None
             
-            # Filter by date if provided
-            if start_date and end_date:
-                df = df[(df['date'] >= start_date) & (df['date'] <= end_date)]
-            
-            if df.empty:
+            results = self.query_many({'start_date': start_date, 'end_date': end_date}, {
+                'totals': {'metrics': ['count', 'quantity']},
+                'by_module': {'group_by': 'module', 'metrics': ['quantity']},
+                'by_type': {'group_by': 'rejection_type', 'metrics': ['quantity']},
+                'recent': {'latest': 5}
+            })
+            totals = results['totals'].iloc[0]
+            if totals['count'] == 0:
                 return None
             
             summary = {
-                'total_rejections': len(df),
-                'total_quantity': df['quantity'].sum(),
-                'by_module': df.groupby('module')['quantity'].sum().to_dict(),
-                'by_type': df.groupby('rejection_type')['quantity'].sum().to_dict(),
-                'recent_records': df.nlargest(5, 'date').to_dict('records')
+                'total_rejections': int(totals['count']),
+                'total_quantity': totals['quantity'],
+                'by_module': dict(zip(results['by_module']['module'], results['by_module']['quantity'])),
+                'by_type': dict(zip(results['by_type']['rejection_type'], results['by_type']['quantity'])),
+                'recent_records': results['recent'].to_dict('records')
             }
             
             return summary
         except Exception as e:
             print(f"Error generating summary: {str(e)}")
             return None
+    
+    def _latest_rows_start(self, rollup, start_date, n):
+        """First day worth reading to find the newest n rows, judged from the rollup"""
+        if rollup.empty:
+            return start_date
+        daily_counts = rollup.groupby('day')['count'].sum().sort_index(ascending=False)
+        covered = daily_counts.cumsum()
+        enough = covered[covered >= n]
+        first_day = enough.index[0] if not enough.empty else daily_counts.index[-1]
+        if start_date is not None:
+            first_day = max(first_day, pd.Timestamp(start_date))
+        return first_day
+    
+    def _is_whole_days(self, start_date, end_date):
+        """Whether a date range covers whole days, so the daily rollup can answer it"""
+        if start_date is not None:
+            start = pd.Timestamp(start_date)
+            if start != start.normalize():
+                return False
+        if end_date is not None:
+            # Rows carry second resolution, so 23:59:59 already closes the day
+            end = pd.Timestamp(end_date)
+            if end.normalize() + pd.Timedelta(days=1) - end > pd.Timedelta(seconds=1):
+                return False
+        return True
+    
+    def rebuild_rollup(self):
+        """Rebuild the daily rollup from the raw rejection rows"""
+        if self.rollup is None:
+            raise RuntimeError("SQLite storage has no daily rollup; it aggregates in SQL")
+        with locked(self.lock_file):
+            return len(self.rollup.rebuild(self.load_rejections(include_archive=True)))
+    
+    def rebuild_record_index(self):
+        """Renumber every stored record, archived ones first, and rebuild the secondary indexes"""
+        if self.record_index is None:
+            raise RuntimeError("SQLite storage has no record index; rows carry their own IDs")
+        with locked(self.lock_file):
+            return self.record_index.rebuild(self.iter_rejections(include_archive=True))
+    
+    def get_record_index(self):
+        """The record index, built from the raw rows on first use"""
+        if self.record_index is None:
+            raise RuntimeError("SQLite storage has no record index; rows carry their own IDs")
+        if not self.record_index.exists():
+            with locked(self.lock_file):
+                if not self.record_index.exists():
+                    self.record_index.rebuild(self.iter_rejections(include_archive=True))
+        return self.record_index
+    
+    def find_records(self, filters=None):
+        """Rejection records matching filters, with their record IDs, oldest ID first.
+        
+        filters are those of query_many. Operator, shift and module filters
+        are answered from posting lists of record IDs, without scanning rows.
+        """
+        filters = normalize_filters(filters)
+        if self.sqlite_store is not None:
+            return self.sqlite_store.find(filters)
+        return self.get_record_index().find(filters)
+    
+    def search_reasons(self, query, filters=None, limit=50):
+        """Search rejection reasons for every word of query, each matched as a word prefix.
+        
+        "crack near weld" matches "Cracks near the weld seam". filters are
+        those of query_many. Returns a dict with the number of matching
+        records, their total quantity, 'by_reason' (reason, count, quantity;
+        most frequent first) and the newest limit matching 'records'.
+        """
+        filters = normalize_filters(filters)
+        if self.sqlite_store is not None:
+            return self.sqlite_store.search_reasons(query, filters, limit)
+        return self.get_record_index().search_reasons(query, filters, limit)
+    
+    def get_record(self, record_id):
+        """One rejection record by ID as a dict, or None if there is no such record"""
+        if self.sqlite_store is not None:
+            df = self.sqlite_store.get([record_id])
+        else:
+            df = self.get_record_index().get([record_id])
+        if df.empty:
+            return None
+        return df.iloc[0].to_dict()
+    
+    def retention_cutoff(self):
+        """Start of the oldest month kept hot, or None when retention is disabled"""
+        if self.retention_months <= 0:
+            return None
+        first_of_month = pd.Timestamp.now().normalize().replace(day=1)
+        return first_of_month - pd.DateOffset(months=self.retention_months)
+    
+    def apply_retention(self):
+        """Move rows older than the retention window from the hot store into monthly archives"""
+        cutoff = self.retention_cutoff()
+        if cutoff is None:
+            return True, "Retention is disabled"
+        try:
+            with locked(self.lock_file):
+                if self.rejection_store is not None:
+                    moved = self.rejection_store.archive_before(cutoff, self.archive.add)
+                else:
+                    moved = self._archive_csv_rejections(cutoff)
+                # The rollup and sketches keep covering archived rows, as do queries with no start date
+                self._bump_generation()
+            return True, f"Archived {moved} rejection records older than {cutoff.strftime('%Y-%m-%d')}"
+        except Exception as e:
+            return False, f"Error applying retention: {str(e)}"
+    
+    def _archive_csv_rejections(self, cutoff):
+        """Archive CSV rows dated before cutoff and rewrite the hot file without them"""
+        df = self._load_cached_rejections()
+        if df.empty:
+            return 0
+        expired = df['date'] < cutoff
+        if not expired.any():
+            return 0
+        self.archive.add(df[expired])
+        
+        # Archives are in place before the hot file drops the rows
+        tmp_path = self.rejections_file + ".tmp"
+        df[~expired][REJECTION_COLUMNS].to_csv(tmp_path, index=False, date_format=DATE_FORMAT)
+        os.replace(tmp_path, self.rejections_file)
+        self.day_index.build()
+        return int(expired.sum())
+    
+    def get_rollup(self, start_date=None, end_date=None, module=None, rejection_type=None):
+        """Get count and quantity per day, module, rejection type and shift.
+        
+        Whole-day ranges are answered from the persisted rollup; partial days
+        are aggregated from the raw rows.
+        """
+        if self.rollup is None or not self._is_whole_days(start_date, end_date):
+            return rollup_frame(self.load_rejections(start_date, end_date, module, rejection_type))
+        
+        if not self.rollup.exists():
+            self.rebuild_rollup()
+        rollup = self.rollup.query(start_date, end_date, module, rejection_type)
+        if self.rollup.needs_compaction():
+            with locked(self.lock_file):
+                self.rollup.compact()
+        return rollup
+    
+    def rebuild_sketches(self):
+        """Rebuild the daily top-K and distinct-count sketches from the raw rejection rows"""
+        if self.sketches is None:
+            raise RuntimeError("SQLite storage has no daily sketches; its queries stay exact")
+        with locked(self.lock_file):
+            return self.sketches.rebuild(self.iter_rejections(include_archive=True))
+    
+    def get_sketches(self, start_date=None, end_date=None):
+        """One sketch of top reasons and distinct operators and reasons over whole days in range"""
+        if self.sketches is None:
+            raise RuntimeError("SQLite storage has no daily sketches; its queries stay exact")
+        if not self.sketches.exists():
+            self.rebuild_sketches()
+        sketch = self.sketches.query(start_date, end_date)
+        if self.sketches.needs_compaction():
+            with locked(self.lock_file):
+                self.sketches.compact()
+        return sketch
+    
+    def get_rejection_stats(self, group_by, start_date=None, end_date=None, module=None, rejection_type=None):
+        """Get total quantity and entry count per value of a column, largest first"""
+        try:
+            filters = {'start_date': start_date, 'end_date': end_date, 'module': module, 'rejection_type': rejection_type}
+            stats = self.query(filters, group_by=group_by, metrics=['quantity', 'count'])
+            return stats.rename(columns={'count': 'total_entries'})
+        except Exception as e:
+            print(f"Error generating rejection statistics: {str(e)}")
+            return pd.DataFrame(columns=[group_by, 'quantity', 'total_entries'])
+    
+    def get_query_version(self):
+        """Return a token that changes whenever stored rejections change, in any process"""
+        if self.sqlite_store is not None:
+            paths = [self.db_file, self.db_file + "-wal"]
+        else:
+            # Every write to a file backend also updates the rollup
+            paths = [self.rollup.path]
+            if self.rejection_store is None:
+                paths.append(self.rejections_file)
+        paths.append(self.archive_dir)
+        
+        version = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                version.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                version.append(None)
+        version.append(_rejections_generation.get(self._rejections_key(), 0))
+        return tuple(version)
+    
+    def query(self, filters=None, group_by=None, metrics=None, top_n=None, order='desc'):
+        """Aggregate the rejections matching filters; see query_many"""
+        spec = {'group_by': group_by, 'metrics': metrics, 'top_n': top_n, 'order': order}
+        return self.query_many(filters, {'result': spec})['result']
+    
+    def query_many(self, filters=None, aggregations=None):
+        """Run several named aggregations over one filtered scan of the rejections.
+        
+        filters may hold start_date, end_date and values (or lists of values)
+        for module, rejection_type, shift and operator. Each aggregation is a
+        spec as described in utils.query.normalize_spec. Results are memoized
+        per data version and shared by every session.
+        """
+        filters = normalize_filters(filters)
+        specs = {name: normalize_spec(spec) for name, spec in (aggregations or {}).items()}
+        
+        # The version is taken before computing, so a racing write never leaves stale results behind
+        key = (self.storage, os.path.abspath(self.data_dir), self.get_query_version(), query_key(filters, specs))
+        with _query_cache_lock:
+            results = _query_cache.get(key)
+            if results is not None:
+                _query_cache.move_to_end(key)
+        
+        if results is None:
+            results = self._run_queries(filters, specs)
+            with _query_cache_lock:
+                _query_cache[key] = results
+                while len(_query_cache) > QUERY_CACHE_SIZE:
+                    _query_cache.popitem(last=False)
+        
+        # Copies so callers can reshape results without touching the shared ones
+        return {name: df.copy() for name, df in results.items()}
+    
+    def _run_queries(self, filters, specs):
+        """Answer query specs from SQL, the daily rollup or one scan of the raw rows"""
+        start_date = filters.get('start_date')
+        end_date = filters.get('end_date')
+        
+        # SQL aggregates only see the hot tier
+        if self.sqlite_store is not None and not self.archive.reaches(start_date):
+            return {name: self.sqlite_store.aggregate(filters, spec) for name, spec in specs.items()}
+        
+        use_rollup = self.rollup is not None and self._is_whole_days(start_date, end_date)
+        rollup_specs = {}
+        row_specs = {}
+        sketch_specs = {}
+        for name, spec in specs.items():
+            if use_rollup and uses_sketches(spec, filters):
+                sketch_specs[name] = spec
+                # The rollup answers the exact metrics of a totals spec
+                if not spec['group_by']:
+                    rollup_specs[name] = dict(spec, metrics=tuple(m for m in spec['metrics'] if m not in SKETCH_METRICS))
+            elif use_rollup and not needs_rows(spec, filters):
+                rollup_specs[name] = spec
+            else:
+                row_specs[name] = spec
+        
+        sketch = None
+        if sketch_specs:
+            sketch = self.get_sketches(start_date, end_date)
+            for name, spec in list(sketch_specs.items()):
+                if spec['group_by'] and not sketch.top_reasons.is_certain(spec['top_n']):
+                    # No reasons stand out from the long tail; rank them exactly from the rows
+                    row_specs[name] = sketch_specs.pop(name)
+        
+        results = {}
+        rollup = None
+        only_latest = row_specs and all('latest' in spec for spec in row_specs.values())
+        if rollup_specs or (use_rollup and only_latest and 'operator' not in filters):
+            rollup = self.get_rollup(start_date, end_date)
+            rollup = rollup[filter_mask(rollup, filters)]
+            results.update(aggregate(rollup, rollup_specs, is_rollup=True))
+        
+        if row_specs:
+            # Newest rows alone only need the latest days that hold them
+            row_start = start_date
+            if rollup is not None and only_latest:
+                row_start = self._latest_rows_start(rollup, start_date, max(spec['latest'] for spec in row_specs.values()))
+            df = self.load_rejections(row_start, end_date)
+            df = df[filter_mask(df, filters)]
+            results.update(aggregate(df, row_specs, is_rollup=False))
+        
+        if sketch_specs:
+            for name, spec in sketch_specs.items():
+                results[name] = sketch_aggregate(sketch, spec, results.get(name))
+        
+        return {name: results[name] for name in specs}
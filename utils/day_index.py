@@ -0,0 +1,166 @@
+import io
+import os
+import re
+import threading
+
+import numpy as np
+
+from utils.file_lock import locked
+
+DAY_PATTERN = re.compile(rb'^\d{4}-\d{2}-\d{2}')
+
+# Process-wide cache of parsed index files: path -> ((mtime_ns, size), (days, offsets))
+_index_cache = {}
+_index_cache_lock = threading.Lock()
+
+
+class _RangeReader(io.RawIOBase):
+    """Raw reader over a binary file that stops at a byte offset"""
+
+    def __init__(self, f, end):
+        self.f = f
+        self.end = end
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self.end - self.f.tell())
+        if size <= 0:
+            return 0
+        data = self.f.read(size)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def read_until(f, end):
+    """Buffered reader over f from its current position up to byte offset end"""
+    return io.BufferedReader(_RangeReader(f, end))
+
+
+class DayOffsetIndex:
+    """Sidecar index of the byte offsets where runs of same-day rows start in an append-only CSV.
+
+    Rows appended in day order give one run per day. Rows appended out of
+    order, e.g. by a historical import, just start new runs, so a range
+    read covers every run of its days and whatever lies between them.
+    """
+
+    def __init__(self, csv_path, lock_file):
+        self.csv_path = csv_path
+        self.index_path = csv_path + ".idx"
+        # Held by every append, so a build never misses rows written during its scan
+        self.lock_file = lock_file
+
+    def _read(self):
+        """Return (days, offsets) arrays from the sidecar, or None if it is missing or unusable"""
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            return None
+        version = (stat.st_mtime_ns, stat.st_size)
+        with _index_cache_lock:
+            cached = _index_cache.get(self.index_path)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+
+        days, offsets = [], []
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                if ',' not in line:
+                    # Written by an older version that gave up on unordered files
+                    days = None
+                    break
+                day, offset = line.split(',')
+                days.append(day)
+                offsets.append(int(offset))
+        entry = (np.array(days, dtype='U10'), np.array(offsets, dtype=np.int64)) if days is not None else None
+        with _index_cache_lock:
+            _index_cache[self.index_path] = (version, entry)
+        return entry
+
+    def build(self):
+        """Rebuild the sidecar by scanning the CSV once without parsing it; callers hold the lock"""
+        lines = []
+        last_day = None
+        with open(self.csv_path, 'rb') as f:
+            f.readline()
+            offset = f.tell()
+            for line in f:
+                match = DAY_PATTERN.match(line)
+                if match:
+                    day = match.group(0).decode('ascii')
+                    if day != last_day:
+                        lines.append(f"{day},{offset}")
+                        last_day = day
+                offset += len(line)
+
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + ("\n" if lines else ""))
+        os.replace(tmp_path, self.index_path)
+
+    def _last_day(self):
+        """Day of the last run in the sidecar, reading only its tail"""
+        with open(self.index_path, 'rb') as f:
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(0, size - 64))
+            lines = f.read().splitlines()
+        return lines[-1].split(b',')[0].decode('ascii') if lines else None
+
+    def record(self, day, offset):
+        """Note that rows for this day were appended at this byte offset; callers hold the lock"""
+        if not os.path.exists(self.index_path):
+            # Built lazily by the first range read
+            return
+        if day == self._last_day():
+            return
+        with open(self.index_path, 'a', encoding='utf-8') as f:
+            f.write(f"{day},{offset}\n")
+
+    def _offset_matches(self, f, day, offset):
+        """Check that the CSV still has a row for this day at this offset"""
+        f.seek(offset)
+        return f.read(len(day)).decode('ascii', errors='replace') == day
+
+    def byte_range(self, start_date=None, end_date=None):
+        """Return (start, end) byte offsets covering the days in range, or None if unusable.
+
+        end is None when the range runs to the end of the file. Rows of other
+        days may lie in between when the file is not in day order.
+        """
+        entry = self._read()
+        if entry is None:
+            with locked(self.lock_file):
+                entry = self._read()
+                if entry is None:
+                    self.build()
+                    entry = self._read()
+        days, offsets = entry
+        if not len(days):
+            return None
+
+        matching = np.ones(len(days), dtype=bool)
+        if start_date is not None:
+            matching &= days >= start_date.strftime('%Y-%m-%d')
+        if end_date is not None:
+            matching &= days <= end_date.strftime('%Y-%m-%d')
+        runs = np.flatnonzero(matching)
+        if not len(runs):
+            return (0, 0)
+        i, j = int(runs[0]), int(runs[-1]) + 1
+
+        # Make sure the file was not rewritten underneath the index
+        with open(self.csv_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if offsets[-1] >= size:
+                return None
+            if not self._offset_matches(f, days[-1], offsets[-1]):
+                return None
+            if not self._offset_matches(f, days[i], offsets[i]):
+                return None
+
+        return (int(offsets[i]), int(offsets[j]) if j < len(days) else None)
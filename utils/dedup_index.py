@@ -0,0 +1,175 @@
+import os
+import hashlib
+import threading
+
+import numpy as np
+
+# Hashes appended since the last merge are kept in a dict until there are this many
+MERGE_THRESHOLD = 65536
+
+# Loaded key sets shared by every session: path -> _KeySet
+_key_sets = {}
+_key_sets_lock = threading.Lock()
+
+# On-disk entry: hash of a full key and the byte offset of its line in the text file
+ENTRY_DTYPE = np.dtype([('hash', '<u8'), ('offset', '<u8')])
+
+
+def record_key(record, batch_id=None, ordinal=0):
+    """Text key of a rejection record's content.
+
+    batch_id ties the key to one client submission, so resending that
+    submission repeats its keys while an identical record in another
+    submission does not; ordinal tells apart identical records within one
+    submission.
+    """
+    parts = [batch_id or '', str(ordinal)]
+    parts += [str(record.get(field) if record.get(field) is not None else '')
+              for field in ('date', 'module', 'rejection_type', 'quantity', 'reason', 'operator', 'shift')]
+    return "\x1f".join(parts)
+
+
+def key_hash(key):
+    """64-bit hash of a text key"""
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def _key_line(key):
+    """A key as one line of the text file; backslash escapes keep newlines in reasons off the line"""
+    return key.encode('unicode_escape') + b"\n"
+
+
+class _KeySet:
+    """In-memory copy of a key file: hashes with the offsets of their full keys, sorted, plus recent ones"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.offset = 0
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.offsets = np.empty(0, dtype=np.uint64)
+        self.recent = {}
+
+    def extend(self, hashes, offsets):
+        for key_hash_, offset in zip(hashes.tolist(), offsets.tolist()):
+            self.recent.setdefault(key_hash_, []).append(offset)
+        if len(self.recent) >= MERGE_THRESHOLD:
+            pairs = [(key_hash_, offset) for key_hash_, offsets in self.recent.items() for offset in offsets]
+            hashes = np.array([pair[0] for pair in pairs], dtype=np.uint64)
+            offsets = np.array([pair[1] for pair in pairs], dtype=np.uint64)
+            # Only the new run is sorted; it is merged into the sorted arrays in one linear pass
+            order = np.argsort(hashes, kind='stable')
+            positions = np.searchsorted(self.hashes, hashes[order], 'right')
+            self.hashes = np.insert(self.hashes, positions, hashes[order])
+            self.offsets = np.insert(self.offsets, positions, offsets[order])
+            self.recent = {}
+
+    def candidates(self, hashes):
+        """Position in hashes -> offsets of the stored full keys with that hash"""
+        start = np.searchsorted(self.hashes, hashes, 'left')
+        end = np.searchsorted(self.hashes, hashes, 'right')
+        hits = {position: self.offsets[start[position]:end[position]].tolist()
+                for position in np.flatnonzero(end > start).tolist()}
+        if self.recent:
+            for position, key_hash_ in enumerate(hashes.tolist()):
+                if key_hash_ in self.recent:
+                    hits.setdefault(position, []).extend(self.recent[key_hash_])
+        return hits
+
+
+class DedupIndex:
+    """Keys of every stored record that carried one, to turn resubmissions into no-ops.
+
+    Full keys are appended to a text file, one escaped key per line. Beside
+    it, an append-only file of little-endian 64-bit pairs holds each key's
+    hash and the offset of its line. Each process loads the hashes once and
+    then reads only the pairs other processes appended since. A hash match
+    is confirmed against the full key, so a collision never drops a record.
+    Callers must hold the store's write lock from contains() through add()
+    so no other writer runs in between.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.text_path = os.path.splitext(path)[0] + ".txt"
+
+    def _key_set(self):
+        key = os.path.abspath(self.path)
+        with _key_sets_lock:
+            if key not in _key_sets:
+                _key_sets[key] = _KeySet()
+            return _key_sets[key]
+
+    def _refresh(self, key_set):
+        """Load pairs appended to the file since this process last read it"""
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            size = 0
+        if size < key_set.offset:
+            # The file was replaced; start over
+            key_set.reset()
+        # A torn final pair from a crashed append is ignored until overwritten
+        size -= size % ENTRY_DTYPE.itemsize
+        if size == key_set.offset:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(key_set.offset)
+            entries = np.frombuffer(f.read(size - key_set.offset), dtype=ENTRY_DTYPE)
+        key_set.extend(entries['hash'].astype(np.uint64), entries['offset'].astype(np.uint64))
+        key_set.offset = size
+
+    def _read_lines(self, offsets):
+        """Stored full key lines by offset"""
+        lines = {}
+        with open(self.text_path, 'rb') as f:
+            for offset in sorted(offsets):
+                f.seek(offset)
+                lines[offset] = f.readline()
+        return lines
+
+    def contains(self, keys):
+        """Boolean array: which keys are already stored"""
+        keys = list(keys)
+        hashes = np.fromiter((key_hash(key) for key in keys), dtype=np.uint64, count=len(keys))
+        key_set = self._key_set()
+        with key_set.lock:
+            self._refresh(key_set)
+            hits = key_set.candidates(hashes)
+        found = np.zeros(len(keys), dtype=bool)
+        if hits:
+            stored = self._read_lines({offset for offsets in hits.values() for offset in offsets})
+            for position, offsets in hits.items():
+                line = _key_line(keys[position])
+                found[position] = any(stored[offset] == line for offset in offsets)
+        return found
+
+    def add(self, keys):
+        """Durably record keys of records that were just stored"""
+        keys = list(keys)
+        if not keys:
+            return
+        lines = [_key_line(key) for key in keys]
+        entries = np.empty(len(keys), dtype=ENTRY_DTYPE)
+        entries['hash'] = [key_hash(key) for key in keys]
+        key_set = self._key_set()
+        with key_set.lock:
+            self._refresh(key_set)
+            # Full keys go first, so every stored hash points at a written line
+            with open(self.text_path, 'ab') as f:
+                entries['offset'] = f.tell() + np.cumsum([0] + [len(line) for line in lines[:-1]])
+                f.write(b"".join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.path, 'ab') as f:
+                # Drop a torn pair left by a crash so later pairs stay aligned
+                if f.tell() % ENTRY_DTYPE.itemsize:
+                    f.truncate(f.tell() - f.tell() % ENTRY_DTYPE.itemsize)
+                f.write(entries.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            key_set.extend(entries['hash'].astype(np.uint64), entries['offset'].astype(np.uint64))
+            key_set.offset = os.path.getsize(self.path)
@@ -4,6 +4,7 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta
 from utils.data_manager import DataManager
+from utils.shards import ShardSet
 
 class EmailSender:
     def __init__(self):
@@ -13,6 +14,13 @@ class EmailSender:
         self.email_password = os.getenv("EMAIL_PASSWORD", "")
         self.manager_emails = os.getenv("MANAGER_EMAILS", "").split(",")
         self.data_manager = DataManager()
+        self.shard_set = ShardSet()
+    
+    def get_report_summary(self, start_date, end_date):
+        """Rejection summary for the report; consolidated over every plant when QRMS_SHARDS is set"""
+        if self.shard_set.names:
+            return self.shard_set.get_rejection_summary(start_date, end_date)
+        return self.data_manager.get_rejection_summary(start_date, end_date)
     
     def create_daily_report_html(self, summary):
         """Create HTML content for daily report"""
@@ -27,6 +35,20 @@ class EmailSender:
             </html>
             """.format(date=datetime.now().strftime('%Y-%m-%d'))
         
+        # Generate plant table for the consolidated report
+        plant_section = ""
+        if summary.get('by_plant'):
+            plant_rows = ""
+            for plant, quantity in summary['by_plant'].items():
+                plant_rows += f"<tr><td>{plant}</td><td>{quantity}</td></tr>"
+            plant_section = f"""
+            <h3>🏭 Rejections by Plant</h3>
+            <table>
+                <tr><th>Plant</th><th>Quantity Rejected</th></tr>
+                {plant_rows}
+            </table>
+            """
+        
         # Generate module table
         module_rows = ""
         for module, quantity in summary['by_module'].items():
@@ -75,7 +97,7 @@ class EmailSender:
             <div class="metric">
                 <strong>Total Quantity Rejected:</strong> {summary['total_quantity']:,}
             </div>
-            
+            {plant_section}
             <h3>🔧 Rejections by Module</h3>
             <table>
                 <tr><th>Module</th><th>Quantity Rejected</th></tr>
@@ -119,7 +141,7 @@ class EmailSender:
             end_of_yesterday = yesterday.replace(hour=23, minute=59, second=59, microsecond=999999)
             
             # Get rejection summary
-            summary = self.data_manager.get_rejection_summary(start_of_yesterday, end_of_yesterday)
+            summary = self.get_report_summary(start_of_yesterday, end_of_yesterday)
             
             # Create email
             msg = MIMEMultipart('alternative')
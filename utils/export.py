@@ -0,0 +1,136 @@
+import io
+import os
+import gzip
+import tempfile
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+    pa_ipc = None
+    pq = None
+
+from utils.rejection_csv import REJECTION_COLUMNS, DATE_FORMAT
+
+# Exports larger than this spill from memory to a temporary file on disk
+EXPORT_SPOOL_BYTES = int(os.getenv("QRMS_EXPORT_SPOOL_MB", "8")) * 1024 * 1024
+
+# Export format -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    'csv': ('csv', 'text/csv'),
+    'csv.gz': ('csv.gz', 'application/gzip'),
+    'csv.zst': ('csv.zst', 'application/zstd'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('arrow', 'application/vnd.apache.arrow.file'),
+}
+
+# Formats that need pyarrow
+ARROW_FORMATS = {'csv.zst', 'parquet', 'arrow'}
+
+
+def available_formats():
+    """Export formats usable with the installed packages"""
+    return [fmt for fmt in EXPORT_FORMATS if pa is not None or fmt not in ARROW_FORMATS]
+
+
+def _export_schema(columns):
+    """Fixed Arrow schema so every chunk of an export has the same column types"""
+    types = {'date': pa.timestamp('s'), 'quantity': pa.int32()}
+    # Every other column, e.g. the plant of a consolidated export, is text
+    return pa.schema([(column, types.get(column, pa.string())) for column in columns])
+
+
+def _csv_bytes(df, columns, header):
+    return df[columns].to_csv(index=False, header=header, date_format=DATE_FORMAT).encode('utf-8')
+
+
+def write_export(chunks, f, fmt='csv', columns=REJECTION_COLUMNS):
+    """Write rejection chunks to a binary file object in one of EXPORT_FORMATS; returns the row count"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if fmt in ARROW_FORMATS and pa is None:
+        raise RuntimeError(f"Exporting {fmt} requires the 'pyarrow' package")
+
+    rows = 0
+    if fmt in ('csv', 'csv.gz', 'csv.zst'):
+        # gzip members and zstd frames may be concatenated, so each chunk compresses on its own
+        if fmt == 'csv.gz':
+            sink = gzip.GzipFile(fileobj=f, mode='wb')
+        else:
+            sink = f
+        header = True
+        for df in chunks:
+            data = _csv_bytes(df, columns, header)
+            if fmt == 'csv.zst':
+                data = pa.compress(data, codec='zstd', asbytes=True)
+            sink.write(data)
+            header = False
+            rows += len(df)
+        if header:
+            data = _csv_bytes(pd.DataFrame(columns=columns), columns, True)
+            sink.write(pa.compress(data, codec='zstd', asbytes=True) if fmt == 'csv.zst' else data)
+        if sink is not f:
+            sink.close()
+        return rows
+
+    schema = _export_schema(columns)
+    if fmt == 'parquet':
+        writer = pq.ParquetWriter(f, schema, compression='zstd')
+    else:
+        writer = pa_ipc.new_file(f, schema)
+    try:
+        for df in chunks:
+            # Numeric columns are handed to Arrow without copying; categories become plain strings
+            writer.write_table(pa.Table.from_pandas(df[columns], schema=schema, preserve_index=False))
+            rows += len(df)
+    finally:
+        writer.close()
+    return rows
+
+
+def spool_export(chunks, fmt='csv', columns=REJECTION_COLUMNS):
+    """Write rejection chunks into a spooled temp file and return it as a rewound binary reader"""
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES, mode='w+b')
+    write_export(chunks, spool, fmt, columns)
+    spool.seek(0)
+    # st.download_button accepts buffered readers but not spooled files directly.
+    # It reads the whole payload into memory to serve it, so only the build is bounded
+    return io.BufferedReader(spool)
+
+
+if __name__ == "__main__":
+    import argparse
+    from utils.data_manager import DataManager
+
+    parser = argparse.ArgumentParser(description="Export QRMS rejection records")
+    parser.add_argument("output", help="Output file path")
+    parser.add_argument("--format", dest="fmt", choices=list(EXPORT_FORMATS), help="Defaults to the output file extension")
+    parser.add_argument("--start", help="First day to export (YYYY-MM-DD)")
+    parser.add_argument("--end", help="Last day to export (YYYY-MM-DD)")
+    parser.add_argument("--module")
+    parser.add_argument("--rejection-type")
+    parser.add_argument("--storage", help="Storage backend, defaults to QRMS_STORAGE")
+    args = parser.parse_args()
+
+    fmt = args.fmt
+    if fmt is None:
+        # Longest extension first so .csv.gz is not taken for .gz
+        matches = [name for name, (ext, _) in EXPORT_FORMATS.items() if args.output.endswith("." + ext)]
+        if not matches:
+            parser.error("Cannot infer the format from the output name; pass --format")
+        fmt = max(matches, key=len)
+
+    start = pd.to_datetime(args.start) if args.start else None
+    end = pd.to_datetime(args.end) + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1) if args.end else None
+    data_manager = DataManager(storage=args.storage)
+    chunks = data_manager.iter_rejections(start, end, module=args.module, rejection_type=args.rejection_type)
+
+    tmp_path = args.output + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        rows = write_export(chunks, f, fmt)
+    os.replace(tmp_path, args.output)
+    print(f"Exported {rows} rejection records to {args.output} ({fmt})")
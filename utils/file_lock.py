@@ -0,0 +1,36 @@
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+# In-process locks per lock file, so threads serialize before taking flock
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+def _thread_lock(path):
+    """Return the in-process lock guarding a lock file"""
+    with _thread_locks_guard:
+        if path not in _thread_locks:
+            _thread_locks[path] = threading.Lock()
+        return _thread_locks[path]
+
+
+@contextmanager
+def locked(path):
+    """Hold an exclusive lock on path across threads and processes"""
+    path = os.path.abspath(path)
+    with _thread_lock(path):
+        if fcntl is None:
+            yield
+            return
+        with open(path, 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
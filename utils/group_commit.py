@@ -0,0 +1,87 @@
+import os
+import time
+import threading
+
+
+class _CommitRequest:
+    """One caller's records waiting to be committed"""
+
+    def __init__(self, records):
+        self.records = records
+        self.result = None
+        self.error = None
+        # Set instead of a result when the previous leader hands over leadership
+        self.lead = False
+        self.done = threading.Event()
+
+
+class GroupCommitter:
+    """Coalesces concurrent appends into one write and one durability point.
+
+    The first caller to arrive becomes the leader: it waits a short window for
+    other callers to queue their records, writes every queued batch with a
+    single call to write_batches, and wakes each caller with its own result.
+    Callers arriving during a write are left to the oldest of them, which the
+    leader wakes as the next leader, so every caller waits for at most the
+    round in progress and its own.
+    """
+
+    def __init__(self, write_batches, window=None):
+        self.write_batches = write_batches
+        if window is None:
+            window = float(os.getenv("QRMS_GROUP_COMMIT_WINDOW_MS", "2")) / 1000
+        self.window = window
+        self._lock = threading.Lock()
+        self._pending = []
+        self._leader_active = False
+
+    def submit(self, records):
+        """Queue records and block until they are durably written; raises on failure.
+
+        Returns this caller's entry of the list write_batches returned, if any.
+        """
+        request = _CommitRequest(records)
+        with self._lock:
+            self._pending.append(request)
+            is_leader = not self._leader_active
+            self._leader_active = True
+
+        if not is_leader:
+            request.done.wait()
+            if request.lead:
+                # Our records are still queued; the callers queued meanwhile need no further window
+                request.lead = False
+                request.done.clear()
+                self._drain()
+        else:
+            if self.window > 0:
+                time.sleep(self.window)
+            self._drain()
+
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _drain(self):
+        """Write the queued batches, then hand leadership to the oldest caller queued meanwhile"""
+        with self._lock:
+            batch = self._pending
+            self._pending = []
+        try:
+            results = self.write_batches([request.records for request in batch]) or [None] * len(batch)
+            error = None
+        except Exception as e:
+            results = [None] * len(batch)
+            error = e
+        for request, result in zip(batch, results):
+            request.result = result
+            request.error = error
+            request.done.set()
+
+        with self._lock:
+            if not self._pending:
+                self._leader_active = False
+                return
+            successor = self._pending[0]
+            successor.lead = True
+        successor.done.set()
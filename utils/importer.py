@@ -0,0 +1,289 @@
+import os
+import re
+import json
+import hashlib
+import shutil
+import threading
+
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+try:
+    import openpyxl
+except ImportError:  # pragma: no cover - optional dependency
+    openpyxl = None
+
+from utils.rejection_csv import REJECTION_COLUMNS, DATE_FORMAT
+from utils.validation import rejection_errors, REQUIRED_FIELDS
+
+# Rows read, validated and written per step; bounds the importer's memory
+IMPORT_CHUNK_ROWS = int(os.getenv("QRMS_IMPORT_CHUNK_ROWS", "50000"))
+
+# Spreadsheet headers (lowercased, punctuation as underscores) -> rejections.csv columns
+COLUMN_ALIASES = {
+    'date': 'date', 'datetime': 'date', 'timestamp': 'date', 'entry_date': 'date', 'rejection_date': 'date',
+    'module': 'module', 'line': 'module', 'module_name': 'module',
+    'rejection_type': 'rejection_type', 'type': 'rejection_type', 'defect': 'rejection_type', 'defect_type': 'rejection_type',
+    'quantity': 'quantity', 'qty': 'quantity', 'rejected_qty': 'quantity', 'rejected_quantity': 'quantity',
+    'reason': 'reason', 'remarks': 'reason', 'comment': 'reason', 'comments': 'reason',
+    'operator': 'operator', 'operator_name': 'operator', 'inspector': 'operator',
+    'shift': 'shift',
+}
+
+# Historical rows must carry their own date; it is never defaulted to now
+IMPORT_REQUIRED_FIELDS = ('date',) + REQUIRED_FIELDS
+
+EXCEL_SUFFIXES = ('.xlsx', '.xlsm')
+
+
+def normalize_columns(df):
+    """Map source headers onto REJECTION_COLUMNS; unknown columns are dropped, absent ones left empty"""
+    renamed = {}
+    for column in df.columns:
+        key = re.sub(r'[^a-z0-9]+', '_', str(column).strip().lower()).strip('_')
+        target = COLUMN_ALIASES.get(key)
+        if target and target not in renamed.values():
+            renamed[column] = target
+    df = df[list(renamed)].rename(columns=renamed)
+    for column in REJECTION_COLUMNS:
+        if column not in df.columns:
+            df[column] = ''
+    return df[REJECTION_COLUMNS]
+
+
+def _iter_csv(path, chunksize, skip_rows):
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        # Rows already imported are skipped without being converted; a callable
+        # avoids materializing millions of row numbers
+        reader = pd.read_csv(f, dtype=str, keep_default_na=False, chunksize=chunksize,
+                             skiprows=lambda row: 0 < row <= skip_rows, encoding_errors='replace')
+        try:
+            for chunk in reader:
+                # The parser reads ahead, so this slightly overstates progress
+                yield chunk, min(f.tell() / size, 1.0) if size else 1.0
+        except pd.errors.EmptyDataError:
+            return
+
+
+def _iter_excel(path, chunksize, skip_rows):
+    if openpyxl is None:
+        raise RuntimeError("Importing Excel files requires the 'openpyxl' package")
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        total = max((sheet.max_row or 1) - 1, 1)
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(value) if value is not None else f"column_{i}" for i, value in enumerate(header)]
+        batch = []
+        read = 0
+        for row in rows:
+            read += 1
+            if read <= skip_rows:
+                continue
+            batch.append(row)
+            if len(batch) == chunksize:
+                yield pd.DataFrame(batch, columns=columns), min(read / total, 1.0)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=columns), 1.0
+    finally:
+        workbook.close()
+
+
+def iter_source_chunks(path, chunksize=IMPORT_CHUNK_ROWS, skip_rows=0):
+    """Yield (frame, fraction read) from a CSV or Excel file, skipping the first skip_rows data rows"""
+    if path.lower().endswith(EXCEL_SUFFIXES):
+        return _iter_excel(path, chunksize, skip_rows)
+    return _iter_csv(path, chunksize, skip_rows)
+
+
+def parse_dates(raw, dayfirst=False):
+    """Parse date strings ('' for none) in bulk with a format guessed from the chunk.
+
+    Rows the guessed format does not fit fall back to per-value parsing,
+    which is many times slower.
+    """
+    given = raw != ''
+    dates = pd.Series(pd.NaT, index=raw.index, dtype='datetime64[ns]')
+    for sample in raw[given].head(20):
+        date_format = guess_datetime_format(sample, dayfirst=dayfirst)
+        if date_format:
+            dates = pd.to_datetime(raw.where(given), format=date_format, errors='coerce')
+            break
+    rest = given & dates.isna()
+    if rest.any():
+        dates[rest] = pd.to_datetime(raw[rest], format='mixed', dayfirst=dayfirst, errors='coerce')
+    return dates
+
+
+def prepare_chunk(df, mapping, dayfirst=False):
+    """Normalize and validate one source chunk; returns (valid records frame, errors per row)"""
+    df = normalize_columns(df)
+    raw_dates = df['date'].fillna('').astype(str).str.strip()
+    df['date'] = parse_dates(raw_dates, dayfirst)
+    df['quantity'] = pd.to_numeric(df['quantity'], errors='coerce')
+    for column in ('module', 'rejection_type', 'reason', 'operator', 'shift'):
+        df[column] = df[column].fillna('').astype(str).str.strip()
+
+    errors = rejection_errors(df, mapping, required=IMPORT_REQUIRED_FIELDS)
+    unreadable = (raw_dates != '') & df['date'].isna()
+    errors[unreadable] = "unreadable date '" + raw_dates[unreadable] + "'"
+
+    valid = df[errors == ''].astype({'quantity': int})
+    # Formatted once per chunk rather than once per record on write
+    valid['date'] = valid['date'].dt.strftime(DATE_FORMAT)
+    return valid, errors
+
+
+class HistoricalImporter:
+    """Imports a large CSV or Excel file chunk by chunk, checkpointing after every written chunk.
+
+    The checkpoint records how many source rows are done, so a crashed or
+    interrupted import resumes where it stopped. Each chunk is stored under
+    one dedup key naming its source rows, so a chunk replayed after a crash
+    between its write and its checkpoint is not stored twice. Rejected rows
+    are written to an errors CSV beside the checkpoint with their source row
+    number.
+    """
+
+    def __init__(self, data_manager, path, chunksize=IMPORT_CHUNK_ROWS, dayfirst=False):
+        self.data_manager = data_manager
+        self.path = os.path.abspath(path)
+        self.chunksize = chunksize
+        self.dayfirst = dayfirst
+        self.imports_dir = os.path.join(data_manager.data_dir, "imports")
+        stat = os.stat(self.path)
+        # A changed source file starts a new import rather than resuming the old one
+        fingerprint = f"{self.path}:{stat.st_size}:{stat.st_mtime_ns}"
+        import_id = hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()[:16]
+        self.checkpoint_file = os.path.join(self.imports_dir, f"{import_id}.json")
+        self.errors_file = os.path.join(self.imports_dir, f"{import_id}.errors.csv")
+
+    def load_checkpoint(self):
+        try:
+            with open(self.checkpoint_file, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return self._new_checkpoint()
+
+    def _new_checkpoint(self):
+        return {'source': self.path, 'rows_done': 0, 'imported': 0, 'rejected': 0, 'done': False,
+                'chunk_rows': self.chunksize}
+
+    def _save_checkpoint(self, checkpoint):
+        os.makedirs(self.imports_dir, exist_ok=True)
+        tmp_path = self.checkpoint_file + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_file)
+
+    def _write_errors(self, chunk, errors, first_row):
+        rejected = chunk[errors != ''].copy()
+        if rejected.empty:
+            return
+        # Row numbers as shown in a spreadsheet: the header is row 1
+        rejected.insert(0, 'error', errors[errors != ''])
+        rejected.insert(0, 'source_row', rejected.index + first_row + 2)
+        os.makedirs(self.imports_dir, exist_ok=True)
+        header = not os.path.exists(self.errors_file)
+        rejected.to_csv(self.errors_file, mode='a', header=header, index=False)
+
+    def run(self, progress=None, restart=False):
+        """Import the remaining rows; progress(fraction, checkpoint) is called after each chunk.
+
+        Returns (success, message).
+        """
+        try:
+            checkpoint = self.load_checkpoint()
+            if restart:
+                checkpoint = self._new_checkpoint()
+                if os.path.exists(self.errors_file):
+                    os.remove(self.errors_file)
+            if checkpoint['done']:
+                return True, f"Already imported: {checkpoint['imported']} records, {checkpoint['rejected']} rejected rows"
+
+            # A resumed import keeps its chunk boundaries, so a replayed chunk carries the key it was stored under
+            chunksize = checkpoint.setdefault('chunk_rows', self.chunksize)
+            for chunk, fraction in iter_source_chunks(self.path, chunksize, checkpoint['rows_done']):
+                chunk = chunk.reset_index(drop=True)
+                # The catalog may change during a long import; each chunk uses the current one
+                valid, errors = prepare_chunk(chunk, self.data_manager.get_module_type_mapping(), self.dayfirst)
+                if not valid.empty:
+                    # Source rows as numbered in a spreadsheet: the header is row 1
+                    rows = f"{checkpoint['rows_done'] + 2}-{checkpoint['rows_done'] + len(chunk) + 1}"
+                    success, message = self.data_manager.add_rejections(
+                        valid.to_dict('records'), validate_mapping=False, batch_key=f"import:{self.path}:{rows}")
+                    if not success:
+                        return False, f"Import stopped after {checkpoint['rows_done']} rows: {message}"
+                self._write_errors(chunk, errors, checkpoint['rows_done'])
+
+                checkpoint['rows_done'] += len(chunk)
+                checkpoint['imported'] += len(valid)
+                checkpoint['rejected'] += len(chunk) - len(valid)
+                self._save_checkpoint(checkpoint)
+                if progress is not None:
+                    progress(fraction, checkpoint)
+
+            checkpoint['done'] = True
+            self._save_checkpoint(checkpoint)
+            message = f"Imported {checkpoint['imported']} records"
+            if checkpoint['rejected']:
+                message += f"; {checkpoint['rejected']} rows rejected, see {self.errors_file}"
+            return True, message
+        except Exception as e:
+            return False, f"Error importing {self.path}: {str(e)}"
+
+
+def save_upload(uploaded_file, data_dir):
+    """Copy an uploaded file into data/imports/uploads under its content hash; returns the path.
+
+    The same file uploaded again maps to the same path, so its import resumes.
+    """
+    uploads_dir = os.path.join(data_dir, "imports", "uploads")
+    os.makedirs(uploads_dir, exist_ok=True)
+    suffix = os.path.splitext(uploaded_file.name)[1].lower()
+    tmp_path = os.path.join(uploads_dir, f".upload-{os.getpid()}-{threading.get_ident()}.tmp")
+    digest = hashlib.sha256()
+    uploaded_file.seek(0)
+    with open(tmp_path, 'wb') as f:
+        for block in iter(lambda: uploaded_file.read(1024 * 1024), b""):
+            digest.update(block)
+            f.write(block)
+    path = os.path.join(uploads_dir, digest.hexdigest()[:32] + suffix)
+    if os.path.exists(path):
+        # Keep the original file; its mtime is part of the import fingerprint
+        os.remove(tmp_path)
+    else:
+        shutil.move(tmp_path, path)
+    return path
+
+
+if __name__ == "__main__":
+    import argparse
+    from utils.data_manager import DataManager
+
+    parser = argparse.ArgumentParser(description="Import historical rejection records from CSV or Excel")
+    parser.add_argument("source", help="CSV or .xlsx file")
+    parser.add_argument("--chunk-rows", type=int, default=IMPORT_CHUNK_ROWS)
+    parser.add_argument("--dayfirst", action="store_true", help="Read ambiguous dates like 03/04/2021 as 3 April")
+    parser.add_argument("--restart", action="store_true", help="Ignore an earlier checkpoint and start from the first row")
+    parser.add_argument("--storage", help="Storage backend, defaults to QRMS_STORAGE")
+    args = parser.parse_args()
+
+    importer = HistoricalImporter(DataManager(storage=args.storage), args.source, args.chunk_rows, args.dayfirst)
+    resumed_from = importer.load_checkpoint()['rows_done']
+    if resumed_from and not args.restart:
+        print(f"Resuming after row {resumed_from}")
+
+    def report(fraction, checkpoint):
+        print(f"{fraction:6.1%}  {checkpoint['rows_done']} rows read, {checkpoint['imported']} imported, {checkpoint['rejected']} rejected")
+
+    success, message = importer.run(progress=report, restart=args.restart)
+    print(message)
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,493 @@
+import os
+import json
+import time
+import queue
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from utils.data_manager import DataManager
+from utils.validation import rejection_errors, canonical_dates
+
+# Fields taken from an event; anything else is ignored
+EVENT_FIELDS = ('date', 'module', 'rejection_type', 'quantity', 'reason', 'operator', 'shift')
+
+# Events held in memory before producers are made to wait
+INGEST_BUFFER_ROWS = int(os.getenv("QRMS_INGEST_BUFFER_ROWS", "100000"))
+
+# Most events written by one append, and how long a partial batch may wait
+INGEST_BATCH_ROWS = int(os.getenv("QRMS_INGEST_BATCH_ROWS", "5000"))
+INGEST_FLUSH_SECONDS = float(os.getenv("QRMS_INGEST_FLUSH_MS", "200")) / 1000
+
+# How long an HTTP request waits for buffer space before answering 503
+INGEST_HTTP_WAIT_SECONDS = float(os.getenv("QRMS_INGEST_HTTP_WAIT_MS", "2000")) / 1000
+
+# Writes of one batch before it is moved to the dead-letter file, and the pause between them
+INGEST_MAX_ATTEMPTS = int(os.getenv("QRMS_INGEST_MAX_ATTEMPTS", "5"))
+INGEST_RETRY_SECONDS = 1.0
+
+DEAD_LETTER_NAME = "ingest_dead_letter.jsonl"
+
+
+class IngestTicket:
+    """Outcome of one submitted chunk of events, known once each is written or dead-lettered"""
+
+    def __init__(self, count):
+        # Per event: None once durably written, else why it was not stored
+        self.errors = [None] * count
+        self._remaining = count
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        if not count:
+            self._done.set()
+
+    def finish(self, position, error=None):
+        self.errors[position] = error
+        with self._lock:
+            self._remaining -= 1
+            if not self._remaining:
+                self._done.set()
+
+    def wait(self, timeout=None):
+        """Wait until every event is settled; returns False on timeout"""
+        return self._done.wait(timeout)
+
+
+class IngestBuffer:
+    """Bounded in-memory queue of validated events.
+
+    put() blocks while the buffer is full, so a writer that falls behind the
+    producers slows them down instead of growing memory without limit.
+    """
+
+    def __init__(self, capacity=INGEST_BUFFER_ROWS):
+        self.capacity = capacity
+        self._records = []
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._records)
+
+    def put(self, records, timeout=None):
+        """Queue records; returns False if there was no room before the timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            # An oversized chunk is let into an empty buffer rather than blocking forever
+            while self._records and len(self._records) + len(records) > self.capacity:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self._records.extend(records)
+            self._cond.notify_all()
+        return True
+
+    def take(self, max_records, timeout):
+        """Remove up to max_records, waiting up to timeout for the first to arrive"""
+        with self._cond:
+            if not self._records:
+                self._cond.wait(timeout)
+            records = self._records[:max_records]
+            del self._records[:max_records]
+            self._cond.notify_all()
+            return records
+
+
+class IngestService:
+    """Validates incoming events and appends them to the store in batches"""
+
+    def __init__(self, data_manager=None):
+        self.data_manager = data_manager or DataManager()
+        self.buffer = IngestBuffer()
+        self.is_running = False
+        self.stats = {'accepted': 0, 'rejected': 0, 'written': 0, 'batches': 0, 'write_errors': 0, 'dead_lettered': 0}
+        # Batches that kept failing, as events that can be fixed and sent again
+        self.dead_letter_path = os.path.join(self.data_manager.data_dir, DEAD_LETTER_NAME)
+        self._stats_lock = threading.Lock()
+        self._writer = None
+
+    def _count(self, **counts):
+        with self._stats_lock:
+            for name, value in counts.items():
+                self.stats[name] += value
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['buffered'] = len(self.buffer)
+        return stats
+
+    def parse_lines(self, lines):
+        """Parse and validate NDJSON lines; returns (records, per-line error or None)"""
+        events = []
+        results = []
+        for line in lines:
+            try:
+                event = json.loads(line)
+                if not isinstance(event, dict):
+                    raise ValueError("event must be a JSON object")
+            except ValueError as e:
+                results.append(f"invalid JSON: {str(e)}")
+                continue
+            record = {}
+            for field in EVENT_FIELDS:
+                if field in event:
+                    # Nested values cannot be stored as they are; keep them as text
+                    value = event[field]
+                    record[field] = json.dumps(value) if isinstance(value, (dict, list)) else value
+            if event.get('event_id'):
+                # A station's own ID for the event; a resent event is then stored once
+                record['dedup_id'] = str(event['event_id'])
+            events.append(record)
+            results.append(None)
+
+        records = []
+        if events:
+            df = pd.DataFrame.from_records(events)
+            errors = rejection_errors(df, self.data_manager.get_module_type_mapping())
+            if 'date' in df.columns:
+                # Timestamps are stored in the store's own format
+                for event, date in zip(events, canonical_dates(df['date'])):
+                    if 'date' in event:
+                        event['date'] = date
+            messages = iter(errors)
+            event_iter = iter(events)
+            for idx, result in enumerate(results):
+                if result is not None:
+                    continue
+                event, message = next(event_iter), next(messages)
+                if message:
+                    results[idx] = message
+                else:
+                    records.append(event)
+
+        self._count(rejected=len(results) - len(records))
+        return records, results
+
+    def submit(self, records, timeout=None):
+        """Buffer validated records; returns their IngestTicket, or None if the buffer stayed full past the timeout"""
+        ticket = IngestTicket(len(records))
+        if not records:
+            return ticket
+        if not self.buffer.put([(record, ticket, position) for position, record in enumerate(records)], timeout):
+            return None
+        self._count(accepted=len(records))
+        return ticket
+
+    def run_writer(self):
+        """Append buffered events to the store until stopped and drained"""
+        while self.is_running or len(self.buffer):
+            entries = self.buffer.take(INGEST_BATCH_ROWS, INGEST_FLUSH_SECONDS)
+            if entries:
+                error = self._write([record for record, _, _ in entries])
+                for _, ticket, position in entries:
+                    ticket.finish(position, error)
+
+    def _write(self, records):
+        """Append one batch, retrying a few times before moving it to the dead-letter file; returns why it was not stored"""
+        for attempt in range(1, INGEST_MAX_ATTEMPTS + 1):
+            success, message = self.data_manager.add_rejections(records, validate_mapping=False)
+            if success:
+                self._count(written=len(records), batches=1)
+                return None
+            # The buffer fills meanwhile and producers wait
+            print(f"Ingest write failed (attempt {attempt} of {INGEST_MAX_ATTEMPTS}): {message}")
+            self._count(write_errors=1)
+            if attempt < INGEST_MAX_ATTEMPTS:
+                time.sleep(INGEST_RETRY_SECONDS)
+        return self._dead_letter(records, message)
+
+    def _dead_letter(self, records, message):
+        """Append a batch that kept failing to the dead-letter file, so later events are not held up"""
+        self._count(dead_lettered=len(records))
+        try:
+            with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+                f.writelines(json.dumps(_dead_letter_event(record, message), default=str) + "\n" for record in records)
+                f.flush()
+                os.fsync(f.fileno())
+            print(f"Moved {len(records)} events to {self.dead_letter_path}")
+            return f"not stored: {message}; kept in {DEAD_LETTER_NAME}"
+        except OSError as e:
+            print(f"Error writing ingest dead-letter file, {len(records)} events lost: {str(e)}")
+            return f"not stored: {message}"
+
+    def start(self):
+        if not self.is_running:
+            self.is_running = True
+            self._writer = threading.Thread(target=self.run_writer, daemon=True)
+            self._writer.start()
+
+    def stop(self):
+        """Stop the writer once every buffered event is written"""
+        self.is_running = False
+        if self._writer is not None:
+            self._writer.join()
+
+
+class StreamIngestHandler(socketserver.BaseRequestHandler):
+    """NDJSON over a TCP or Unix socket; every line is answered with one line, in order"""
+
+    def handle(self):
+        service = self.server.service
+        # Acks are sent from their own thread once writes complete, so reading never waits on the disk
+        acks = queue.Queue()
+        sender = threading.Thread(target=self._send_acks, args=(acks,), daemon=True)
+        sender.start()
+        pending = b""
+        try:
+            while True:
+                data = self.request.recv(65536)
+                if not data:
+                    break
+                lines = (pending + data).split(b"\n")
+                pending = lines.pop()
+                lines = [line for line in lines if line.strip()]
+                if not lines:
+                    continue
+                records, results = service.parse_lines(lines)
+                # Blocks while the buffer is full; unread socket data then pushes back on the sender
+                acks.put((service.submit(records), results))
+        finally:
+            acks.put(None)
+            sender.join()
+
+    def _send_acks(self, acks):
+        connected = True
+        while True:
+            item = acks.get()
+            if item is None:
+                return
+            ticket, results = item
+            ticket.wait()
+            if not connected:
+                continue
+            try:
+                self.request.sendall(b"".join(_ack(error) for error in _outcomes(results, ticket)))
+            except OSError:
+                # The station went away; it resends whatever it has no ack for
+                connected = False
+
+
+def _outcomes(results, ticket):
+    """Per-line results with the write outcome of each accepted line filled in"""
+    errors = iter(ticket.errors)
+    return [error if error is not None else next(errors) for error in results]
+
+
+def _dead_letter_event(record, error):
+    """A record as an event line again, with the reason it was not stored"""
+    event = {field: record[field] for field in EVENT_FIELDS if record.get(field) is not None}
+    if record.get('dedup_id'):
+        event['event_id'] = record['dedup_id']
+    event['error'] = error
+    return event
+
+
+def _ack(error):
+    if error is None:
+        return b'{"ok": true}\n'
+    return (json.dumps({'ok': False, 'error': error}) + "\n").encode('utf-8')
+
+
+class ThreadingTCPIngestServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ThreadingUnixIngestServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class HTTPIngestHandler(BaseHTTPRequestHandler):
+    """POST /events with an NDJSON body; GET /stats for counters"""
+
+    def _reply(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != "/stats":
+            self._reply(404, {'error': 'not found'})
+            return
+        self._reply(200, self.server.service.get_stats())
+
+    def do_POST(self):
+        if self.path != "/events":
+            self._reply(404, {'error': 'not found'})
+            return
+        service = self.server.service
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        lines = [line for line in body.split(b"\n") if line.strip()]
+        records, results = service.parse_lines(lines)
+        ticket = service.submit(records, timeout=INGEST_HTTP_WAIT_SECONDS)
+        if ticket is None:
+            # Nothing from this request was kept; the client should resend it later
+            self._reply(503, {'error': 'ingest buffer full'}, {"Retry-After": "1"})
+            return
+        # Answer once the events are durably written
+        ticket.wait()
+        errors = [{'line': idx + 1, 'error': error} for idx, error in enumerate(_outcomes(results, ticket)) if error is not None]
+        self._reply(200, {'accepted': len(records) - sum(error is not None for error in ticket.errors), 'errors': errors})
+
+    def log_message(self, format, *args):
+        # Per-request access logs would swamp the console at station rates
+        pass
+
+
+def _host_port(value):
+    host, port = value.rsplit(":", 1)
+    return host or "127.0.0.1", int(port)
+
+
+def serve(service, tcp=None, unix=None, http=None):
+    """Run the configured listeners until interrupted, then flush buffered events"""
+    servers = []
+    if tcp:
+        servers.append(ThreadingTCPIngestServer(_host_port(tcp), StreamIngestHandler))
+    if unix:
+        if os.path.exists(unix):
+            os.remove(unix)
+        servers.append(ThreadingUnixIngestServer(unix, StreamIngestHandler))
+    if http:
+        servers.append(ThreadingHTTPServer(_host_port(http), HTTPIngestHandler))
+    if not servers:
+        raise ValueError("No listener configured; pass --tcp, --unix or --http")
+
+    service.start()
+    for server in servers:
+        server.service = service
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Ingest service listening on {', '.join(filter(None, [tcp, unix, http]))}")
+
+    try:
+        while True:
+            time.sleep(10)
+            print(f"Ingest stats: {service.get_stats()}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+        if unix and os.path.exists(unix):
+            os.remove(unix)
+        service.stop()
+        print(f"Ingest service stopped: {service.get_stats()}")
+
+
+def generate_load(events, tcp=None, unix=None, http=None, connections=1, chunk=500, data_manager=None):
+    """Send events drawn from the catalog's valid module/type pairs; returns (accepted, errors, seconds)"""
+    import random
+    import socket
+    import urllib.error
+    import urllib.request
+
+    pairs = sorted((data_manager or DataManager()).get_module_type_mapping().pairs)
+    if not pairs:
+        raise ValueError("The catalog has no module/rejection type mappings to generate events from")
+
+    def make_lines(count):
+        return [json.dumps({
+            'module': module,
+            'rejection_type': rejection_type,
+            'quantity': random.randint(1, 20),
+            'reason': f"Load test {random.randint(1, 50)}",
+            'operator': f"station-{random.randint(1, 10)}",
+            'shift': random.choice(["Day", "Evening", "Night"])
+        }).encode('utf-8') for module, rejection_type in random.choices(pairs, k=count)]
+
+    totals = {'accepted': 0, 'errors': 0}
+    totals_lock = threading.Lock()
+
+    def stream_worker(count):
+        if unix:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(unix)
+        else:
+            sock = socket.create_connection(_host_port(tcp))
+        accepted = errors = 0
+
+        def read_acks():
+            nonlocal accepted, errors
+            reader = sock.makefile('rb')
+            for _ in range(count):
+                if json.loads(reader.readline()).get('ok'):
+                    accepted += 1
+                else:
+                    errors += 1
+
+        reader_thread = threading.Thread(target=read_acks)
+        reader_thread.start()
+        for start in range(0, count, chunk):
+            sock.sendall(b"\n".join(make_lines(min(chunk, count - start))) + b"\n")
+        reader_thread.join()
+        sock.close()
+        with totals_lock:
+            totals['accepted'] += accepted
+            totals['errors'] += errors
+
+    def http_worker(count):
+        host, port = _host_port(http)
+        accepted = errors = 0
+        for start in range(0, count, chunk):
+            body = b"\n".join(make_lines(min(chunk, count - start)))
+            while True:
+                request = urllib.request.Request(f"http://{host}:{port}/events", data=body, method="POST")
+                try:
+                    with urllib.request.urlopen(request) as response:
+                        result = json.loads(response.read())
+                    break
+                except urllib.error.HTTPError as e:
+                    if e.code != 503:
+                        raise
+                    time.sleep(float(e.headers.get("Retry-After", "1")))
+            accepted += result['accepted']
+            errors += len(result['errors'])
+        with totals_lock:
+            totals['accepted'] += accepted
+            totals['errors'] += errors
+
+    worker = http_worker if http else stream_worker
+    shares = [events // connections + (1 if i < events % connections else 0) for i in range(connections)]
+    started = time.time()
+    threads = [threading.Thread(target=worker, args=(share,)) for share in shares if share]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return totals['accepted'], totals['errors'], time.time() - started
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Ingest rejection events from inspection stations")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("serve", "Run the ingestion service"), ("load", "Send generated events to a running service")):
+        command = subparsers.add_parser(name, help=help_text)
+        command.add_argument("--tcp", help="HOST:PORT of the NDJSON socket listener")
+        command.add_argument("--unix", help="Path of the NDJSON Unix socket")
+        command.add_argument("--http", help="HOST:PORT of the HTTP listener")
+    subparsers.choices["serve"].add_argument("--storage", help="Storage backend, defaults to QRMS_STORAGE")
+    subparsers.choices["serve"].add_argument("--data-dir", help="Data directory, defaults to data")
+    subparsers.choices["load"].add_argument("--events", type=int, default=10000)
+    subparsers.choices["load"].add_argument("--connections", type=int, default=1)
+    subparsers.choices["load"].add_argument("--chunk", type=int, default=500, help="Events per write or request")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(IngestService(DataManager(storage=args.storage, data_dir=args.data_dir)), args.tcp, args.unix, args.http)
+    else:
+        if sum(bool(target) for target in (args.tcp, args.unix, args.http)) != 1:
+            parser.error("Pass exactly one of --tcp, --unix or --http")
+        accepted, errors, seconds = generate_load(args.events, args.tcp, args.unix, args.http, args.connections, args.chunk)
+        print(f"Sent {args.events} events in {seconds:.2f}s ({args.events / seconds:,.0f}/s): {accepted} accepted, {errors} rejected")
@@ -0,0 +1,281 @@
+import os
+import glob
+import json
+import shutil
+import uuid
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+    pc = None
+    pq = None
+
+# Process-wide cache of parsed partition files: path -> (mtime_ns, size, table)
+_file_cache = {}
+_file_cache_lock = threading.Lock()
+
+# Small files per partition before appends merge them into one
+COMPACT_THRESHOLD = 64
+
+# Metadata key of a compacted file listing the names of the files it merged
+REPLACES_KEY = b'qrms_replaces'
+
+# Process-wide cache of the files each compacted file replaces: path -> ((mtime_ns, size), names)
+_replaces_cache = {}
+
+
+def _rejection_schema():
+    """Typed schema for rejection partitions"""
+    return pa.schema([
+        ('date', pa.timestamp('us')),
+        ('module', pa.string()),
+        ('rejection_type', pa.string()),
+        ('quantity', pa.int32()),
+        ('reason', pa.string()),
+        ('operator', pa.string()),
+        ('shift', pa.string()),
+    ])
+
+
+class ParquetRejectionStore:
+    """Rejection records stored as month partitions: year=YYYY/month=MM/*.parquet"""
+
+    def __init__(self, root_dir):
+        if pa is None:
+            raise RuntimeError("Parquet storage requires the 'pyarrow' package")
+        self.root_dir = root_dir
+        self.schema = _rejection_schema()
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def _partition_dir(self, year, month):
+        """Directory holding one month of rejections"""
+        return os.path.join(self.root_dir, f"year={year:04d}", f"month={month:02d}")
+
+    def _partitions(self):
+        """List (year, month, path) for every partition on disk, oldest first"""
+        partitions = []
+        for path in glob.glob(os.path.join(self.root_dir, "year=*", "month=*")):
+            try:
+                year = int(os.path.basename(os.path.dirname(path)).split("=")[1])
+                month = int(os.path.basename(path).split("=")[1])
+            except (IndexError, ValueError):
+                continue
+            partitions.append((year, month, path))
+        return sorted(partitions)
+
+    def _overlapping_partitions(self, start_date=None, end_date=None):
+        """Partitions whose month intersects the [start_date, end_date] range; dates are Timestamps"""
+        start_key = (start_date.year, start_date.month) if start_date is not None else None
+        end_key = (end_date.year, end_date.month) if end_date is not None else None
+        for year, month, path in self._partitions():
+            if start_key and (year, month) < start_key:
+                continue
+            if end_key and (year, month) > end_key:
+                continue
+            yield path
+
+    def _to_table(self, df):
+        """Convert a rejections frame to an Arrow table with the store schema"""
+        df = df[self.schema.names].copy()
+        df['date'] = pd.to_datetime(df['date'])
+        df['quantity'] = df['quantity'].astype('int32')
+        return pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+
+    def _stage_file(self, partition_dir, table, prefix="part"):
+        """Write a table to a temp file in a partition; returns (tmp_path, final_path)"""
+        os.makedirs(partition_dir, exist_ok=True)
+        name = f"{prefix}-{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{uuid.uuid4().hex[:8]}.parquet"
+        final_path = os.path.join(partition_dir, name)
+        tmp_path = final_path + ".tmp"
+        try:
+            pq.write_table(table, tmp_path, compression='zstd')
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return tmp_path, final_path
+
+    def _write_file(self, partition_dir, table):
+        """Write a table into a partition atomically via temp-file-and-rename"""
+        tmp_path, final_path = self._stage_file(partition_dir, table)
+        os.replace(tmp_path, final_path)
+        return final_path
+
+    def append(self, records):
+        """Append rejection records, one new file per touched month.
+
+        Every month's file is written before any is renamed into place, so a
+        failed write leaves no month of the batch stored and a retry cannot
+        duplicate rows.
+        """
+        df = pd.DataFrame(records)
+        if df.empty:
+            return
+        df['date'] = pd.to_datetime(df['date'])
+        staged = []
+        try:
+            for (year, month), group in df.groupby([df['date'].dt.year, df['date'].dt.month]):
+                partition_dir = self._partition_dir(int(year), int(month))
+                staged.append((partition_dir, *self._stage_file(partition_dir, self._to_table(group))))
+        except Exception:
+            for _, tmp_path, _ in staged:
+                os.remove(tmp_path)
+            raise
+
+        for _, tmp_path, final_path in staged:
+            os.replace(tmp_path, final_path)
+        for partition_dir, _, _ in staged:
+            if len(glob.glob(os.path.join(partition_dir, "*.parquet"))) > COMPACT_THRESHOLD:
+                self.compact_partition(partition_dir)
+
+    def compact_partition(self, partition_dir):
+        """Merge the small files of one partition into a single file.
+
+        The merged file names the files it holds in its metadata and is
+        renamed into place before they are removed, so readers skip them
+        rather than counting their rows twice.
+        """
+        files = sorted(glob.glob(os.path.join(partition_dir, "*.parquet")))
+        live = self._live_files(partition_dir, files)
+        if len(live) < 2:
+            return
+        table = pa.concat_tables([self._read_file(path) for path in live])
+        # Every file present is named, including sources an interrupted compaction left behind
+        table = table.replace_schema_metadata({REPLACES_KEY: json.dumps([os.path.basename(path) for path in files]).encode('utf-8')})
+        tmp_path, final_path = self._stage_file(partition_dir, table, prefix="compact")
+        os.replace(tmp_path, final_path)
+        for path in files:
+            os.remove(path)
+        with _file_cache_lock:
+            for path in files:
+                _file_cache.pop(path, None)
+                _replaces_cache.pop(path, None)
+
+    def _replaced_names(self, path):
+        """Names of the files a compacted file holds the rows of"""
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with _file_cache_lock:
+            cached = _replaces_cache.get(path)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+        metadata = pq.read_schema(path).metadata or {}
+        names = frozenset(json.loads(metadata.get(REPLACES_KEY, b'[]')))
+        with _file_cache_lock:
+            _replaces_cache[path] = (version, names)
+        return names
+
+    def _live_files(self, partition_dir, files=None):
+        """A partition's files, leaving out those a compacted file already holds"""
+        if files is None:
+            files = sorted(glob.glob(os.path.join(partition_dir, "*.parquet")))
+        replaced = set()
+        for path in files:
+            if os.path.basename(path).startswith("compact-"):
+                try:
+                    replaced.update(self._replaced_names(path))
+                except FileNotFoundError:
+                    # Merged into a newer compacted file meanwhile
+                    continue
+        return [path for path in files if os.path.basename(path) not in replaced]
+
+    def _read_partition(self, partition_dir):
+        """Read the live files of one partition as one consistent set of tables"""
+        while True:
+            try:
+                return [self._read_file(path) for path in self._live_files(partition_dir)]
+            except FileNotFoundError:
+                # Compacted away between listing and reading; the merged file is in place now
+                continue
+
+    def _open_partition(self, partition_dir):
+        """Open the live files of one partition; open handles keep them readable after a compaction"""
+        while True:
+            try:
+                return [pq.ParquetFile(path) for path in self._live_files(partition_dir)]
+            except FileNotFoundError:
+                continue
+
+    def _read_file(self, path):
+        """Read one partition file, reusing the cached table while it is unchanged"""
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with _file_cache_lock:
+            cached = _file_cache.get(path)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+        table = pq.read_table(path, schema=self.schema)
+        with _file_cache_lock:
+            _file_cache[path] = (version, table)
+        return table
+
+    def load(self, start_date=None, end_date=None):
+        """Load rejections, opening only partitions that overlap the date range"""
+        start_date = pd.Timestamp(start_date) if start_date is not None else None
+        end_date = pd.Timestamp(end_date) if end_date is not None else None
+        tables = []
+        for partition_dir in self._overlapping_partitions(start_date, end_date):
+            tables.extend(self._read_partition(partition_dir))
+        if not tables:
+            return pd.DataFrame(columns=self.schema.names)
+
+        table = pa.concat_tables(tables)
+        if start_date is not None:
+            table = table.filter(pc.greater_equal(table['date'], pa.scalar(start_date, pa.timestamp('us'))))
+        if end_date is not None:
+            table = table.filter(pc.less_equal(table['date'], pa.scalar(end_date, pa.timestamp('us'))))
+        return table.to_pandas()
+
+    def iter_chunks(self, start_date=None, end_date=None, chunksize=50000):
+        """Yield rejections in the date range one record batch at a time"""
+        start_date = pd.Timestamp(start_date) if start_date is not None else None
+        end_date = pd.Timestamp(end_date) if end_date is not None else None
+        start = pa.scalar(start_date, pa.timestamp('us')) if start_date is not None else None
+        end = pa.scalar(end_date, pa.timestamp('us')) if end_date is not None else None
+        for partition_dir in self._overlapping_partitions(start_date, end_date):
+            for parquet_file in self._open_partition(partition_dir):
+                for batch in parquet_file.iter_batches(batch_size=chunksize):
+                    table = pa.Table.from_batches([batch]).cast(self.schema)
+                    if start is not None:
+                        table = table.filter(pc.greater_equal(table['date'], start))
+                    if end is not None:
+                        table = table.filter(pc.less_equal(table['date'], end))
+                    if table.num_rows:
+                        yield table.to_pandas()
+
+    def archive_before(self, cutoff, archive_rows):
+        """Hand whole months before a month-aligned cutoff to archive_rows, then drop their partitions"""
+        cutoff_key = (cutoff.year, cutoff.month)
+        moved = 0
+        for year, month, path in self._partitions():
+            if (year, month) >= cutoff_key:
+                break
+            files = sorted(glob.glob(os.path.join(path, "*.parquet")))
+            tables = self._read_partition(path)
+            if tables:
+                df = pa.concat_tables(tables).to_pandas()
+                archive_rows(df)
+                moved += len(df)
+            shutil.rmtree(path)
+            with _file_cache_lock:
+                for f in files:
+                    _file_cache.pop(f, None)
+                    _replaces_cache.pop(f, None)
+        return moved
+
+    def import_csv(self, csv_path, chunksize=100000):
+        """One-shot conversion of an existing rejections CSV into partitions"""
+        imported = 0
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+            if chunk.empty:
+                continue
+            self.append(chunk.to_dict('records'))
+            imported += len(chunk)
+        return imported
@@ -0,0 +1,184 @@
+import pandas as pd
+
+from utils.sketches import SKETCH_TOP_K
+
+# Columns a query may filter on, besides the date range
+FILTER_COLUMNS = ('module', 'rejection_type', 'shift', 'operator')
+
+# Columns a query may group on; 'day' is the calendar day of the date
+GROUP_COLUMNS = ('day', 'module', 'rejection_type', 'reason', 'operator', 'shift')
+
+# Columns held by the daily rollup
+ROLLUP_COLUMNS = frozenset({'day', 'module', 'rejection_type', 'shift'})
+
+DEFAULT_METRICS = ('quantity', 'count')
+
+# Distinct counts estimated by the daily sketches
+SKETCH_METRICS = ('unique:operator', 'unique:reason')
+
+
+def normalize_filters(filters):
+    """Return filters as {start_date, end_date, column: tuple of values}, with unset keys dropped"""
+    filters = dict(filters or {})
+    unknown = set(filters) - {'start_date', 'end_date'} - set(FILTER_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown query filters: {', '.join(sorted(unknown))}")
+
+    normalized = {}
+    for key in ('start_date', 'end_date'):
+        if filters.get(key) is not None:
+            normalized[key] = pd.Timestamp(filters[key])
+    for column in FILTER_COLUMNS:
+        value = filters.get(column)
+        if value is None:
+            continue
+        values = (value,) if isinstance(value, str) else tuple(value)
+        normalized[column] = values
+    return normalized
+
+
+def normalize_spec(spec):
+    """Return an aggregation spec with defaults filled in and names checked.
+
+    A spec is a dict with either 'latest' (number of newest rows to return) or
+    'group_by' (column or list of columns, None for totals), 'metrics'
+    ('quantity', 'count' or 'unique:<column>'), 'top_n' and 'order' ('desc'
+    sorts by the first metric, 'group' by the group columns). With 'approx'
+    set, top reasons by quantity and distinct operators and reasons may be
+    estimated from the daily sketches instead of scanning rows.
+    """
+    if spec.get('latest') is not None:
+        return {'latest': int(spec['latest'])}
+
+    group_by = spec.get('group_by') or ()
+    group_by = (group_by,) if isinstance(group_by, str) else tuple(group_by)
+    for column in group_by:
+        if column not in GROUP_COLUMNS:
+            raise ValueError(f"Cannot group rejections by '{column}'")
+
+    metrics = tuple(spec.get('metrics') or DEFAULT_METRICS)
+    for metric in metrics:
+        if metric in ('quantity', 'count'):
+            continue
+        if not (metric.startswith('unique:') and metric[len('unique:'):] in GROUP_COLUMNS):
+            raise ValueError(f"Unknown query metric '{metric}'")
+
+    order = spec.get('order', 'desc')
+    if order not in ('desc', 'group'):
+        raise ValueError(f"Unknown query order '{order}'")
+    return {'group_by': group_by, 'metrics': metrics, 'top_n': spec.get('top_n'), 'order': order,
+            'approx': bool(spec.get('approx', False))}
+
+
+def query_key(filters, specs):
+    """Hashable key of normalized filters and specs"""
+    return (
+        tuple(sorted(filters.items())),
+        tuple(sorted((name, tuple(sorted(spec.items()))) for name, spec in specs.items()))
+    )
+
+
+def needs_rows(spec, filters):
+    """Whether an aggregation needs raw rows rather than the daily rollup"""
+    if 'latest' in spec or 'operator' in filters:
+        return True
+    columns = set(spec['group_by'])
+    columns.update(metric[len('unique:'):] for metric in spec['metrics'] if metric.startswith('unique:'))
+    return not columns <= ROLLUP_COLUMNS
+
+
+def uses_sketches(spec, filters):
+    """Whether an approximate aggregation can be answered from the daily sketches.
+
+    Sketches cover every row of a day, so no column filter may be set; the
+    caller checks that the range is whole days.
+    """
+    if 'latest' in spec or not spec['approx'] or any(column in filters for column in FILTER_COLUMNS):
+        return False
+    if spec['group_by'] == ('reason',):
+        return (spec['metrics'] == ('quantity',) and spec['order'] == 'desc'
+                and spec['top_n'] is not None and spec['top_n'] <= SKETCH_TOP_K)
+    if spec['group_by']:
+        return False
+    exact = [metric for metric in spec['metrics'] if metric not in SKETCH_METRICS]
+    return len(exact) < len(spec['metrics']) and not needs_rows(dict(spec, metrics=exact), filters)
+
+
+def sketch_aggregate(sketch, spec, exact=None):
+    """Answer a spec accepted by uses_sketches; exact holds its other metrics, from the rollup"""
+    if spec['group_by']:
+        top = sketch.top_reasons.top(spec['top_n'])
+        return pd.DataFrame({'reason': top['item'].astype(object), 'quantity': top['weight']})
+    row = exact.iloc[0].to_dict() if exact is not None else {}
+    row['unique:operator'] = sketch.operators.count()
+    row['unique:reason'] = sketch.reasons.count()
+    return pd.DataFrame([{metric: row[metric] for metric in spec['metrics']}])
+
+
+def filter_mask(df, filters):
+    """Vectorized mask of the rows matching the column filters"""
+    mask = pd.Series(True, index=df.index)
+    for column in FILTER_COLUMNS:
+        if column in filters:
+            mask &= df[column].isin(filters[column])
+    return mask
+
+
+def aggregate(df, specs, is_rollup):
+    """Run several aggregations over one filtered frame, sharing group keys between them.
+
+    Rollup frames carry a 'count' column per group; raw rows count one each.
+    """
+    if not is_rollup:
+        if any('day' in spec.get('group_by', ()) for spec in specs.values()):
+            df = df.assign(day=pd.to_datetime(df['date']).dt.normalize())
+        df = df.assign(count=1)
+
+    groupings = {}
+    results = {}
+    for name, spec in specs.items():
+        if 'latest' in spec:
+            rows = df.drop(columns=['count', 'day'], errors='ignore')
+            results[name] = rows.nlargest(spec['latest'], 'date') if not rows.empty else rows
+            continue
+
+        group_by = list(spec['group_by'])
+        if not group_by:
+            results[name] = pd.DataFrame([{metric: _total(df, metric) for metric in spec['metrics']}])
+            continue
+
+        # Aggregations over the same columns reuse one groupby
+        key = tuple(group_by)
+        if key not in groupings:
+            groupings[key] = df.groupby(group_by, observed=True)
+        grouped = groupings[key]
+        result = pd.DataFrame({metric: _grouped(grouped, metric) for metric in spec['metrics']}).reset_index()
+        results[name] = order_result(result, spec)
+    return results
+
+
+def order_result(result, spec):
+    """Sort a grouped result as the spec asks and keep its top_n rows"""
+    if spec['order'] == 'group':
+        result = result.sort_values(list(spec['group_by']), ignore_index=True)
+    else:
+        result = result.sort_values(spec['metrics'][0], ascending=False, kind='stable', ignore_index=True)
+    if spec['top_n'] is not None:
+        result = result.head(spec['top_n'])
+    return result
+
+
+def _total(df, metric):
+    if metric == 'quantity':
+        return df['quantity'].sum() if not df.empty else 0
+    if metric == 'count':
+        return int(df['count'].sum()) if not df.empty else 0
+    return df[metric[len('unique:'):]].nunique()
+
+
+def _grouped(grouped, metric):
+    if metric == 'quantity':
+        return grouped['quantity'].sum()
+    if metric == 'count':
+        return grouped['count'].sum()
+    return grouped[metric[len('unique:'):]].nunique()
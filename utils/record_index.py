@@ -0,0 +1,385 @@
+import os
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.rejection_csv import REJECTION_COLUMNS, DATE_FORMAT
+from utils.text_index import TokenIndex
+
+# One fixed-width row per record; a record's ID is its row number, counted from 1
+ROW_DTYPE = np.dtype([
+    ('date', '<i8'), ('quantity', '<i4'), ('module', '<i4'), ('rejection_type', '<i4'),
+    ('reason', '<i4'), ('operator', '<i4'), ('shift', '<i4')
+])
+
+# Text columns stored as codes into per-column dictionaries; -1 means missing
+CODED_FIELDS = ('module', 'rejection_type', 'reason', 'operator', 'shift')
+
+# Columns with a posting list of record IDs per value
+INDEXED_FIELDS = ('module', 'operator', 'shift')
+
+# Loaded indexes shared by every session: directory -> _IndexState
+_index_states = {}
+_index_states_lock = threading.Lock()
+
+
+class _Posting:
+    """Ascending record IDs held as gaps in the narrowest unsigned dtype that fits them"""
+
+    def __init__(self):
+        self.first = 0
+        self.last = 0
+        self.size = 0
+        self.gaps = np.empty(0, dtype=np.uint8)
+
+    def extend(self, ids):
+        """Add IDs larger than any already held, in ascending order"""
+        if not len(ids):
+            return
+        if self.size:
+            gaps = np.diff(ids, prepend=self.last)
+        else:
+            self.first = int(ids[0])
+            gaps = np.diff(ids)
+        if len(gaps):
+            dtype = np.promote_types(self.gaps.dtype, np.min_scalar_type(int(gaps.max())))
+            self.gaps = np.concatenate([self.gaps.astype(dtype, copy=False), gaps.astype(dtype)])
+        self.last = int(ids[-1])
+        self.size += len(ids)
+
+    def ids(self):
+        ids = np.empty(self.size, dtype=np.int64)
+        if self.size:
+            ids[0] = self.first
+            np.cumsum(self.gaps, dtype=np.int64, out=ids[1:])
+            ids[1:] += self.first
+        return ids
+
+    def nbytes(self):
+        return self.gaps.nbytes + 24
+
+
+class _IndexState:
+    """One process's copy of an index directory, caught up by reading what was appended"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget everything loaded; the lock is kept so waiting threads stay serialized"""
+        self.files = None
+        self.rows_offset = 0
+        self.values_offset = 0
+        self.rows = np.empty(0, dtype=ROW_DTYPE)
+        self.count = 0
+        self.values = {field: [] for field in CODED_FIELDS}
+        self.codes = {field: {} for field in CODED_FIELDS}
+        self.postings = {field: {} for field in INDEXED_FIELDS}
+        self.categories = {}
+        # Words of distinct reasons, built by the first search
+        self.reason_tokens = None
+
+    def add_value(self, field, value):
+        """Give a new dictionary value the next code"""
+        code = len(self.values[field])
+        self.codes[field][value] = code
+        self.values[field].append(value)
+        self.categories.pop(field, None)
+        if field == 'reason' and self.reason_tokens is not None:
+            self.reason_tokens.add(code, value)
+        return code
+
+    def get_reason_tokens(self):
+        if self.reason_tokens is None:
+            self.reason_tokens = TokenIndex()
+            for code, reason in enumerate(self.values['reason']):
+                self.reason_tokens.add(code, reason)
+        return self.reason_tokens
+
+    def add_rows(self, rows):
+        """Append rows, growing the buffer geometrically, and post their IDs"""
+        needed = self.count + len(rows)
+        if needed > len(self.rows):
+            grown = np.empty(max(needed, 2 * len(self.rows), 1024), dtype=ROW_DTYPE)
+            grown[:self.count] = self.rows[:self.count]
+            self.rows = grown
+        self.rows[self.count:needed] = rows
+        first_id = self.count + 1
+        self.count = needed
+        for field in INDEXED_FIELDS:
+            codes = rows[field]
+            order = np.argsort(codes, kind='stable')
+            sorted_codes = codes[order]
+            bounds = np.flatnonzero(np.diff(sorted_codes)) + 1
+            for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(order)]):
+                code = int(sorted_codes[start])
+                if code not in self.postings[field]:
+                    self.postings[field][code] = _Posting()
+                self.postings[field][code].extend(order[start:end] + first_id)
+
+    def category_index(self, field):
+        if field not in self.categories:
+            self.categories[field] = pd.Index(self.values[field], dtype=object)
+        return self.categories[field]
+
+
+class RecordIndex:
+    """Record IDs plus operator, shift and module posting lists for every stored rejection.
+
+    A derived copy of the rejections like the daily rollup: rows.bin holds one
+    fixed-width row per record with text columns as dictionary codes, and
+    values.jsonl the dictionaries. Both are append-only, so IDs stay stable
+    while the index is maintained; a rebuild renumbers records in storage
+    order. Callers hold the store write lock around record and rebuild.
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self.rows_path = os.path.join(index_dir, "rows.bin")
+        self.values_path = os.path.join(index_dir, "values.jsonl")
+
+    def exists(self):
+        """Whether the index has been built"""
+        return os.path.exists(self.rows_path)
+
+    def _state(self):
+        key = os.path.abspath(self.index_dir)
+        with _index_states_lock:
+            if key not in _index_states:
+                _index_states[key] = _IndexState()
+            return _index_states[key]
+
+    def _refresh(self, state):
+        """Read rows and dictionary entries appended since this process last looked"""
+        rows_stat = os.stat(self.rows_path)
+        values_stat = os.stat(self.values_path)
+        files = (rows_stat.st_ino, values_stat.st_ino)
+        if state.files != files:
+            # First load, or the index was rebuilt
+            state.reset()
+            state.files = files
+
+        # Dictionary entries are written before the rows that use them
+        if values_stat.st_size > state.values_offset:
+            with open(self.values_path, 'rb') as f:
+                f.seek(state.values_offset)
+                data = f.read(values_stat.st_size - state.values_offset)
+            complete = data[:data.rfind(b'\n') + 1]
+            for field, value in (json.loads(line) for line in complete.splitlines()):
+                state.add_value(field, value)
+            state.values_offset += len(complete)
+
+        # A torn final row from a crashed append is ignored until overwritten
+        size = rows_stat.st_size - rows_stat.st_size % ROW_DTYPE.itemsize
+        if size > state.rows_offset:
+            with open(self.rows_path, 'rb') as f:
+                f.seek(state.rows_offset)
+                rows = np.frombuffer(f.read(size - state.rows_offset), dtype=ROW_DTYPE)
+            state.add_rows(rows)
+            state.rows_offset = size
+
+    def _encode(self, state, df):
+        """Turn a frame of records into index rows, collecting dictionary entries for new values"""
+        rows = np.zeros(len(df), dtype=ROW_DTYPE)
+        dates = pd.to_datetime(df['date'], format=DATE_FORMAT) if df['date'].dtype == object else df['date']
+        rows['date'] = dates.to_numpy(dtype='datetime64[s]').astype(np.int64)
+        rows['quantity'] = pd.to_numeric(df['quantity'], errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+        new_entries = []
+        for field in CODED_FIELDS:
+            missing = df[field].isna()
+            values = df[field].astype(object).astype(str).where(~missing, None)
+            known = state.codes[field]
+            for value in pd.unique(values):
+                if value is not None and value not in known:
+                    state.add_value(field, value)
+                    new_entries.append([field, value])
+            rows[field] = values.map(known).fillna(-1).to_numpy(dtype=np.int64)
+        return rows, new_entries
+
+    def _append(self, state, rows, new_entries):
+        os.makedirs(self.index_dir, exist_ok=True)
+        if new_entries:
+            with open(self.values_path, 'ab') as f:
+                payload = "".join(json.dumps(entry) + "\n" for entry in new_entries).encode('utf-8')
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            state.values_offset += len(payload)
+        with open(self.rows_path, 'ab') as f:
+            # Drop a torn row left by a crash so later rows stay aligned
+            if f.tell() % ROW_DTYPE.itemsize:
+                f.truncate(f.tell() - f.tell() % ROW_DTYPE.itemsize)
+            f.write(rows.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        state.add_rows(rows)
+        state.rows_offset += rows.nbytes
+
+    def record(self, records):
+        """Assign IDs to newly written rejection records"""
+        if not self.exists():
+            # Built from the raw data on first lookup instead
+            return
+        state = self._state()
+        with state.lock:
+            self._refresh(state)
+            rows, new_entries = self._encode(state, pd.DataFrame.from_records(records, columns=REJECTION_COLUMNS))
+            self._append(state, rows, new_entries)
+
+    def rebuild(self, chunks):
+        """Rebuild the index from rejection frames in storage order; returns the record count"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        tmp = self.index_dir + os.sep + ".rebuild"
+        state = _IndexState()
+        with open(tmp + ".rows", 'wb') as rows_file, open(tmp + ".values", 'wb') as values_file:
+            for df in chunks:
+                rows, new_entries = self._encode(state, df)
+                values_file.write("".join(json.dumps(entry) + "\n" for entry in new_entries).encode('utf-8'))
+                rows_file.write(rows.tobytes())
+                state.count += len(rows)
+            for f in (rows_file, values_file):
+                f.flush()
+                os.fsync(f.fileno())
+        # Dictionaries first: a reader seeing the new rows always finds their values
+        os.replace(tmp + ".values", self.values_path)
+        os.replace(tmp + ".rows", self.rows_path)
+        return state.count
+
+    def _matching_ids(self, state, filters, tables=None):
+        """IDs matching filters, starting from the smallest posting list that applies.
+
+        tables maps further columns to boolean lookup tables indexed by code
+        (one extra slot last, for -1); those checks run before the filters.
+        """
+        candidates = None
+        for field in INDEXED_FIELDS:
+            if field not in filters:
+                continue
+            postings = [state.postings[field].get(state.codes[field].get(value)) for value in filters[field]]
+            postings = [posting for posting in postings if posting is not None]
+            size = sum(posting.size for posting in postings)
+            if candidates is None or size < candidates[0]:
+                candidates = (size, field, postings)
+
+        # None stands for every ID, so the first check reads columns without gathering
+        ids = None
+        checked = None
+        if candidates is not None:
+            _, checked, postings = candidates
+            ids = np.sort(np.concatenate([posting.ids() for posting in postings])) if postings else np.empty(0, dtype=np.int64)
+
+        tables = dict(tables or {})
+        for field in CODED_FIELDS:
+            if field in filters and field != checked:
+                table = np.zeros(len(state.values[field]) + 1, dtype=bool)
+                table[[state.codes[field][value] for value in filters[field] if value in state.codes[field]]] = True
+                tables[field] = table
+
+        columns = state.rows[:state.count]
+        bounds = [filters[key].to_datetime64().astype('datetime64[s]').astype(np.int64) if key in filters else None
+                  for key in ('start_date', 'end_date')]
+        checks = [(field, lambda values, table=table: table[values]) for field, table in tables.items()]
+        if bounds != [None, None]:
+            low = bounds[0] if bounds[0] is not None else np.iinfo(np.int64).min
+            high = bounds[1] if bounds[1] is not None else np.iinfo(np.int64).max
+            checks.append(('date', lambda values: (values >= low) & (values <= high)))
+
+        for field, check in checks:
+            if ids is None:
+                ids = np.flatnonzero(check(columns[field])) + 1
+            else:
+                ids = ids[check(columns[field][ids - 1])]
+        if ids is None:
+            ids = np.arange(1, state.count + 1, dtype=np.int64)
+        return ids
+
+    def _frame(self, state, ids, rows):
+        df = pd.DataFrame({'id': ids, 'date': pd.to_datetime(rows['date'], unit='s')})
+        for column in REJECTION_COLUMNS[1:]:
+            if column == 'quantity':
+                df['quantity'] = rows['quantity']
+            else:
+                df[column] = pd.Categorical.from_codes(rows[column], categories=state.category_index(column))
+        return df
+
+    def find(self, filters):
+        """Records matching normalized filters (see utils.query.normalize_filters), by ID"""
+        state = self._state()
+        with state.lock:
+            self._refresh(state)
+            ids = self._matching_ids(state, filters)
+            return self._frame(state, ids, state.rows[ids - 1])
+
+    def search_reasons(self, query, filters, limit=50):
+        """Records matching filters whose reason contains every word of query; see DataManager.search_reasons"""
+        state = self._state()
+        with state.lock:
+            self._refresh(state)
+            # One flag per distinct reason; rows are matched by looking up their code
+            hits = np.zeros(len(state.values['reason']) + 1, dtype=bool)
+            hits[state.get_reason_tokens().search(query)] = True
+            ids = self._matching_ids(state, filters, {'reason': hits})
+            rows = state.rows[ids - 1]
+
+            counts = np.bincount(rows['reason'], minlength=len(hits))
+            quantities = np.bincount(rows['reason'], weights=rows['quantity'], minlength=len(hits))
+            codes = np.flatnonzero(counts)
+            by_reason = pd.DataFrame({
+                'reason': state.category_index('reason')[codes],
+                'count': counts[codes],
+                'quantity': quantities[codes].astype(np.int64)
+            }).sort_values(['count', 'quantity'], ascending=False, ignore_index=True)
+
+            newest = np.arange(len(ids))
+            if len(ids) > limit:
+                newest = np.argpartition(rows['date'], len(ids) - limit)[len(ids) - limit:]
+            newest = newest[np.lexsort((ids[newest], rows['date'][newest]))[::-1]]
+            return {
+                'matches': len(ids),
+                'quantity': int(rows['quantity'].sum()),
+                'by_reason': by_reason,
+                'records': self._frame(state, ids[newest], rows[newest])
+            }
+
+    def get(self, record_ids):
+        """Records with these IDs; unknown IDs are left out"""
+        state = self._state()
+        with state.lock:
+            self._refresh(state)
+            ids = np.unique(np.asarray(record_ids, dtype=np.int64))
+            ids = ids[(ids >= 1) & (ids <= state.count)]
+            return self._frame(state, ids, state.rows[ids - 1])
+
+    def stats(self):
+        """Record count and bytes held by the posting lists per indexed column"""
+        state = self._state()
+        with state.lock:
+            self._refresh(state)
+            sizes = {field: sum(posting.nbytes() for posting in postings.values())
+                     for field, postings in state.postings.items()}
+            return {'records': state.count, 'posting_bytes': sizes}
+
+
+if __name__ == "__main__":
+    import argparse
+    from utils.data_manager import DataManager
+
+    parser = argparse.ArgumentParser(description="Maintain the QRMS record ID index")
+    parser.add_argument("command", choices=["rebuild", "stats"])
+    parser.add_argument("--storage", help="Storage backend, defaults to QRMS_STORAGE")
+    args = parser.parse_args()
+
+    data_manager = DataManager(storage=args.storage)
+    if data_manager.record_index is None:
+        print("SQLite storage has no record index; rows carry their own IDs")
+        raise SystemExit(1)
+    if args.command == "rebuild":
+        print(f"Indexed {data_manager.rebuild_record_index()} records")
+    else:
+        stats = data_manager.get_record_index().stats()
+        print(f"{stats['records']} records")
+        for field, size in stats['posting_bytes'].items():
+            print(f"  {field}: {size} bytes of posting lists")
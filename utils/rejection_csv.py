@@ -0,0 +1,109 @@
+import io
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+    pa_csv = None
+
+REJECTION_COLUMNS = ['date', 'module', 'rejection_type', 'quantity', 'reason', 'operator', 'shift']
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Low-cardinality columns kept as categories in parsed frames
+CATEGORY_COLUMNS = ['module', 'rejection_type', 'operator', 'shift']
+REJECTION_DTYPES = {column: 'category' for column in CATEGORY_COLUMNS}
+REJECTION_DTYPES['quantity'] = 'int32'
+
+
+def parse_rejection_rows(data, columns):
+    """Parse headerless rejection CSV bytes into a typed frame"""
+    if not data.strip():
+        return pd.DataFrame(columns=columns)
+    if pa_csv is not None:
+        try:
+            return _parse_rejection_rows_arrow(data, columns)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            # Unexpected date format or missing values; let pandas cope
+            pass
+    return _parse_rejection_rows_pandas(data, columns)
+
+
+def _parse_rejection_rows_arrow(data, columns):
+    """Parse with the multithreaded pyarrow CSV reader"""
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+    column_types = {column: dictionary for column in CATEGORY_COLUMNS if column in columns}
+    if 'quantity' in columns:
+        column_types['quantity'] = pa.int32()
+    if 'date' in columns:
+        # Declared so a hand-edited date raises into the pandas fallback instead of leaving a string column
+        column_types['date'] = pa.timestamp('s')
+    table = pa_csv.read_csv(
+        io.BytesIO(data),
+        read_options=pa_csv.ReadOptions(column_names=columns),
+        # Reasons typed into a text area may contain quoted newlines
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(
+            column_types=column_types,
+            timestamp_parsers=[DATE_FORMAT],
+            strings_can_be_null=True
+        )
+    )
+    return table.to_pandas()
+
+
+def _parse_rejection_rows_pandas(data, columns):
+    """Parse with the pandas C engine, declaring the schema up front"""
+    dtypes = {column: dtype for column, dtype in REJECTION_DTYPES.items() if column in columns}
+    try:
+        df = pd.read_csv(io.BytesIO(data), header=None, names=columns, dtype=dtypes)
+    except ValueError:
+        # Missing quantities cannot be held in int32
+        dtypes.pop('quantity', None)
+        df = pd.read_csv(io.BytesIO(data), header=None, names=columns, dtype=dtypes)
+    return _parse_dates(df)
+
+
+def _parse_dates(df):
+    """Convert the date column in place, tolerating hand-edited formats"""
+    if not df.empty and 'date' in df.columns:
+        try:
+            df['date'] = pd.to_datetime(df['date'], format=DATE_FORMAT)
+        except ValueError:
+            df['date'] = pd.to_datetime(df['date'], format='mixed')
+    return df
+
+
+def iter_rejection_rows(f, columns, chunksize):
+    """Parse headerless rejection CSV from a binary file object in chunks of rows"""
+    # Quantity stays inferred; one bad row must not fail the whole stream
+    dtypes = {column: dtype for column, dtype in REJECTION_DTYPES.items() if column in columns and column != 'quantity'}
+    try:
+        reader = pd.read_csv(f, header=None, names=columns, dtype=dtypes, chunksize=chunksize)
+        for chunk in reader:
+            yield _parse_dates(chunk)
+    except pd.errors.EmptyDataError:
+        return
+
+
+def concat_rejections(frames):
+    """Concatenate rejection frames, keeping shared categories for the category columns"""
+    frames = [df for df in frames if not df.empty]
+    if not frames:
+        return pd.DataFrame(columns=REJECTION_COLUMNS)
+    if len(frames) == 1:
+        return frames[0]
+
+    frames = [df.copy(deep=False) for df in frames]
+    for column in CATEGORY_COLUMNS:
+        if not all(column in df.columns and isinstance(df[column].dtype, pd.CategoricalDtype) for df in frames):
+            continue
+        categories = frames[0][column].cat.categories
+        for df in frames[1:]:
+            categories = categories.union(df[column].cat.categories)
+        for df in frames:
+            if not categories.equals(df[column].cat.categories):
+                df[column] = df[column].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,150 @@
+import os
+import csv
+import threading
+
+import pandas as pd
+
+ROLLUP_KEYS = ['day', 'module', 'rejection_type', 'shift']
+ROLLUP_COLUMNS = ROLLUP_KEYS + ['count', 'quantity']
+
+# Process-wide cache of aggregated rollups: path -> ((mtime_ns, size), frame, delta lines)
+_rollup_cache = {}
+_rollup_cache_lock = threading.Lock()
+
+# Compact the delta log once it holds this many more lines than aggregated rows
+COMPACT_SLACK = 5000
+
+
+def empty_rollup():
+    """Empty rollup frame with the standard columns"""
+    return pd.DataFrame({
+        'day': pd.Series(dtype='datetime64[ns]'),
+        'module': pd.Series(dtype='category'),
+        'rejection_type': pd.Series(dtype='category'),
+        'shift': pd.Series(dtype='category'),
+        'count': pd.Series(dtype='int64'),
+        'quantity': pd.Series(dtype='int64'),
+    })
+
+
+def rollup_frame(df):
+    """Aggregate raw rejection rows into day x module x rejection_type x shift"""
+    if df.empty:
+        return empty_rollup()
+    keys = [
+        df['date'].dt.normalize().rename('day'),
+        df['module'].astype('category'),
+        df['rejection_type'].astype('category'),
+        df['shift'].astype('category'),
+    ]
+    rollup = df.groupby(keys, observed=True).agg(
+        count=('quantity', 'size'),
+        quantity=('quantity', 'sum')
+    ).reset_index()
+    rollup['count'] = rollup['count'].astype('int64')
+    rollup['quantity'] = rollup['quantity'].astype('int64')
+    return rollup
+
+
+class DailyRollup:
+    """Persisted count and sum(quantity) per day, module, rejection type and shift.
+
+    Writes append one delta line per record; readers aggregate the deltas and
+    the log is compacted back to one line per group when it grows.
+    Callers hold the store write lock around record, compact and rebuild.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        """Whether the rollup has been built"""
+        return os.path.exists(self.path)
+
+    def record(self, records):
+        """Append deltas for newly written rejection records"""
+        if not self.exists():
+            # Built from the raw data on first read instead
+            return
+        with open(self.path, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            for record in records:
+                writer.writerow([
+                    str(record['date'])[:10], record['module'], record['rejection_type'],
+                    record['shift'], 1, int(record['quantity'])
+                ])
+
+    def _write(self, rollup):
+        """Replace the rollup file atomically with aggregated rows"""
+        out = rollup.copy()
+        out['day'] = out['day'].dt.strftime('%Y-%m-%d')
+        tmp_path = self.path + ".tmp"
+        out[ROLLUP_COLUMNS].to_csv(tmp_path, index=False)
+        os.replace(tmp_path, self.path)
+
+    def rebuild(self, rejections_df):
+        """Rebuild the rollup from raw rejection rows"""
+        rollup = rollup_frame(rejections_df)
+        self._write(rollup)
+        return rollup
+
+    def load(self):
+        """Load the aggregated rollup, reusing the cached copy while unchanged"""
+        stat = os.stat(self.path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with _rollup_cache_lock:
+            cached = _rollup_cache.get(self.path)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+
+        raw = pd.read_csv(
+            self.path,
+            dtype={'module': 'category', 'rejection_type': 'category', 'shift': 'category',
+                   'count': 'int64', 'quantity': 'int64'}
+        )
+        raw['day'] = pd.to_datetime(raw['day'], format='%Y-%m-%d')
+        rollup = raw.groupby(ROLLUP_KEYS, observed=True)[['count', 'quantity']].sum().reset_index()
+
+        with _rollup_cache_lock:
+            _rollup_cache[self.path] = (version, rollup, len(raw))
+        return rollup
+
+    def needs_compaction(self):
+        """Whether the delta log holds many more lines than aggregated groups"""
+        with _rollup_cache_lock:
+            cached = _rollup_cache.get(self.path)
+        return cached is not None and cached[2] > len(cached[1]) + COMPACT_SLACK
+
+    def compact(self):
+        """Rewrite the delta log as one line per group"""
+        self._write(self.load())
+
+    def query(self, start_date=None, end_date=None, module=None, rejection_type=None):
+        """Rollup rows for whole days in range, optionally for one module and type"""
+        rollup = self.load()
+        mask = pd.Series(True, index=rollup.index)
+        if start_date is not None:
+            mask &= rollup['day'] >= pd.Timestamp(start_date).normalize()
+        if end_date is not None:
+            mask &= rollup['day'] <= pd.Timestamp(end_date).normalize()
+        if module is not None:
+            mask &= rollup['module'] == module
+        if rejection_type is not None:
+            mask &= rollup['rejection_type'] == rejection_type
+        return rollup[mask]
+
+
+if __name__ == "__main__":
+    import argparse
+    from utils.data_manager import DataManager
+
+    parser = argparse.ArgumentParser(description="Maintain the QRMS daily rejection rollup")
+    parser.add_argument("command", choices=["rebuild"])
+    args = parser.parse_args()
+
+    try:
+        groups = DataManager().rebuild_rollup()
+    except RuntimeError as e:
+        print(str(e))
+        raise SystemExit(1)
+    print(f"Rebuilt daily rollup with {groups} groups")
@@ -2,6 +2,7 @@ import schedule
 import time
 import threading
 from utils.email_sender import EmailSender
+from utils.data_manager import DataManager
 import os
 
 class ReportScheduler:
@@ -9,6 +10,7 @@ class ReportScheduler:
         self.email_sender = EmailSender()
         self.is_running = False
         self.schedule_time = os.getenv("DAILY_REPORT_TIME", "08:00")  # Default to 8:00 AM
+        self.retention_time = os.getenv("QRMS_RETENTION_TIME", "02:00")
     
     def send_daily_report_job(self):
         """Job function to send daily report"""
@@ -22,6 +24,14 @@ class ReportScheduler:
         except Exception as e:
             print(f"Error in scheduled daily report: {str(e)}")
     
+    def apply_retention_job(self):
+        """Job function to move expired rejections into the archive"""
+        try:
+            success, message = DataManager().apply_retention()
+            print(message if success else f"Scheduled retention failed: {message}")
+        except Exception as e:
+            print(f"Error in scheduled retention: {str(e)}")
+    
     def setup_schedule(self):
         """Setup the daily schedule"""
         # Clear any existing schedules
@@ -30,6 +40,11 @@ class ReportScheduler:
         # Schedule daily report
         schedule.every().day.at(self.schedule_time).do(self.send_daily_report_job)
         print(f"Daily report scheduled for {self.schedule_time}")
+        
+        # Schedule retention when it is configured
+        if DataManager().retention_months > 0:
+            schedule.every().day.at(self.retention_time).do(self.apply_retention_job)
+            print(f"Retention scheduled for {self.retention_time}")
     
     def run_scheduler(self):
         """Run the scheduler in a loop"""
@@ -0,0 +1,514 @@
+import io
+import os
+import csv
+import gzip
+import json
+import time
+import threading
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+    pa_ipc = None
+
+from utils.file_lock import locked
+from utils.rejection_csv import REJECTION_COLUMNS, DATE_FORMAT, parse_rejection_rows, concat_rejections
+
+MANIFEST_NAME = "manifest.json"
+
+# The active segment is sealed when the day changes or it reaches this many rows
+SEGMENT_MAX_ROWS = int(os.getenv("QRMS_SEGMENT_MAX_ROWS", "50000"))
+
+# Sealed segments are mirrored to uncompressed Arrow IPC files and memory-mapped,
+# so every process on the host shares the same page-cache pages
+MMAP_SEALED = os.getenv("QRMS_SEGMENT_MMAP", "1") != "0"
+ARROW_SUFFIX = ".arrow"
+
+# Compaction merges runs of at least this many small sealed segments ...
+COMPACT_MIN_SEGMENTS = 4
+# ... into files of up to this many rows
+COMPACT_TARGET_ROWS = 1000000
+
+# Sealed segments never change, so their parsed frames are cached until compacted away
+_sealed_cache = {}
+# Active segments: path -> ((mtime_ns, size), frame)
+_active_cache = {}
+# All rows of a store, concatenated once per snapshot: root_dir -> (segment frames, frame)
+_all_cache = {}
+_cache_lock = threading.Lock()
+
+# Background compactors per store directory
+_compactors = {}
+_compactors_lock = threading.Lock()
+
+
+class SegmentedRejectionStore:
+    """Rejections in a small active CSV segment plus immutable sealed segments.
+
+    manifest.json lists the active segment and the sealed segments in order.
+    It is only replaced atomically under the store lock, so readers always see
+    a consistent set of files even while the compactor runs.
+    """
+
+    def __init__(self, root_dir, lock_file):
+        self.root_dir = root_dir
+        self.lock_file = lock_file
+        self.manifest_path = os.path.join(self.root_dir, MANIFEST_NAME)
+        os.makedirs(self.root_dir, exist_ok=True)
+        if not os.path.exists(self.manifest_path):
+            with locked(self.lock_file):
+                if not os.path.exists(self.manifest_path):
+                    self._write_manifest({
+                        'active': self._new_active(1),
+                        'sealed': [],
+                        'next_seq': 2
+                    })
+
+    def _new_active(self, seq):
+        """Manifest entry for a new, empty active segment"""
+        return {'file': f"seg-{seq:08d}.csv", 'rows': 0, 'min_date': None, 'max_date': None}
+
+    def _path(self, name):
+        return os.path.join(self.root_dir, name)
+
+    def _read_manifest(self):
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest):
+        """Replace the manifest atomically; callers hold the store lock"""
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+
+    # Writes
+
+    def _write_rows(self, entry, records):
+        """Append records to a segment file with one write and fsync"""
+        if not records:
+            return
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for record in records:
+            writer.writerow([record[column] for column in REJECTION_COLUMNS])
+        with open(self._path(entry['file']), 'ab') as f:
+            f.write(buffer.getvalue().encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        days = [str(record['date'])[:10] for record in records]
+        entry['rows'] += len(records)
+        entry['min_date'] = min([d for d in [entry['min_date']] + days if d])
+        entry['max_date'] = max([d for d in [entry['max_date']] + days if d])
+
+    def append(self, records):
+        """Append records to the active segment, sealing it on day change or size; callers hold the store lock.
+
+        Either the whole batch is stored or, on error, the active segment is
+        truncated back and any segments started for the batch are removed.
+        """
+        manifest = self._read_manifest()
+        active = manifest['active']
+        first_path = self._path(active['file'])
+        first_size = os.path.getsize(first_path) if os.path.exists(first_path) else None
+        started = []
+        try:
+            pending = []
+            for record in records:
+                day = str(record['date'])[:10]
+                rows = active['rows'] + len(pending)
+                current_day = pending[-1]['date'][:10] if pending else active['max_date']
+                if rows and (rows >= SEGMENT_MAX_ROWS or day != current_day):
+                    self._write_rows(active, pending)
+                    pending = []
+                    manifest['sealed'].append(active)
+                    active = self._new_active(manifest['next_seq'])
+                    manifest['next_seq'] += 1
+                    started.append(active['file'])
+                pending.append(record)
+            self._write_rows(active, pending)
+            manifest['active'] = active
+            self._write_manifest(manifest)
+        except Exception:
+            # The manifest on disk still describes the files as they were before the batch
+            if first_size is None:
+                self._remove_segment(os.path.basename(first_path))
+            elif os.path.exists(first_path):
+                with open(first_path, 'r+b') as f:
+                    f.truncate(first_size)
+            for name in started:
+                self._remove_segment(name)
+            raise
+
+    # Reads
+
+    def _read_segment(self, name):
+        """Parse one segment file (plain or gzip-compressed headerless CSV)"""
+        path = self._path(name)
+        opener = gzip.open if name.endswith('.gz') else open
+        with opener(path, 'rb') as f:
+            data = f.read()
+        return parse_rejection_rows(data[:data.rfind(b'\n') + 1], REJECTION_COLUMNS)
+
+    def _arrow_path(self, name):
+        return self._path(name + ARROW_SUFFIX)
+
+    def _write_arrow(self, name, df):
+        """Write the Arrow IPC mirror of a sealed segment atomically"""
+        path = self._arrow_path(name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa_ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+
+    def _map_arrow(self, name):
+        """Memory-map a sealed segment's Arrow mirror without copying its buffers"""
+        source = pa.memory_map(self._arrow_path(name), 'r')
+        table = pa_ipc.open_file(source).read_all()
+        # split_blocks lets pandas wrap the mapped columns instead of consolidating copies
+        return table.to_pandas(split_blocks=True)
+
+    def _read_sealed(self, name):
+        """Read a sealed segment, memory-mapped from its Arrow mirror when possible"""
+        if pa_ipc is None or not MMAP_SEALED:
+            return self._read_segment(name)
+        if not os.path.exists(self._arrow_path(name)):
+            df = self._read_segment(name)
+            try:
+                self._write_arrow(name, df)
+            except (OSError, pa.ArrowException) as e:
+                print(f"Error writing Arrow mirror for {name}: {str(e)}")
+                return df
+        try:
+            return self._map_arrow(name)
+        except pa.ArrowInvalid:
+            # Truncated mirror, e.g. after a crash; rebuild it from the segment
+            os.remove(self._arrow_path(name))
+            return self._read_sealed(name)
+
+    def _load_sealed(self, name):
+        path = self._path(name)
+        with _cache_lock:
+            if path in _sealed_cache:
+                return _sealed_cache[path]
+        df = self._read_sealed(name)
+        with _cache_lock:
+            _sealed_cache[path] = df
+        return df
+
+    def _load_active(self, name):
+        path = self._path(name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return pd.DataFrame(columns=REJECTION_COLUMNS)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with _cache_lock:
+            cached = _active_cache.get(path)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+        df = self._read_segment(name)
+        with _cache_lock:
+            _active_cache[path] = (version, df)
+        return df
+
+    def _evict(self, manifest):
+        """Drop cached frames of segments no longer in the manifest"""
+        live = {self._path(entry['file']) for entry in manifest['sealed']}
+        active = self._path(manifest['active']['file'])
+        with _cache_lock:
+            for path in [p for p in _sealed_cache if p.startswith(self.root_dir) and p not in live]:
+                del _sealed_cache[path]
+            for path in [p for p in _active_cache if p.startswith(self.root_dir) and p != active]:
+                del _active_cache[path]
+
+    def _overlaps(self, entry, start_day, end_day):
+        if entry['min_date'] is None:
+            return True
+        if start_day and entry['max_date'] < start_day:
+            return False
+        if end_day and entry['min_date'] > end_day:
+            return False
+        return True
+
+    def _snapshot(self, start_date=None, end_date=None):
+        """(entry, frame) of a consistent set of segments, skipping segments outside the range; the active one is last"""
+        start_day = pd.Timestamp(start_date).strftime('%Y-%m-%d') if start_date is not None else None
+        end_day = pd.Timestamp(end_date).strftime('%Y-%m-%d') if end_date is not None else None
+
+        for attempt in range(5):
+            manifest = self._read_manifest()
+            try:
+                segments = [
+                    (entry, self._load_sealed(entry['file']))
+                    for entry in manifest['sealed']
+                    if self._overlaps(entry, start_day, end_day)
+                ]
+                segments.append((manifest['active'], self._load_active(manifest['active']['file'])))
+                break
+            except FileNotFoundError:
+                # A compaction replaced these files after we read the manifest
+                time.sleep(0.01)
+        else:
+            raise RuntimeError("Could not read a consistent segment snapshot")
+        self._evict(manifest)
+        return segments
+
+    def _filter_dates(self, df, start_date=None, end_date=None):
+        if df.empty:
+            return df
+        if start_date is not None:
+            df = df[df['date'] >= pd.Timestamp(start_date)]
+        if end_date is not None:
+            df = df[df['date'] <= pd.Timestamp(end_date)]
+        return df
+
+    def _inside(self, entry, start_date=None, end_date=None):
+        """Whether every row of a sealed segment lies within the range, judged by whole days"""
+        if start_date is not None and entry['min_date'] <= pd.Timestamp(start_date).strftime('%Y-%m-%d'):
+            return False
+        if end_date is not None and entry['max_date'] >= pd.Timestamp(end_date).strftime('%Y-%m-%d'):
+            return False
+        return True
+
+    def load(self, start_date=None, end_date=None):
+        """Load a consistent snapshot of rejections in the date range.
+
+        Segments are filtered before they are concatenated, so a range only
+        copies its own rows out of the memory-mapped segments. All rows are
+        concatenated once per snapshot and shared by every caller.
+        """
+        segments = self._snapshot(start_date, end_date)
+        if start_date is None and end_date is None:
+            return self._load_all([df for _, df in segments])
+        # The active segment may hold rows newer than its manifest entry, so it is always filtered
+        frames = [df if self._inside(entry, start_date, end_date) else self._filter_dates(df, start_date, end_date)
+                  for entry, df in segments[:-1]]
+        frames.append(self._filter_dates(segments[-1][1], start_date, end_date))
+        return concat_rejections(frames)
+
+    def _load_all(self, frames):
+        """Concatenate every segment's frame, reusing the copy made for the same frames"""
+        with _cache_lock:
+            cached = _all_cache.get(self.root_dir)
+        if cached is not None and len(cached[0]) == len(frames) and all(a is b for a, b in zip(cached[0], frames)):
+            return cached[1]
+        df = concat_rejections(frames)
+        with _cache_lock:
+            _all_cache[self.root_dir] = (frames, df)
+        return df
+
+    def iter_chunks(self, start_date=None, end_date=None, chunksize=50000):
+        """Yield rejections in the date range segment by segment, in chunks of at most chunksize rows"""
+        # Sealed frames are cached or memory-mapped, so holding the snapshot costs no extra copies
+        for _, df in self._snapshot(start_date, end_date):
+            df = self._filter_dates(df, start_date, end_date)
+            for start in range(0, len(df), chunksize):
+                yield df.iloc[start:start + chunksize]
+
+    # Retention
+
+    def archive_before(self, cutoff, archive_rows):
+        """Hand rows dated before cutoff to archive_rows, then drop them; callers hold the store lock.
+
+        Segments wholly before the cutoff are dropped. Segments that cross it,
+        including the active one, are replaced by new segments holding only
+        the rows that stay hot.
+        """
+        cutoff = pd.Timestamp(cutoff)
+        cutoff_day = cutoff.strftime('%Y-%m-%d')
+        manifest = self._read_manifest()
+        expired_frames = []
+        dropped = []
+        written = []
+        try:
+            sealed = []
+            for entry in manifest['sealed']:
+                if entry['min_date'] is None or entry['min_date'] > cutoff_day:
+                    sealed.append(entry)
+                    continue
+                df = self._load_sealed(entry['file'])
+                expired = df['date'] < cutoff
+                if not expired.any():
+                    sealed.append(entry)
+                    continue
+                expired_frames.append(df[expired])
+                dropped.append(entry['file'])
+                if not expired.all():
+                    kept = self._write_segment(manifest, df[~expired], sealed=True)
+                    written.append(kept['file'])
+                    sealed.append(kept)
+
+            active = manifest['active']
+            if active['min_date'] is not None and active['min_date'] <= cutoff_day:
+                df = self._load_active(active['file'])
+                expired = df['date'] < cutoff
+                if expired.any():
+                    expired_frames.append(df[expired])
+                    dropped.append(active['file'])
+                    active = self._write_segment(manifest, df[~expired], sealed=False)
+                    written.append(active['file'])
+
+            if not expired_frames:
+                return 0
+            # Archives are in place before the hot segments drop the rows
+            df = concat_rejections(expired_frames)
+            archive_rows(df)
+            manifest['sealed'] = sealed
+            manifest['active'] = active
+            self._write_manifest(manifest)
+        except Exception:
+            for name in written:
+                self._remove_segment(name)
+            raise
+        for name in dropped:
+            self._remove_segment(name)
+        self._evict(manifest)
+        return len(df)
+
+    def _write_segment(self, manifest, df, sealed):
+        """Write rows to a new segment named from the manifest; returns its manifest entry.
+
+        Sealed segments are gzip-compressed with an Arrow mirror; an active
+        segment stays a plain CSV that appends extend.
+        """
+        name = f"seg-{manifest['next_seq']:08d}.csv" + (".gz" if sealed else "")
+        manifest['next_seq'] += 1
+        out = df[REJECTION_COLUMNS].copy()
+        out['date'] = out['date'].dt.strftime(DATE_FORMAT)
+        tmp_path = self._path(name + ".tmp")
+        out.to_csv(tmp_path, index=False, header=False, compression='gzip' if sealed else None)
+        os.replace(tmp_path, self._path(name))
+        if sealed and pa_ipc is not None and MMAP_SEALED:
+            try:
+                self._write_arrow(name, df)
+            except (OSError, pa.ArrowException) as e:
+                print(f"Error writing Arrow mirror for {name}: {str(e)}")
+        days = df['date'].dt.strftime('%Y-%m-%d')
+        return {
+            'file': name,
+            'rows': len(df),
+            'min_date': days.min() if len(df) else None,
+            'max_date': days.max() if len(df) else None,
+        }
+
+    # Compaction
+
+    def _compaction_run(self, sealed):
+        """Pick the first run of consecutive small sealed segments worth merging"""
+        run, rows = [], 0
+        for entry in sealed:
+            if entry['rows'] < COMPACT_TARGET_ROWS // 2 and rows + entry['rows'] <= COMPACT_TARGET_ROWS:
+                run.append(entry)
+                rows += entry['rows']
+                continue
+            if len(run) >= COMPACT_MIN_SEGMENTS:
+                return run
+            run, rows = [], 0
+            if entry['rows'] < COMPACT_TARGET_ROWS // 2:
+                run, rows = [entry], entry['rows']
+        return run if len(run) >= COMPACT_MIN_SEGMENTS else []
+
+    def compact(self):
+        """Merge one run of small sealed segments into a sorted, compressed segment"""
+        run = self._compaction_run(self._read_manifest()['sealed'])
+        if not run:
+            return 0
+
+        with locked(self.lock_file):
+            manifest = self._read_manifest()
+            name = f"seg-{manifest['next_seq']:08d}.csv.gz"
+            manifest['next_seq'] += 1
+            self._write_manifest(manifest)
+
+        # Merge outside the lock; sealed segments never change
+        df = concat_rejections([self._load_sealed(entry['file']) for entry in run])
+        df = df.sort_values('date', kind='stable')
+        out = df.copy()
+        out['date'] = out['date'].dt.strftime('%Y-%m-%d %H:%M:%S')
+        tmp_path = self._path(name + ".tmp")
+        out.to_csv(tmp_path, index=False, header=False, compression='gzip')
+        os.replace(tmp_path, self._path(name))
+        if pa_ipc is not None and MMAP_SEALED:
+            try:
+                self._write_arrow(name, df)
+            except (OSError, pa.ArrowException) as e:
+                print(f"Error writing Arrow mirror for {name}: {str(e)}")
+
+        names = [entry['file'] for entry in run]
+        with locked(self.lock_file):
+            manifest = self._read_manifest()
+            current = [entry['file'] for entry in manifest['sealed']]
+            if not all(n in current for n in names):
+                # Another process compacted these first
+                self._remove_segment(name)
+                return 0
+            merged = {
+                'file': name,
+                'rows': sum(entry['rows'] for entry in run),
+                'min_date': min(entry['min_date'] for entry in run),
+                'max_date': max(entry['max_date'] for entry in run),
+            }
+            position = current.index(names[0])
+            sealed = [entry for entry in manifest['sealed'] if entry['file'] not in names]
+            sealed.insert(position, merged)
+            manifest['sealed'] = sealed
+            self._write_manifest(manifest)
+
+        # Readers holding the old manifest retry on FileNotFoundError
+        for n in names:
+            self._remove_segment(n)
+        return len(names)
+
+    def _remove_segment(self, name):
+        """Delete a segment file and its Arrow mirror"""
+        for path in (self._path(name), self._arrow_path(name)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class SegmentCompactor:
+    """Background thread that periodically compacts a segmented store"""
+
+    def __init__(self, store, interval=60):
+        self.store = store
+        self.interval = interval
+        self.is_running = False
+
+    def run(self):
+        self.is_running = True
+        while self.is_running:
+            try:
+                # Keep merging while there is work, then wait
+                while self.is_running and self.store.compact():
+                    pass
+            except Exception as e:
+                print(f"Segment compaction error: {str(e)}")
+            time.sleep(self.interval)
+
+    def start(self):
+        if not self.is_running:
+            threading.Thread(target=self.run, daemon=True).start()
+
+    def stop(self):
+        self.is_running = False
+
+
+def start_compactor(store, interval=60):
+    """Start the background compactor for a store once per process"""
+    key = os.path.abspath(store.root_dir)
+    with _compactors_lock:
+        if key not in _compactors:
+            _compactors[key] = SegmentCompactor(store, interval)
+            _compactors[key].start()
+        return _compactors[key]
@@ -0,0 +1,252 @@
+import os
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+from utils.data_manager import DataManager
+from utils.rejection_csv import REJECTION_COLUMNS
+from utils.query import normalize_filters, normalize_spec, query_key, order_result
+
+# Worker pool shared by every session; created on first cross-plant query
+_pool = None
+_pool_lock = threading.Lock()
+
+# Merged cross-plant results, least recently used first: key -> {name: frame}
+_shard_cache = OrderedDict()
+_shard_cache_lock = threading.Lock()
+SHARD_CACHE_SIZE = 64
+
+# Columns of the rows ShardSet.iter_rejections yields: each row names its plant
+PLANT_COLUMNS = REJECTION_COLUMNS[:1] + ['plant'] + REJECTION_COLUMNS[1:]
+
+
+def load_shards():
+    """Plant name -> data directory from QRMS_SHARDS, e.g. "Plant A=/srv/qrms/a,Plant B=/srv/qrms/b" """
+    shards = OrderedDict()
+    for entry in os.getenv("QRMS_SHARDS", "").split(","):
+        if "=" not in entry:
+            continue
+        name, data_dir = entry.split("=", 1)
+        if name.strip() and data_dir.strip():
+            shards[name.strip()] = data_dir.strip()
+    return shards
+
+
+def get_pool(workers):
+    """Get the shared process pool, creating it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            max_workers = int(os.getenv("QRMS_SHARD_WORKERS", "0")) or min(workers, os.cpu_count() or 1)
+            # Spawned, not forked: a forked worker could inherit locks held by
+            # the committer or compactor threads and block forever
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _shard_query(data_dir, storage, filters, aggregations):
+    """Run one plant's part of a query; executed in a pool worker, which keeps its own caches"""
+    return DataManager(storage=storage, data_dir=data_dir).query_many(filters, aggregations)
+
+
+class ShardSet:
+    """Several plant data directories aggregated into one consolidated view.
+
+    Each plant is queried in a pool worker with DataManager.query_many and the
+    partial results are merged here. Views of a single plant should use
+    data_manager(name) directly, so they never wait on the other plants.
+    """
+
+    def __init__(self, shards=None, storage=None):
+        self.shards = OrderedDict(shards if shards is not None else load_shards())
+        self.storage = storage
+        self._managers = {}
+
+    @property
+    def names(self):
+        return list(self.shards)
+
+    def data_manager(self, name):
+        """In-process DataManager for one plant"""
+        if name not in self._managers:
+            self._managers[name] = DataManager(storage=self.storage, data_dir=self.shards[name])
+        return self._managers[name]
+
+    def module_names(self):
+        """Modules of every plant, in first-seen order"""
+        return list(dict.fromkeys(m for name in self.shards for m in self.data_manager(name).get_catalog().module_names))
+
+    def type_names(self):
+        """Rejection types of every plant, in first-seen order"""
+        return list(dict.fromkeys(t for name in self.shards for t in self.data_manager(name).get_catalog().type_names))
+
+    def iter_rejections(self, start_date=None, end_date=None, module=None, rejection_type=None, chunksize=50000):
+        """Yield every plant's matching rows in chunks, plant by plant, with a 'plant' column"""
+        for name in self.shards:
+            for chunk in self.data_manager(name).iter_rejections(start_date, end_date, module, rejection_type, chunksize):
+                yield chunk.assign(plant=name)
+
+    def query_many(self, filters=None, aggregations=None):
+        """Run named aggregations over every plant and merge them.
+
+        Specs are those of DataManager.query_many, and may also group by 'plant'.
+        """
+        filters = normalize_filters(filters)
+        specs = {name: _normalize_shard_spec(spec) for name, spec in (aggregations or {}).items()}
+        shard_specs = _plan_shard_specs(specs)
+
+        versions = tuple(self.data_manager(name).get_query_version() for name in self.shards)
+        key = (tuple(self.shards.items()), self.storage, versions, query_key(filters, specs))
+        with _shard_cache_lock:
+            results = _shard_cache.get(key)
+            if results is not None:
+                _shard_cache.move_to_end(key)
+
+        if results is None:
+            partials = self._run_shards(filters, shard_specs)
+            results = {name: _merge(spec, name, partials) for name, spec in specs.items()}
+            with _shard_cache_lock:
+                _shard_cache[key] = results
+                while len(_shard_cache) > SHARD_CACHE_SIZE:
+                    _shard_cache.popitem(last=False)
+
+        return {name: df.copy() for name, df in results.items()}
+
+    def _run_shards(self, filters, shard_specs):
+        """Query every plant in the process pool; returns plant -> {name: frame}"""
+        try:
+            pool = get_pool(len(self.shards))
+            futures = {
+                name: pool.submit(_shard_query, data_dir, self.storage, filters, shard_specs)
+                for name, data_dir in self.shards.items()
+            }
+            return {name: future.result() for name, future in futures.items()}
+        except BrokenProcessPool as e:
+            # A worker died; answer in-process this time and start a fresh pool next time
+            print(f"Shard pool failed, querying plants in-process: {str(e)}")
+            _reset_pool()
+            return {name: self.data_manager(name).query_many(filters, shard_specs) for name in self.shards}
+
+    def search_reasons(self, query, filters=None, limit=50):
+        """Reason search across every plant; see DataManager.search_reasons"""
+        results = {name: self.data_manager(name).search_reasons(query, filters, limit) for name in self.names}
+        by_reason = pd.concat([result['by_reason'] for result in results.values()], ignore_index=True)
+        by_reason = by_reason.groupby('reason', as_index=False)[['count', 'quantity']].sum()
+        records = pd.concat(
+            [result['records'].assign(plant=name) for name, result in results.items()],
+            ignore_index=True
+        )
+        return {
+            'matches': sum(result['matches'] for result in results.values()),
+            'quantity': sum(result['quantity'] for result in results.values()),
+            'by_reason': by_reason.sort_values(['count', 'quantity'], ascending=False, ignore_index=True),
+            'records': records.sort_values('date', ascending=False, kind='stable').head(limit).reset_index(drop=True)
+        }
+
+    def get_rejection_summary(self, start_date=None, end_date=None):
+        """Consolidated rejection summary for email reports, with totals per plant"""
+        try:
+            if not (start_date and end_date):
+                start_date, end_date = None, None
+
+            results = self.query_many({'start_date': start_date, 'end_date': end_date}, {
+                'totals': {'metrics': ['count', 'quantity']},
+                'by_plant': {'group_by': 'plant', 'metrics': ['quantity']},
+                'by_module': {'group_by': 'module', 'metrics': ['quantity']},
+                'by_type': {'group_by': 'rejection_type', 'metrics': ['quantity']},
+                'recent': {'latest': 5}
+            })
+            totals = results['totals'].iloc[0]
+            if totals['count'] == 0:
+                return None
+
+            return {
+                'total_rejections': int(totals['count']),
+                'total_quantity': totals['quantity'],
+                'by_plant': dict(zip(results['by_plant']['plant'], results['by_plant']['quantity'])),
+                'by_module': dict(zip(results['by_module']['module'], results['by_module']['quantity'])),
+                'by_type': dict(zip(results['by_type']['rejection_type'], results['by_type']['quantity'])),
+                'recent_records': results['recent'].to_dict('records')
+            }
+        except Exception as e:
+            print(f"Error generating consolidated summary: {str(e)}")
+            return None
+
+
+def _normalize_shard_spec(spec):
+    """normalize_spec, allowing 'plant' among the group columns"""
+    if spec.get('latest') is not None:
+        return normalize_spec(spec)
+    group_by = spec.get('group_by') or ()
+    group_by = (group_by,) if isinstance(group_by, str) else tuple(group_by)
+    normalized = normalize_spec(dict(spec, group_by=[c for c in group_by if c != 'plant']))
+    normalized['group_by'] = group_by
+    return normalized
+
+
+def _plan_shard_specs(specs):
+    """Per-plant specs whose results can be merged exactly.
+
+    Sums and counts are merged by adding them up. Distinct counts are not
+    additive, so plants return the distinct values per group instead. Top-N
+    cuts are only applied after merging.
+    """
+    shard_specs = {}
+    for name, spec in specs.items():
+        if 'latest' in spec:
+            shard_specs[name] = spec
+            continue
+        group_by = tuple(c for c in spec['group_by'] if c != 'plant')
+        additive = [m for m in spec['metrics'] if not m.startswith('unique:')] or ['count']
+        shard_specs[name] = {'group_by': group_by, 'metrics': tuple(additive), 'top_n': None, 'order': 'group'}
+        for metric in spec['metrics']:
+            if metric.startswith('unique:'):
+                column = metric[len('unique:'):]
+                columns = group_by if column in group_by else group_by + (column,)
+                shard_specs[f"{name}|{metric}"] = {'group_by': columns, 'metrics': ('count',), 'top_n': None, 'order': 'group'}
+    return shard_specs
+
+
+def _merge(spec, name, partials):
+    """Merge one aggregation from every plant's partial results"""
+    if 'latest' in spec:
+        rows = pd.concat([results[name].assign(plant=plant) for plant, results in partials.items()], ignore_index=True)
+        return rows.nlargest(spec['latest'], 'date') if not rows.empty else rows
+
+    group_by = list(spec['group_by'])
+    base = pd.concat([results[name].assign(plant=plant) for plant, results in partials.items()], ignore_index=True)
+    additive = [m for m in spec['metrics'] if not m.startswith('unique:')]
+
+    if group_by:
+        merged = base.groupby(group_by, observed=True)[additive].sum() if additive else \
+            base.groupby(group_by, observed=True).size().to_frame('count')[[]]
+    else:
+        merged = pd.DataFrame([{m: base[m].sum() if not base.empty else 0 for m in additive}])
+
+    for metric in spec['metrics']:
+        if not metric.startswith('unique:'):
+            continue
+        column = metric[len('unique:'):]
+        values = pd.concat([results[f"{name}|{metric}"].assign(plant=plant) for plant, results in partials.items()], ignore_index=True)
+        if group_by:
+            distinct = values.drop_duplicates(list(dict.fromkeys(group_by + [column])))
+            merged[metric] = distinct.groupby(group_by, observed=True).size()
+        else:
+            merged[metric] = values[column].nunique()
+
+    merged = merged[list(spec['metrics'])]
+    if not group_by:
+        return merged.reset_index(drop=True)
+    return order_result(merged.reset_index(), spec)
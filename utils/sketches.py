@@ -0,0 +1,282 @@
+import os
+import json
+import zlib
+import base64
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Reasons tracked per day by the top-K sketch; more is more accurate but larger
+SKETCH_TOP_K = int(os.getenv("QRMS_SKETCH_TOP_K", "256"))
+
+# 2**12 registers per distinct-count sketch: about 1.6% standard error, 4 KB uncompressed
+HLL_PRECISION = 12
+
+# Compact the sketch log once it holds this many more lines than days
+COMPACT_SLACK = 2000
+
+# Process-wide cache of merged sketches: path -> ((mtime_ns, size), {day: DaySketch}, lines)
+_sketch_cache = {}
+_sketch_cache_lock = threading.Lock()
+
+
+def hash_values(values):
+    """Stable 64-bit hashes of values as text, the same in every process"""
+    return pd.util.hash_array(np.asarray(values, dtype=object).astype(str).astype(object))
+
+
+class HyperLogLog:
+    """Distinct-count sketch; merging two gives the sketch of the union"""
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.registers = registers if registers is not None else np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if not len(hashes):
+            return
+        bits = 64 - self.precision
+        index = (hashes >> np.uint64(bits)).astype(np.int64)
+        rest = hashes & np.uint64((1 << bits) - 1)
+        # Leading zeros of the remaining bits plus one; frexp gives the bit length
+        bit_length = np.frexp(rest.astype(np.float64))[1]
+        rank = (bits - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    @classmethod
+    def combine(cls, sketches, precision=HLL_PRECISION):
+        """Sketch of the union of every sketch's values"""
+        sketches = list(sketches)
+        if not sketches:
+            return cls(precision)
+        return cls(precision, np.maximum.reduce([sketch.registers for sketch in sketches]))
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small sets
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+    def to_text(self):
+        return base64.b64encode(zlib.compress(self.registers.tobytes())).decode('ascii')
+
+    @classmethod
+    def from_text(cls, text, precision=HLL_PRECISION):
+        registers = np.frombuffer(zlib.decompress(base64.b64decode(text)), dtype=np.uint8).copy()
+        return cls(precision, registers)
+
+
+class SpaceSaving:
+    """Top-K heavy hitters by weight, in bounded memory.
+
+    Holds at most capacity items with an overestimated weight and the most
+    that estimate can be over. Any item not held weighs at most floor.
+    Summaries combine, so per-day sketches answer any date range.
+    """
+
+    def __init__(self, capacity=SKETCH_TOP_K, weights=None, errors=None, floor=0):
+        self.capacity = capacity
+        self.weights = weights if weights is not None else pd.Series(dtype='int64')
+        self.errors = errors if errors is not None else pd.Series(dtype='int64')
+        self.floor = floor
+
+    @classmethod
+    def from_exact(cls, items, weights, capacity=SKETCH_TOP_K):
+        """Summary of a batch, exact unless it holds more than capacity distinct items"""
+        totals = pd.Series(np.asarray(weights, dtype=np.int64)).groupby(np.asarray(items, dtype=object)).sum()
+        totals = totals.sort_values(ascending=False, kind='stable')
+        floor = int(totals.iloc[capacity]) if len(totals) > capacity else 0
+        totals = totals.iloc[:capacity]
+        return cls(capacity, totals, pd.Series(0, index=totals.index, dtype='int64'), floor)
+
+    @classmethod
+    def combine(cls, summaries, capacity=SKETCH_TOP_K):
+        """Merge summaries; an item missing from one may weigh up to that summary's floor there"""
+        summaries = list(summaries)
+        floor = sum(summary.floor for summary in summaries)
+        held = [summary for summary in summaries if len(summary.weights)]
+        if not held:
+            return cls(capacity, floor=floor)
+        # Every summary contributes its floor; those holding an item add the rest
+        codes, items = pd.factorize(np.concatenate([summary.weights.index.to_numpy(dtype=object) for summary in held]))
+        weights = np.bincount(codes, np.concatenate([summary.weights.to_numpy() - summary.floor for summary in held])) + floor
+        errors = np.bincount(codes, np.concatenate([summary.errors.to_numpy() - summary.floor for summary in held])) + floor
+        order = np.argsort(-weights, kind='stable')
+        if len(order) > capacity:
+            floor = max(floor, int(weights[order[capacity]]))
+            order = order[:capacity]
+        index = pd.Index(items[order], dtype=object)
+        return cls(capacity, pd.Series(weights[order].astype(np.int64), index=index),
+                   pd.Series(errors[order].astype(np.int64), index=index), floor)
+
+    def is_certain(self, n):
+        """Whether the n heaviest items held are surely the true n heaviest.
+
+        Fails when the range holds many items of similar weight, e.g. one-off
+        free-text reasons: then no n items stand out from what was evicted.
+        """
+        held = len(self.weights)
+        if held <= n:
+            return self.floor == 0
+        lower = (self.weights.iloc[:n] - self.errors.reindex(self.weights.index[:n])).min()
+        return lower >= max(self.floor, int(self.weights.iloc[n]))
+
+    def top(self, n):
+        """The n heaviest items as a frame of item, weight and the most the weight may be overstated"""
+        weights = self.weights.iloc[:n]
+        return pd.DataFrame({'item': weights.index, 'weight': weights.to_numpy(), 'error': self.errors.reindex(weights.index).to_numpy()})
+
+    def to_dict(self):
+        return {'items': [[item, int(weight), int(self.errors[item])] for item, weight in self.weights.items()], 'floor': self.floor}
+
+    @classmethod
+    def from_dict(cls, data, capacity=SKETCH_TOP_K):
+        items = [entry[0] for entry in data['items']]
+        weights = pd.Series([entry[1] for entry in data['items']], index=pd.Index(items, dtype=object), dtype='int64')
+        errors = pd.Series([entry[2] for entry in data['items']], index=weights.index, dtype='int64')
+        return cls(capacity, weights, errors, data['floor'])
+
+
+class DaySketch:
+    """Top reasons by quantity and distinct operators and reasons for a set of rows"""
+
+    def __init__(self, top_reasons=None, operators=None, reasons=None):
+        self.top_reasons = top_reasons or SpaceSaving()
+        self.operators = operators or HyperLogLog()
+        self.reasons = reasons or HyperLogLog()
+
+    @classmethod
+    def from_frame(cls, df):
+        sketch = cls(SpaceSaving.from_exact(df['reason'].astype(object).fillna('').astype(str), df['quantity'].fillna(0)))
+        sketch.operators.add_hashes(hash_values(df['operator'].dropna()))
+        sketch.reasons.add_hashes(hash_values(df['reason'].dropna()))
+        return sketch
+
+    @classmethod
+    def combine(cls, sketches):
+        sketches = list(sketches)
+        return cls(SpaceSaving.combine(sketch.top_reasons for sketch in sketches),
+                   HyperLogLog.combine(sketch.operators for sketch in sketches),
+                   HyperLogLog.combine(sketch.reasons for sketch in sketches))
+
+    def to_dict(self):
+        return {'top_reasons': self.top_reasons.to_dict(), 'operators': self.operators.to_text(), 'reasons': self.reasons.to_text()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(SpaceSaving.from_dict(data['top_reasons']),
+                   HyperLogLog.from_text(data['operators']), HyperLogLog.from_text(data['reasons']))
+
+
+def _combine_days(lines):
+    """Parse log lines and merge their sketches per day"""
+    days = {}
+    for line in lines:
+        data = json.loads(line)
+        days.setdefault(data['day'], []).append(DaySketch.from_dict(data))
+    return {day: sketches[0] if len(sketches) == 1 else DaySketch.combine(sketches) for day, sketches in days.items()}
+
+
+def _sketch_lines(df):
+    """One log line per day of the rows"""
+    days = pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d')
+    return [json.dumps({'day': day, **DaySketch.from_frame(rows).to_dict()}) + "\n" for day, rows in df.groupby(days)]
+
+
+class DailySketches:
+    """Per-day sketches kept beside the daily rollup.
+
+    Writes append one line per day with a sketch of just the new rows;
+    readers merge the lines per day and the log is compacted back to one
+    line per day when it grows. Callers hold the store write lock around
+    record, compact and rebuild.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        """Whether the sketches have been built"""
+        return os.path.exists(self.path)
+
+    def record(self, records):
+        """Append sketches of newly written rejection records"""
+        if not self.exists():
+            # Built from the raw data on first use instead
+            return
+        df = pd.DataFrame.from_records(records, columns=['date', 'reason', 'quantity', 'operator'])
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.writelines(_sketch_lines(df))
+
+    def _write(self, days):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for day in sorted(days):
+                f.write(json.dumps({'day': day, **days[day].to_dict()}) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def rebuild(self, chunks):
+        """Rebuild from rejection frames; returns the number of days"""
+        days = _combine_days(line for df in chunks for line in _sketch_lines(df))
+        self._write(days)
+        return len(days)
+
+    def load(self):
+        """Sketches merged per day, reusing the cached copy while unchanged"""
+        stat = os.stat(self.path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with _sketch_cache_lock:
+            cached = _sketch_cache.get(self.path)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            # A last line without a newline is still being appended
+            lines = [line for line in f if line.endswith("\n")]
+        days = _combine_days(lines)
+
+        with _sketch_cache_lock:
+            _sketch_cache[self.path] = (version, days, len(lines))
+        return days
+
+    def needs_compaction(self):
+        """Whether the log holds many more lines than days"""
+        with _sketch_cache_lock:
+            cached = _sketch_cache.get(self.path)
+        return cached is not None and cached[2] > len(cached[1]) + COMPACT_SLACK
+
+    def compact(self):
+        """Rewrite the log as one line per day"""
+        self._write(self.load())
+
+    def query(self, start_date=None, end_date=None):
+        """One sketch covering whole days in range"""
+        start = pd.Timestamp(start_date).strftime('%Y-%m-%d') if start_date is not None else None
+        end = pd.Timestamp(end_date).strftime('%Y-%m-%d') if end_date is not None else None
+        return DaySketch.combine(
+            sketch for day, sketch in self.load().items()
+            if (start is None or day >= start) and (end is None or day <= end)
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+    from utils.data_manager import DataManager
+
+    parser = argparse.ArgumentParser(description="Maintain the QRMS daily top-K and distinct-count sketches")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--storage", help="Storage backend, defaults to QRMS_STORAGE")
+    args = parser.parse_args()
+
+    try:
+        days = DataManager(storage=args.storage).rebuild_sketches()
+    except RuntimeError as e:
+        print(str(e))
+        raise SystemExit(1)
+    print(f"Rebuilt sketches for {days} days")
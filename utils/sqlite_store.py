@@ -0,0 +1,425 @@
+import os
+import sqlite3
+import argparse
+from contextlib import closing
+
+import pandas as pd
+
+from utils.text_index import tokenize
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+REJECTION_FIELDS = ['date', 'module', 'rejection_type', 'quantity', 'reason', 'operator', 'shift']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rejections (
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    module TEXT,
+    rejection_type TEXT,
+    quantity INTEGER,
+    reason TEXT,
+    operator TEXT,
+    shift TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_rejections_date ON rejections(date);
+CREATE INDEX IF NOT EXISTS idx_rejections_module_date ON rejections(module, date);
+CREATE INDEX IF NOT EXISTS idx_rejections_type_date ON rejections(rejection_type, date);
+CREATE INDEX IF NOT EXISTS idx_rejections_operator_date ON rejections(operator, date);
+CREATE INDEX IF NOT EXISTS idx_rejections_shift_date ON rejections(shift, date);
+
+-- Rows moved to the cold archive, kept so record lookups and reason search still find them by ID
+CREATE TABLE IF NOT EXISTS archived_rejections (
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    module TEXT,
+    rejection_type TEXT,
+    quantity INTEGER,
+    reason TEXT,
+    operator TEXT,
+    shift TEXT
+);
+
+CREATE TABLE IF NOT EXISTS modules (
+    name TEXT PRIMARY KEY,
+    description TEXT,
+    business_unit TEXT,
+    created_date TEXT
+);
+
+CREATE TABLE IF NOT EXISTS rejection_types (
+    name TEXT PRIMARY KEY,
+    description TEXT,
+    mapped_modules TEXT,
+    created_date TEXT
+);
+
+-- Bumped by every catalog change, so catalog caches ignore rejection writes
+CREATE TABLE IF NOT EXISTS catalog_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0);
+"""
+
+CATALOG_VERSION_TRIGGERS = "".join(
+    f"""
+CREATE TRIGGER IF NOT EXISTS {table}_version_{event} AFTER {event.upper()} ON {table} BEGIN
+    UPDATE catalog_version SET version = version + 1;
+END;"""
+    for table in ('modules', 'rejection_types') for event in ('insert', 'update', 'delete')
+)
+
+# Full-text index over reasons, kept in step with the rejections table by triggers
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE rejections_fts USING fts5(reason, content='rejections', content_rowid='id');
+CREATE TRIGGER rejections_fts_insert AFTER INSERT ON rejections BEGIN
+    INSERT INTO rejections_fts(rowid, reason) VALUES (new.id, new.reason);
+END;
+CREATE TRIGGER rejections_fts_delete AFTER DELETE ON rejections BEGIN
+    INSERT INTO rejections_fts(rejections_fts, rowid, reason) VALUES ('delete', old.id, old.reason);
+END;
+INSERT INTO rejections_fts(rejections_fts) VALUES ('rebuild');
+"""
+
+
+# Hot and archived rows together, for lookups that cover every record like the file backends' record index
+ALL_REJECTIONS = (
+    f"(SELECT id, {', '.join(REJECTION_FIELDS)} FROM rejections "
+    f"UNION ALL SELECT id, {', '.join(REJECTION_FIELDS)} FROM archived_rejections)"
+)
+
+
+def _format_date(value):
+    """Format a date bound the way dates are stored (sortable text)"""
+    return pd.Timestamp(value).strftime(DATE_FORMAT)
+
+
+class SqliteStore:
+    """Rejections, modules and rejection types in one SQLite database (WAL mode)"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA + CATALOG_VERSION_TRIGGERS)
+            self.has_fts = self._ensure_fts(conn)
+
+    def _ensure_fts(self, conn):
+        """Create and fill the reason full-text index once; False if SQLite lacks FTS5"""
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'rejections_fts'").fetchone():
+            return True
+        try:
+            # One transaction, so a concurrent opener never sees a half-built index
+            conn.executescript("BEGIN IMMEDIATE;" + FTS_SCHEMA + "COMMIT;")
+            return True
+        except sqlite3.OperationalError as e:
+            if conn.in_transaction:
+                conn.rollback()
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'rejections_fts'").fetchone():
+                return True
+            print(f"Reason search will scan rows, full-text index unavailable: {str(e)}")
+            return False
+
+    def _connect(self):
+        """Open a connection; one per operation so Streamlit threads never share one"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _where(self, start_date=None, end_date=None, module=None, rejection_type=None, shift=None, operator=None):
+        """Build an indexed WHERE clause and its parameters; column filters take a value or a list of values"""
+        clauses = []
+        params = []
+        for column, value in (('module', module), ('rejection_type', rejection_type), ('shift', shift), ('operator', operator)):
+            if value is None:
+                continue
+            values = [value] if isinstance(value, str) else list(value)
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        if start_date is not None:
+            clauses.append("date >= ?")
+            params.append(_format_date(start_date))
+        if end_date is not None:
+            clauses.append("date <= ?")
+            params.append(_format_date(end_date))
+        where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+        return where, params
+
+    # Rejections
+
+    def append(self, records):
+        """Insert rejection records in one transaction; callers hold the store lock"""
+        with closing(self._connect()) as conn, conn:
+            # IDs continue after archived rows too, so an ID never names two records
+            last_id = conn.execute(
+                "SELECT MAX(id) FROM (SELECT MAX(id) AS id FROM rejections UNION ALL SELECT MAX(id) FROM archived_rejections)"
+            ).fetchone()[0] or 0
+            rows = [(last_id + offset + 1,) + tuple(record[field] for field in REJECTION_FIELDS) for offset, record in enumerate(records)]
+            conn.executemany(
+                "INSERT INTO rejections (id, date, module, rejection_type, quantity, reason, operator, shift) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def load(self, start_date=None, end_date=None, module=None, rejection_type=None):
+        """Load rejection rows matching the filters"""
+        where, params = self._where(start_date, end_date, module, rejection_type)
+        with closing(self._connect()) as conn:
+            df = pd.read_sql_query(
+                f"SELECT {', '.join(REJECTION_FIELDS)} FROM rejections{where} ORDER BY id",
+                conn,
+                params=params
+            )
+        df['date'] = pd.to_datetime(df['date'], format=DATE_FORMAT)
+        return df
+
+    def iter_chunks(self, start_date=None, end_date=None, module=None, rejection_type=None, chunksize=50000):
+        """Yield rejection rows matching the filters in chunks of at most chunksize rows"""
+        where, params = self._where(start_date, end_date, module, rejection_type)
+        with closing(self._connect()) as conn:
+            for df in pd.read_sql_query(
+                f"SELECT {', '.join(REJECTION_FIELDS)} FROM rejections{where} ORDER BY id",
+                conn,
+                params=params,
+                chunksize=chunksize
+            ):
+                df['date'] = pd.to_datetime(df['date'], format=DATE_FORMAT)
+                yield df
+
+    def find(self, filters):
+        """Rejection rows matching normalized filters with their IDs, in ID order, archived rows included"""
+        where, params = self._where(**filters)
+        return self._select_with_ids(where, params)
+
+    def search_reasons(self, query, filters, limit=50):
+        """Full-text reason search; returns the same result as RecordIndex.search_reasons"""
+        where, params = self._where(**filters)
+        terms = tokenize(query)
+        if not terms:
+            hot_clause, hot_params = "0", []
+            cold_clause, cold_params = "0", []
+        else:
+            # Archived rows are not in the full-text index and are scanned
+            cold_clause = " AND ".join(["lower(reason) LIKE ?"] * len(terms))
+            cold_params = [f"%{term}%" for term in terms]
+            if self.has_fts:
+                # Every word, each matched as a word prefix
+                hot_clause = "id IN (SELECT rowid FROM rejections_fts WHERE rejections_fts MATCH ?)"
+                hot_params = [" ".join(f'"{term}"*' for term in terms)]
+            else:
+                hot_clause, hot_params = cold_clause, cold_params
+        prefix = where + " AND " if where else " WHERE "
+        fields = ', '.join(REJECTION_FIELDS)
+        matching = (
+            f"SELECT id, {fields} FROM rejections{prefix}{hot_clause} "
+            f"UNION ALL SELECT id, {fields} FROM archived_rejections{prefix}{cold_clause}"
+        )
+        params = params + hot_params + params + cold_params
+
+        with closing(self._connect()) as conn:
+            by_reason = pd.read_sql_query(
+                f"SELECT reason, COUNT(*) AS count, COALESCE(SUM(quantity), 0) AS quantity FROM ({matching}) "
+                "GROUP BY reason ORDER BY count DESC, quantity DESC",
+                conn,
+                params=params
+            )
+            records = pd.read_sql_query(
+                f"SELECT * FROM ({matching}) ORDER BY date DESC, id DESC LIMIT ?",
+                conn,
+                params=params + [limit]
+            )
+        records['date'] = pd.to_datetime(records['date'], format=DATE_FORMAT)
+        return {
+            'matches': int(by_reason['count'].sum()),
+            'quantity': int(by_reason['quantity'].sum()),
+            'by_reason': by_reason,
+            'records': records
+        }
+
+    def get(self, record_ids):
+        """Rejection rows with these IDs, archived rows included"""
+        record_ids = [int(record_id) for record_id in record_ids]
+        if not record_ids:
+            return self._select_with_ids(" WHERE 0", [])
+        return self._select_with_ids(f" WHERE id IN ({', '.join('?' * len(record_ids))})", record_ids)
+
+    def _select_with_ids(self, where, params):
+        with closing(self._connect()) as conn:
+            df = pd.read_sql_query(
+                f"SELECT id, {', '.join(REJECTION_FIELDS)} FROM {ALL_REJECTIONS}{where} ORDER BY id",
+                conn,
+                params=params
+            )
+        df['date'] = pd.to_datetime(df['date'], format=DATE_FORMAT)
+        return df
+
+    def archive_before(self, cutoff, archive_rows):
+        """Hand rows dated before cutoff to archive_rows, then move them to the archived_rejections table"""
+        cutoff = _format_date(cutoff)
+        with closing(self._connect()) as conn:
+            df = pd.read_sql_query(
+                f"SELECT {', '.join(REJECTION_FIELDS)} FROM rejections WHERE date < ? ORDER BY id",
+                conn,
+                params=[cutoff]
+            )
+            if df.empty:
+                return 0
+            df['date'] = pd.to_datetime(df['date'], format=DATE_FORMAT)
+            archive_rows(df)
+            with conn:
+                conn.execute("INSERT INTO archived_rejections SELECT * FROM rejections WHERE date < ?", [cutoff])
+                conn.execute("DELETE FROM rejections WHERE date < ?", [cutoff])
+        return len(df)
+
+    def aggregate(self, filters, spec):
+        """Run one normalized query spec (see utils.query) in SQL"""
+        where, params = self._where(**filters)
+        if 'latest' in spec:
+            with closing(self._connect()) as conn:
+                df = pd.read_sql_query(
+                    f"SELECT {', '.join(REJECTION_FIELDS)} FROM rejections{where} ORDER BY date DESC, id DESC LIMIT ?",
+                    conn,
+                    params=params + [spec['latest']]
+                )
+            df['date'] = pd.to_datetime(df['date'], format=DATE_FORMAT)
+            return df
+
+        # Identifiers come from the fixed vocabulary checked by utils.query
+        expressions = {'day': "substr(date, 1, 10)"}
+        group_by = list(spec['group_by'])
+        select = [f"{expressions.get(column, column)} AS {column}" for column in group_by]
+        for metric in spec['metrics']:
+            if metric == 'quantity':
+                select.append("COALESCE(SUM(quantity), 0) AS quantity")
+            elif metric == 'count':
+                select.append("COUNT(*) AS count")
+            else:
+                column = metric[len('unique:'):]
+                select.append(f"COUNT(DISTINCT {expressions.get(column, column)}) AS \"{metric}\"")
+
+        sql = f"SELECT {', '.join(select)} FROM rejections{where}"
+        if group_by:
+            sql += f" GROUP BY {', '.join(group_by)}"
+            if spec['order'] == 'group':
+                sql += f" ORDER BY {', '.join(group_by)}"
+            else:
+                sql += f" ORDER BY \"{spec['metrics'][0]}\" DESC"
+            if spec['top_n'] is not None:
+                sql += " LIMIT ?"
+                params = params + [spec['top_n']]
+        with closing(self._connect()) as conn:
+            df = pd.read_sql_query(sql, conn, params=params)
+        if 'day' in df.columns:
+            df['day'] = pd.to_datetime(df['day'])
+        return df
+
+    # Catalog
+
+    def catalog_version(self):
+        """Counter that triggers bump on every module or rejection type change"""
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT version FROM catalog_version").fetchone()[0]
+
+    def load_modules(self):
+        """Load modules ordered by creation"""
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(
+                "SELECT name, description, business_unit, created_date FROM modules ORDER BY rowid", conn
+            )
+
+    def load_rejection_types(self):
+        """Load rejection types ordered by creation"""
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(
+                "SELECT name, description, mapped_modules, created_date FROM rejection_types ORDER BY rowid", conn
+            )
+
+    def add_module(self, module):
+        """Insert a module; returns False if the name already exists"""
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO modules (name, description, business_unit, created_date) VALUES (?, ?, ?, ?)",
+                (module['name'], module.get('description'), module.get('business_unit'), module.get('created_date'))
+            )
+            return cursor.rowcount == 1
+
+    def add_rejection_type(self, rejection_type):
+        """Insert a rejection type; returns False if the name already exists"""
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO rejection_types (name, description, mapped_modules, created_date) "
+                "VALUES (?, ?, ?, ?)",
+                (rejection_type['name'], rejection_type.get('description'),
+                 rejection_type.get('mapped_modules'), rejection_type.get('created_date'))
+            )
+            return cursor.rowcount == 1
+
+    def delete_module(self, name):
+        """Delete a module; returns False if it did not exist"""
+        with closing(self._connect()) as conn, conn:
+            return conn.execute("DELETE FROM modules WHERE name = ?", (name,)).rowcount == 1
+
+    def delete_rejection_type(self, name):
+        """Delete a rejection type; returns False if it did not exist"""
+        with closing(self._connect()) as conn, conn:
+            return conn.execute("DELETE FROM rejection_types WHERE name = ?", (name,)).rowcount == 1
+
+    # Migration
+
+    def migrate_from_csv(self, rejections_file, types_file, modules_file, chunksize=100000, force=False):
+        """One-shot copy of the CSV files into the database"""
+        with closing(self._connect()) as conn:
+            existing = conn.execute("SELECT COUNT(*) FROM rejections").fetchone()[0]
+        if existing and not force:
+            raise RuntimeError("Database already contains rejections; pass force=True to append anyway")
+
+        migrated = {'rejections': 0, 'modules': 0, 'rejection_types': 0}
+
+        if os.path.exists(modules_file):
+            for module in self._read_csv(modules_file).to_dict('records'):
+                migrated['modules'] += self.add_module(module)
+
+        if os.path.exists(types_file):
+            for rejection_type in self._read_csv(types_file).to_dict('records'):
+                migrated['rejection_types'] += self.add_rejection_type(rejection_type)
+
+        if os.path.exists(rejections_file):
+            try:
+                for chunk in pd.read_csv(rejections_file, chunksize=chunksize, dtype=str, keep_default_na=False):
+                    chunk['date'] = pd.to_datetime(chunk['date']).dt.strftime(DATE_FORMAT)
+                    chunk['quantity'] = pd.to_numeric(chunk['quantity']).astype(int)
+                    self.append(chunk.to_dict('records'))
+                    migrated['rejections'] += len(chunk)
+            except pd.errors.EmptyDataError:
+                pass
+
+        return migrated
+
+    def _read_csv(self, path):
+        """Read a catalog CSV with missing values as None"""
+        try:
+            df = pd.read_csv(path, dtype=str, keep_default_na=False)
+        except pd.errors.EmptyDataError:
+            return pd.DataFrame()
+        return df.replace({'': None})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate QRMS CSV data into SQLite")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--db", default=None, help="Database path (default: <data-dir>/qrms.db)")
+    parser.add_argument("--force", action="store_true", help="Append even if the database has rejections")
+    args = parser.parse_args()
+
+    store = SqliteStore(args.db or os.path.join(args.data_dir, "qrms.db"))
+    counts = store.migrate_from_csv(
+        os.path.join(args.data_dir, "rejections.csv"),
+        os.path.join(args.data_dir, "rejection_types.csv"),
+        os.path.join(args.data_dir, "modules.csv"),
+        force=args.force
+    )
+    print(f"Migrated {counts['rejections']} rejections, {counts['modules']} modules "
+          f"and {counts['rejection_types']} rejection types")
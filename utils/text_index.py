@@ -0,0 +1,63 @@
+import re
+import bisect
+
+import numpy as np
+
+# Words are runs of letters and digits; matching ignores case
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+
+def tokenize(text):
+    """Lowercase words of a text"""
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+class TokenIndex:
+    """Inverted index from words to the codes of the texts that contain them.
+
+    Texts are added once each under a code (e.g. a dictionary code of
+    distinct reasons), so a reason entered a thousand times is tokenized
+    once. Codes must be added in ascending order.
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self._arrays = {}
+        self._vocabulary = None
+
+    def add(self, code, text):
+        for token in set(tokenize(text)):
+            if token not in self.postings:
+                self.postings[token] = []
+                self._vocabulary = None
+            self.postings[token].append(code)
+            self._arrays.pop(token, None)
+
+    def _codes(self, token):
+        if token not in self._arrays:
+            self._arrays[token] = np.array(self.postings[token], dtype=np.int64)
+        return self._arrays[token]
+
+    def prefix_codes(self, term):
+        """Codes of texts with a word starting with term"""
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        start = bisect.bisect_left(self._vocabulary, term)
+        end = bisect.bisect_left(self._vocabulary, term + "\U0010ffff")
+        tokens = self._vocabulary[start:end]
+        if len(tokens) == 1:
+            return self._codes(tokens[0])
+        if not tokens:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate([self._codes(token) for token in tokens]))
+
+    def search(self, query):
+        """Codes of texts containing every word of query, each as a word prefix"""
+        codes = None
+        # Rarest-looking terms first keeps the intersections small
+        for term in sorted(set(tokenize(query)), key=len, reverse=True):
+            term_codes = self.prefix_codes(term)
+            codes = term_codes if codes is None else np.intersect1d(codes, term_codes, assume_unique=True)
+            if not len(codes):
+                break
+        return codes if codes is not None else np.empty(0, dtype=np.int64)
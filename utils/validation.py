@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+from utils.rejection_csv import DATE_FORMAT
+
+# Fields every stored rejection record must fill in
+REQUIRED_FIELDS = ('module', 'rejection_type', 'operator', 'shift')
+
+
+def _text(df, field):
+    """A column as stripped strings, '' where missing"""
+    if field not in df.columns:
+        return pd.Series('', index=df.index, dtype=object)
+    return df[field].fillna('').astype(str).str.strip()
+
+
+def canonical_dates(dates):
+    """Date values as strings in the store's DATE_FORMAT; None where missing or not ISO 8601.
+
+    Validation accepts any ISO 8601 form, e.g. '2026-01-05T12:00:00' or
+    '2026-01-06', but only DATE_FORMAT is stored and read back.
+    """
+    given = dates.notna() & (dates.astype(str).str.strip() != '')
+    dates = dates.where(given)
+    try:
+        formatted = pd.to_datetime(dates, errors='coerce', format='ISO8601').dt.strftime(DATE_FORMAT)
+    except ValueError:
+        # Mixed UTC offsets; each value keeps its own wall-clock time
+        formatted = dates.map(_canonical_date)
+    return formatted.astype(object).where(formatted.notna(), None)
+
+
+def _canonical_date(value):
+    """One date value in DATE_FORMAT, or None"""
+    parsed = pd.to_datetime(value, errors='coerce', format='ISO8601')
+    return None if pd.isna(parsed) else parsed.strftime(DATE_FORMAT)
+
+
+def rejection_errors(df, mapping=None, required=REQUIRED_FIELDS):
+    """Validate rejection rows in one vectorized pass.
+
+    Returns one message per row of df, '' for valid rows. Rows are checked for
+    required fields, a positive whole quantity, an ISO 8601 date when one is
+    given and, with a ModuleTypeMapping, the module/rejection type pairing;
+    each row reports the first check it fails.
+    """
+    errors = pd.Series('', index=df.index, dtype=object)
+    if df.empty:
+        return errors
+
+    # Missing fields are listed together, e.g. "missing reason, operator"
+    missing = pd.Series('', index=df.index, dtype=object)
+    for field in required:
+        missing += np.where(_text(df, field) == '', field + ', ', '')
+    has_missing = missing != ''
+    errors[has_missing] = 'missing ' + missing[has_missing].str[:-2]
+
+    quantity = df['quantity'] if 'quantity' in df.columns else pd.Series(np.nan, index=df.index)
+    quantity = pd.to_numeric(quantity, errors='coerce')
+    bad_quantity = (errors == '') & (quantity.isna() | (quantity <= 0) | (quantity % 1 != 0))
+    errors[bad_quantity] = 'quantity must be a positive whole number'
+
+    if 'date' in df.columns:
+        given = _text(df, 'date') != ''
+        errors[(errors == '') & given & canonical_dates(df['date']).isna()] = 'date must be an ISO 8601 timestamp'
+
+    if mapping is not None:
+        modules = df['module'].astype(str)
+        types = df['rejection_type'].astype(str)
+        invalid = (errors == '') & ~mapping.valid_mask(modules, types)
+        if invalid.any():
+            modules, types = modules[invalid], types[invalid]
+            available = mapping.available_types(modules)
+            messages = "'" + types + "' is not valid for module '" + modules + "'. Available types: " + available
+            errors[invalid] = messages.where(available != '', "No rejection types configured for module '" + modules + "'")
+
+    return errors
@@ -0,0 +1,120 @@
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from utils.data_manager import DataManager
+from utils.shards import ShardSet
+
+# Set QRMS_WARMUP=0 to skip preloading at startup
+WARMUP_ENABLED = os.getenv("QRMS_WARMUP", "1") != "0"
+
+# Days shown by the dashboard before the user picks a range
+DEFAULT_DASHBOARD_DAYS = 30
+
+
+def default_dashboard_range():
+    """Start and end date of the dashboard's default range"""
+    today = datetime.now().date()
+    return today - timedelta(days=DEFAULT_DASHBOARD_DAYS), today
+
+
+def dashboard_filters(start_date, end_date, module=None, rejection_type=None):
+    """Query filters for whole days from the start of start_date to the end of end_date"""
+    return {
+        'start_date': pd.to_datetime(start_date),
+        'end_date': pd.to_datetime(end_date) + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1),
+        'module': module,
+        'rejection_type': rejection_type
+    }
+
+
+def dashboard_aggregations(by_plant=False):
+    """Aggregations behind the dashboard; shared with the warm-up so both hit the same memo entries"""
+    aggregations = {
+        # Distinct operators and top reasons are estimated from the daily sketches
+        'totals': {'metrics': ['count', 'quantity', 'unique:module', 'unique:rejection_type', 'unique:operator'], 'approx': True},
+        'daily': {'group_by': 'day', 'metrics': ['quantity'], 'order': 'group'},
+        'by_type': {'group_by': 'rejection_type', 'metrics': ['quantity']},
+        'by_module': {'group_by': 'module', 'metrics': ['quantity']},
+        'top_reasons': {'group_by': 'reason', 'metrics': ['quantity'], 'top_n': 10, 'approx': True},
+        'recent': {'latest': 10}
+    }
+    if by_plant:
+        aggregations['by_plant'] = {'group_by': 'plant', 'metrics': ['quantity', 'count']}
+    return aggregations
+
+
+class CacheWarmer:
+    """Background thread that fills the process-wide caches before the first dashboard visit"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.is_running = False
+
+    def warm(self):
+        """Load the rejections frame, the catalog and the default dashboard aggregates"""
+        started = time.time()
+        filters = dashboard_filters(*default_dashboard_range())
+
+        data_manager = DataManager()
+        data_manager.get_catalog()
+        if data_manager.sqlite_store is None:
+            # File backends keep the parsed hot frame cached for every page
+            data_manager.load_rejections(include_archive=False)
+        if data_manager.rollup is not None:
+            # Building or compacting the rollup changes the query version, so settle it first
+            data_manager.get_rollup()
+            data_manager.get_sketches()
+        data_manager.query_many(filters, dashboard_aggregations())
+
+        # With several plants the dashboard opens on the consolidated view
+        shard_set = ShardSet()
+        if shard_set.names:
+            shard_set.module_names()
+            shard_set.type_names()
+            shard_set.query_many(filters, dashboard_aggregations(by_plant=True))
+
+        print(f"Cache warm-up finished in {time.time() - started:.1f}s")
+
+    def run(self):
+        self.is_running = True
+        try:
+            self.warm()
+        except Exception as e:
+            print(f"Cache warm-up error: {str(e)}")
+        finally:
+            self.is_running = False
+            self.done.set()
+
+    def start(self):
+        if not self.is_running and not self.done.is_set():
+            threading.Thread(target=self.run, daemon=True).start()
+            print("Cache warm-up started")
+
+    def wait(self, timeout=None):
+        """Block until the warm-up has finished; returns False on timeout"""
+        return self.done.wait(timeout)
+
+
+# Global warmer instance
+_warmer = None
+_warmer_lock = threading.Lock()
+
+def start_warmup():
+    """Start warming the caches once per process"""
+    global _warmer
+    if not WARMUP_ENABLED:
+        return None
+    with _warmer_lock:
+        if _warmer is None:
+            _warmer = CacheWarmer()
+            _warmer.start()
+    return _warmer
+
+def wait_for_warmup(timeout=None):
+    """Wait for a running warm-up rather than repeating its work; no-op when none was started"""
+    if _warmer is not None:
+        _warmer.wait(timeout)